@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Adaptive inference-rate controller for Traffic Congestion Detection
+Watches inference latency and SoC temperature and trades frame stride, input
+size and confidence cutoff to hold a target FPS instead of letting it collapse
+when the Pi throttles
+"""
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THERMAL_PATH = "/sys/class/thermal/thermal_zone0/temp"
+
+
+def read_soc_temperature(thermal_path=DEFAULT_THERMAL_PATH):
+    """SoC temperature in °C, or None if it can't be read"""
+    try:
+        with open(thermal_path) as f:
+            return int(f.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return None
+
+
+class AdaptiveInferenceController:
+    def __init__(self, target_fps=10.0, latency_budget=None, image_sizes=(640, 512, 416, 320),
+                 max_stride=4, base_confidence=0.5, max_confidence=0.65, confidence_step=0.05,
+                 temp_soft_limit=75.0, temp_hard_limit=82.0, thermal_path=DEFAULT_THERMAL_PATH,
+                 adjust_interval=2.0, smoothing=0.2):
+        """
+        Initialize the controller
+
+        Args:
+            target_fps: Inference rate to hold
+            latency_budget: Seconds allowed per inference (defaults to 1 / target_fps)
+            image_sizes: Inference sizes to choose from, largest (most accurate) first
+            max_stride: Largest frame stride (run the model on every Nth frame)
+            base_confidence: Normal confidence cutoff
+            max_confidence: Highest cutoff used under pressure (fewer boxes to post-process)
+            confidence_step: Cutoff change per adjustment
+            temp_soft_limit: °C above which the controller stops stepping quality back up
+            temp_hard_limit: °C above which the controller degrades regardless of latency
+            thermal_path: sysfs file with the SoC temperature in millidegrees (stubbable)
+            adjust_interval: Minimum seconds between adjustments
+            smoothing: EMA factor for the measured latency
+        """
+        self.target_fps = target_fps
+        self.latency_budget = latency_budget or 1.0 / target_fps
+        self.image_sizes = list(image_sizes)
+        self.max_stride = max_stride
+        self.base_confidence = base_confidence
+        self.max_confidence = max_confidence
+        self.confidence_step = confidence_step
+        self.temp_soft_limit = temp_soft_limit
+        self.temp_hard_limit = temp_hard_limit
+        self.thermal_path = thermal_path
+        self.adjust_interval = adjust_interval
+        self.smoothing = smoothing
+
+        # Current operating point
+        self.size_index = 0
+        self.stride = 1
+        self.confidence = base_confidence
+
+        self.latency_ema = None
+        self.temperature = None
+        self.frame_index = 0
+        self.last_adjustment = time.time()
+        self.decisions = []  # Most recent adjustments, newest last
+        self.max_decisions = 50
+
+    @property
+    def image_size(self):
+        return self.image_sizes[self.size_index]
+
+    def should_infer(self):
+        """Call once per captured frame; False means reuse the previous result"""
+        run = self.frame_index % self.stride == 0
+        self.frame_index += 1
+        return run
+
+    def record_inference(self, latency, now=None):
+        """Feed one measured inference latency (seconds) and adjust if due"""
+        if self.latency_ema is None:
+            self.latency_ema = latency
+        else:
+            self.latency_ema += self.smoothing * (latency - self.latency_ema)
+
+        now = time.time() if now is None else now
+        if now - self.last_adjustment >= self.adjust_interval:
+            self.last_adjustment = now
+            self.temperature = read_soc_temperature(self.thermal_path)
+            self.adjust(now)
+
+    def adjust(self, now):
+        """Move one step along the quality ladder towards the budget"""
+        hot = self.temperature is not None and self.temperature >= self.temp_hard_limit
+        warm = self.temperature is not None and self.temperature >= self.temp_soft_limit
+        # Effective per-frame cost, since only every stride-th frame is inferred
+        over_budget = self.latency_ema / self.stride > self.latency_budget
+        headroom = self.latency_ema / self.stride < 0.7 * self.latency_budget
+
+        if over_budget or hot:
+            self._degrade(now, "hot" if hot else "over budget")
+        elif headroom and not warm:
+            self._improve(now)
+
+    def _degrade(self, now, reason):
+        # Cheapest quality loss first: smaller input, then higher cutoff, then skip frames
+        if self.size_index < len(self.image_sizes) - 1:
+            self.size_index += 1
+            self._record(now, reason, f"image size -> {self.image_size}")
+        elif self.confidence + self.confidence_step <= self.max_confidence + 1e-9:
+            self.confidence = round(self.confidence + self.confidence_step, 3)
+            self._record(now, reason, f"confidence -> {self.confidence:.2f}")
+        elif self.stride < self.max_stride:
+            self.stride += 1
+            self._record(now, reason, f"stride -> {self.stride}")
+
+    def _improve(self, now):
+        # Undo in reverse order: stop skipping frames first, image size last
+        if self.stride > 1:
+            self.stride -= 1
+            self._record(now, "headroom", f"stride -> {self.stride}")
+        elif self.confidence - self.confidence_step >= self.base_confidence - 1e-9:
+            self.confidence = round(self.confidence - self.confidence_step, 3)
+            self._record(now, "headroom", f"confidence -> {self.confidence:.2f}")
+        elif self.size_index > 0:
+            self.size_index -= 1
+            self._record(now, "headroom", f"image size -> {self.image_size}")
+
+    def _record(self, now, reason, change):
+        decision = {
+            "time": now,
+            "reason": reason,
+            "change": change,
+            "latency_ms": round(self.latency_ema * 1000, 1),
+            "temperature": self.temperature,
+        }
+        self.decisions.append(decision)
+        del self.decisions[:-self.max_decisions]
+        temp = f"{self.temperature:.1f}°C" if self.temperature is not None else "n/a"
+        logger.info("⚙️ Inference controller (%s): %s | latency %sms | temp %s", reason, change, decision['latency_ms'], temp)
+
+    def get_state(self):
+        """Current operating point and measurements"""
+        return {
+            "image_size": self.image_size,
+            "stride": self.stride,
+            "confidence": self.confidence,
+            "latency_ms": round(self.latency_ema * 1000, 1) if self.latency_ema is not None else None,
+            "latency_budget_ms": round(self.latency_budget * 1000, 1),
+            "temperature": self.temperature,
+            "decisions": list(self.decisions[-5:]),
+        }
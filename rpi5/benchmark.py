@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Offline replay benchmark for Traffic Congestion Detection
+Replays recorded video files or image directories through the real detection
+path (process_frame -> analyze_congestion -> format_traffic_data -> Firebase
+write) with Firebase replaced by a local stub server, and writes per-stage
+latency percentiles, overall FPS and peak RSS to a JSON file that can be
+diffed across releases
+
+Usage:
+    python benchmark.py recordings/junction.mp4 frames_dir/ --output bench.json
+    python benchmark.py recordings/junction.mp4 --backend onnx --max-frames 500
+"""
+
+import argparse
+import glob
+import http.server
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import cv2
+
+import traffic_detector
+from firebase_integration import FirebaseIntegration, WRITE_MODE_PATCH
+from logging_setup import setup_logging
+from profiling import PROFILER
+
+STAGES = ("decode", "inference", "postprocess", "annotate", "serialize", "upload")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def latency_summary(values):
+    """Mean and nearest-rank p50/p95/p99/max of a list of seconds, in milliseconds"""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def percentile(p):
+        return ordered[min(max(math.ceil(p / 100 * len(ordered)) - 1, 0), len(ordered) - 1)] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered) * 1000,
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "max": ordered[-1] * 1000,
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class StubFirebaseServer:
+    """Local HTTP server that accepts Firebase REST writes and answers like the real database"""
+
+    def __init__(self, latency=0.0):
+        """
+        Start the stub server
+
+        Args:
+            latency: Seconds to wait before answering each request, to mimic a real network
+        """
+        stub = self
+        self.latency = latency
+        self.requests = 0
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like Firebase
+            disable_nagle_algorithm = True  # Headers and body go out as separate writes
+
+            def _write(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with stub.lock:
+                    stub.requests += 1
+                    stub.bytes_received += len(body)
+                if stub.latency:
+                    time.sleep(stub.latency)
+                reply = body if self.command in ("PUT", "PATCH") else b'{"name":"-stub"}'
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            do_PUT = do_PATCH = do_POST = _write
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "4")
+                self.end_headers()
+                self.wfile.write(b"null")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, name="firebase-stub", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def iter_frames(source):
+    """Yield (decode_seconds, frame) for every frame of a video file or image directory"""
+    if os.path.isdir(source):
+        paths = sorted(
+            path for path in glob.glob(os.path.join(source, "*"))
+            if path.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        for path in paths:
+            start = time.perf_counter()
+            frame = cv2.imread(path)
+            elapsed = time.perf_counter() - start
+            if frame is not None:
+                yield elapsed, frame
+        return
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise IOError(f"Could not open {source}")
+    try:
+        while True:
+            start = time.perf_counter()
+            ret, frame = cap.read()
+            elapsed = time.perf_counter() - start
+            if not ret:
+                break
+            yield elapsed, frame
+    finally:
+        cap.release()
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class ReplayBenchmark:
+    def __init__(self, sources, backend=traffic_detector.INFERENCE_BACKEND, write_mode=traffic_detector.FIREBASE_WRITE_MODE,
+                 annotate=True, adaptive=False, motion_gating=False, stub_latency=0.0, max_frames=None, warmup=5,
+                 profile=None):
+        """
+        Initialize the benchmark
+
+        Args:
+            sources: Video files and/or directories of images, replayed in order
+            backend: Inference backend to benchmark
+            write_mode: Firebase write mode ("put" or "patch")
+            annotate: Include the annotation stage (what the display path costs)
+            adaptive: Let the adaptive controller change image size / stride during the run
+            motion_gating: Skip inference on static frames, as in production
+            stub_latency: Simulated Firebase round-trip in seconds
+            max_frames: Stop after this many measured frames
+            warmup: Frames run before measuring starts (model and runtime warm-up)
+            profile: Record a span trace of this many measured frames
+        """
+        self.sources = sources
+        self.backend = backend
+        self.write_mode = write_mode
+        self.annotate = annotate
+        self.adaptive = adaptive
+        self.motion_gating = motion_gating
+        self.max_frames = max_frames
+        self.warmup = warmup
+        self.profile = profile
+
+        self.stub = StubFirebaseServer(stub_latency)
+        self.detector = traffic_detector.TrafficDetector(
+            headless=True, control_socket_path=None, adaptive=adaptive, enable_firebase=False, backend=backend
+        )
+        self.detector.motion_gate = None
+        if motion_gating:
+            self.detector.motion_gate = traffic_detector.MotionGate(
+                changed_fraction=traffic_detector.MOTION_CHANGED_FRACTION,
+                max_interval=traffic_detector.MOTION_MAX_INTERVAL
+            )
+        # Synchronous writes so the upload stage is measured on the frame that caused it
+        self.firebase = FirebaseIntegration(
+            self.stub.url, async_uploads=False, write_mode=write_mode, location_id=self.detector.location_id
+        )
+        self.timings = {stage: [] for stage in STAGES}
+        self.frame_times = []
+        self.frames = 0
+        self.inferences = 0
+        self.payload_bytes = 0
+        self.span_times = {}
+        PROFILER.listener = self.record_span
+
+    def record_span(self, name, seconds):
+        """PROFILER listener: total time per span name for the frame being run"""
+        self.span_times[name] = self.span_times.get(name, 0.0) + seconds
+
+    def run_frame(self, decode_time, frame, record=True):
+        """Run one frame through every stage, timing each"""
+        detector = self.detector
+        timings = {"decode": decode_time}
+        frame_start = time.perf_counter()
+
+        # Inference and post-process: the detector's own infer() path (motion gate, stride,
+        # tracker coasting and controller bookkeeping included), split using its spans
+        self.span_times = {}
+        start = time.perf_counter()
+        all_detections, detections_in_roi, congestion_status, status_color, traffic = detector.infer(frame)
+        elapsed = time.perf_counter() - start
+        timings["postprocess"] = self.span_times.get("postprocess", 0.0) + self.span_times.get("analyze", 0.0)
+        timings["inference"] = elapsed - timings["postprocess"]
+        inferred = "model" in self.span_times
+
+        if self.annotate:
+            start = time.perf_counter()
+            detector.draw_annotations(frame, all_detections, detections_in_roi, congestion_status, status_color,
+                                      traffic=traffic)
+            timings["annotate"] = time.perf_counter() - start
+
+        # Serialize: the Firebase document and its JSON body
+        start = time.perf_counter()
+        vehicle_count, tracking, zone_status = traffic
+        data = self.firebase.format_traffic_data(
+            congestion_status, vehicle_count, detections_in_roi, all_detections, tracking, zone_status
+        )
+        timestamp_key = str(int(time.time() * 1000))
+        if self.write_mode == WRITE_MODE_PATCH:
+            kind, payload = "state", {"current": data, "history": {timestamp_key: data}}
+            body = json.dumps(self.firebase.build_state_patch(payload)[0], separators=(',', ':'))
+        else:
+            kind, payload = "current", data
+            body = json.dumps(data)
+        timings["serialize"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.firebase._handle_upload(kind, payload)
+        timings["upload"] = time.perf_counter() - start
+
+        frame_time = time.perf_counter() - frame_start + decode_time
+        if record:
+            for stage, elapsed in timings.items():
+                self.timings[stage].append(elapsed)
+            self.frame_times.append(frame_time)
+            self.frames += 1
+            self.inferences += inferred
+            self.payload_bytes += len(body)
+            PROFILER.frame_done()
+
+    def run(self):
+        """Replay every source and return the report"""
+        if not self.detector.setup_model():
+            raise RuntimeError("Could not load the model")
+
+        warmup_left = self.warmup
+        wall_start = None
+        for source in self.sources:
+            print(f"Replaying {source}...")
+            for decode_time, frame in iter_frames(source):
+                if warmup_left > 0:
+                    self.run_frame(decode_time, frame, record=False)
+                    warmup_left -= 1
+                    continue
+                if wall_start is None:
+                    wall_start = time.perf_counter()
+                    if self.profile:
+                        PROFILER.start(frames=self.profile)
+                self.run_frame(decode_time, frame)
+                if self.frames % 100 == 0:
+                    print(f"  {self.frames} frames")
+                if self.max_frames and self.frames >= self.max_frames:
+                    break
+            if self.max_frames and self.frames >= self.max_frames:
+                break
+
+        wall_time = time.perf_counter() - wall_start if wall_start is not None else 0.0
+        return self.report(wall_time)
+
+    def report(self, wall_time):
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "opencv": cv2.__version__,
+                "sources": self.sources,
+                "backend": self.backend,
+                "image_size": self.detector.fixed_imgsz,
+                "write_mode": self.write_mode,
+                "annotate": self.annotate,
+                "adaptive": self.adaptive,
+                "motion_gating": self.motion_gating,
+                "warmup_frames": self.warmup,
+            },
+            "frames": self.frames,
+            "inferences": self.inferences,
+            "wall_time_s": wall_time,
+            "fps": self.frames / wall_time if wall_time else 0.0,
+            "frame_ms": latency_summary(self.frame_times),
+            "stages_ms": {stage: latency_summary(values) for stage, values in self.timings.items() if values},
+            "peak_rss_mb": peak_rss_mb(),
+            "firebase_stub": {
+                "requests": self.stub.requests,
+                "payload_bytes": self.payload_bytes,
+                "bytes_received": self.stub.bytes_received,
+                "connections": self.firebase.get_connection_stats(),
+            },
+        }
+        if self.detector.controller:
+            report["controller"] = self.detector.controller.get_state()
+        if self.detector.motion_gate:
+            report["motion_gate"] = self.detector.motion_gate.get_stats()
+        return report
+
+    def close(self):
+        PROFILER.listener = None
+        PROFILER.stop()
+        self.firebase.close()
+        self.stub.stop()
+
+
+def print_report(report):
+    print("=" * 60)
+    print(f"Frames: {report['frames']} ({report['inferences']} inferred) | FPS: {report['fps']:.1f} | "
+          f"Peak RSS: {report['peak_rss_mb']:.0f} MB")
+    print(f"{'stage':<12}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for stage, summary in list(report["stages_ms"].items()) + [("frame", report["frame_ms"])]:
+        if summary.get("count"):
+            print(f"{stage:<12}{summary['p50']:>10.2f}{summary['p95']:>10.2f}{summary['p99']:>10.2f}")
+    print("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recordings through the detection path and time each stage")
+    parser.add_argument("sources", nargs="+", help="Video files and/or directories of images")
+    parser.add_argument("--output", default="benchmark.json", help="JSON report path")
+    parser.add_argument("--backend", default=traffic_detector.INFERENCE_BACKEND, choices=list(traffic_detector.BACKENDS))
+    parser.add_argument("--imgsz", type=int, default=traffic_detector.BACKEND_IMAGE_SIZE,
+                        help="Input size for exported backends")
+    parser.add_argument("--write-mode", default=traffic_detector.FIREBASE_WRITE_MODE, choices=["put", "patch"])
+    parser.add_argument("--no-annotate", action="store_true", help="Skip the annotation stage (headless cost)")
+    parser.add_argument("--adaptive", action="store_true", help="Enable the adaptive inference controller")
+    parser.add_argument("--motion-gating", action="store_true", help="Enable the motion gate")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Simulated Firebase latency in ms")
+    parser.add_argument("--max-frames", type=int, help="Stop after this many measured frames")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured warm-up frames")
+    parser.add_argument("--profile", type=int, metavar="FRAMES",
+                        help="Also write a span trace of the first FRAMES measured frames")
+    args = parser.parse_args()
+    setup_logging(traffic_detector.LOG_LEVEL)
+
+    traffic_detector.BACKEND_IMAGE_SIZE = args.imgsz
+    PROFILER.output_dir = traffic_detector.PROFILE_DIR
+    benchmark = ReplayBenchmark(
+        args.sources,
+        backend=args.backend,
+        write_mode=args.write_mode,
+        annotate=not args.no_annotate,
+        adaptive=args.adaptive,
+        motion_gating=args.motion_gating,
+        stub_latency=args.stub_latency / 1000,
+        max_frames=args.max_frames,
+        warmup=args.warmup,
+        profile=args.profile,
+    )
+    try:
+        report = benchmark.run()
+    finally:
+        benchmark.close()
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"Report written to {args.output}")
+    return True
+
+
+if __name__ == "__main__":
+    if not main():
+        sys.exit(1)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Congestion estimator for Traffic Congestion Detection
+Turns the noisy per-frame ROI vehicle count into a steady congestion status: the
+count is smoothed with a time-based EMA, each level has separate enter and exit
+thresholds, a status is held for a minimum dwell time before it can change, and
+high-congestion alerts respect a cooldown
+"""
+
+import math
+import threading
+import time
+
+CONGESTION_STATUSES = ("No Traffic", "Light Traffic", "Moderate Congestion", "High Congestion")
+
+
+class CongestionEstimator:
+    def __init__(self, time_constant=3.0, hysteresis=1.0, min_dwell=5.0, alert_cooldown=300.0):
+        """
+        Initialize the estimator
+
+        Args:
+            time_constant: Seconds for the smoothed count to move ~63% of the way to a new count
+            hysteresis: How far below a level's enter threshold the count must fall to leave it
+            min_dwell: Seconds a status is held before it may change
+            alert_cooldown: Minimum seconds between high-congestion alerts
+        """
+        self.time_constant = time_constant
+        self.hysteresis = hysteresis
+        self.min_dwell = min_dwell
+        self.alert_cooldown = alert_cooldown
+
+        self.smoothed_count = None
+        self.level = 0
+        self.level_since = None
+        self.last_update = None
+        self.last_alert = None
+        self.alert_pending = False
+        self.transitions = 0
+        self.lock = threading.Lock()
+
+    @property
+    def status(self):
+        return CONGESTION_STATUSES[self.level]
+
+    def _target_level(self, thresholds):
+        """Level the smoothed count supports, applying the exit margin to the current level"""
+        level = self.level
+        # Step up while the count reaches the next level's enter threshold
+        while level < len(thresholds) and self.smoothed_count >= thresholds[level]:
+            level += 1
+        # Step down while the count is below the current level's exit threshold
+        while level > 0 and self.smoothed_count < thresholds[level - 1] - self.hysteresis:
+            level -= 1
+        return level
+
+    def update(self, vehicle_count, thresholds, congestion_detected=False, now=None):
+        """
+        Feed one frame's measurement and return the (possibly unchanged) status
+
+        Args:
+            vehicle_count: Vehicles in the ROI this frame
+            thresholds: (low, moderate, high) enter thresholds
+            congestion_detected: The model detected a congestion class directly
+            now: Frame time in seconds (defaults to time.time())
+        """
+        now = time.time() if now is None else now
+        if congestion_detected:
+            vehicle_count = max(vehicle_count, thresholds[-1])
+
+        with self.lock:
+            if self.smoothed_count is None:
+                self.smoothed_count = float(vehicle_count)
+                self.level_since = now
+                self.level = self._target_level(thresholds)
+                self.alert_pending = self.level == len(CONGESTION_STATUSES) - 1
+            else:
+                alpha = 1.0 - math.exp(-max(now - self.last_update, 0.0) / self.time_constant)
+                self.smoothed_count += alpha * (vehicle_count - self.smoothed_count)
+
+                target = self._target_level(thresholds)
+                if target != self.level and now - self.level_since >= self.min_dwell:
+                    entering_high = target == len(CONGESTION_STATUSES) - 1
+                    self.level = target
+                    self.level_since = now
+                    self.transitions += 1
+                    self.alert_pending = entering_high
+            self.last_update = now
+            return self.status
+
+    def should_alert(self, now=None):
+        """True once per entry into high congestion, at most once per cooldown"""
+        now = time.time() if now is None else now
+        with self.lock:
+            if not self.alert_pending:
+                return False
+            if self.last_alert is not None and now - self.last_alert < self.alert_cooldown:
+                self.alert_pending = False
+                return False
+            self.alert_pending = False
+            self.last_alert = now
+            return True
+
+    def get_state(self):
+        return {
+            "status": self.status,
+            "smoothed_count": round(self.smoothed_count or 0.0, 2),
+            "level_since": self.level_since,
+            "transitions": self.transitions,
+            "last_alert": self.last_alert,
+        }
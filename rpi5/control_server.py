@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Control interface for headless Traffic Congestion Detection
+Accepts the same commands as the display window's keys over a UNIX socket and
+POSIX signals, so units can run under systemd without X
+
+    echo snapshot | nc -U /tmp/traffic_detector.sock
+    kill -USR1 <pid>   # snapshot
+    kill -USR2 <pid>   # force Firebase update
+    kill -HUP <pid>    # reload settings
+    kill -s RTMIN <pid>   # record a profiling trace
+"""
+
+import os
+import signal
+import socket
+import threading
+
+COMMANDS = {
+    "quit": "Stop detection",
+    "snapshot": "Save an annotated frame",
+    "test": "Test Firebase connection",
+    "update": "Force a Firebase update now",
+    "roi": "Set ROI: roi <x1> <y1> <x2> <y2>",
+    "reload": "Re-read the settings file and apply what changed",
+    "profile": "Record a per-frame span trace: profile [frames] (profile stop ends it early)",
+}
+
+SIGNAL_COMMANDS = {
+    signal.SIGUSR1: "snapshot",
+    signal.SIGUSR2: "update",
+    signal.SIGTERM: "quit",
+    signal.SIGHUP: "reload",
+}
+if hasattr(signal, "SIGRTMIN"):
+    SIGNAL_COMMANDS[signal.SIGRTMIN] = "profile"
+
+
+def install_signal_handlers(on_command, on_stop=None):
+    """
+    Map SIGUSR1/SIGUSR2/SIGTERM/SIGHUP/SIGRTMIN to commands (must be called from the main thread)
+
+    With on_stop, SIGTERM calls it directly instead of queueing 'quit', so the
+    detector stops even when no frames arrive to drain the command queue.
+    """
+    for signum, command in SIGNAL_COMMANDS.items():
+        signal.signal(signum, lambda _signum, _frame, command=command: on_command(command, []))
+    if on_stop:
+        signal.signal(signal.SIGTERM, lambda _signum, _frame: on_stop())
+
+
+class ControlServer:
+    def __init__(self, socket_path, on_command):
+        """
+        Initialize the control socket
+
+        Args:
+            socket_path: Filesystem path of the UNIX socket to listen on
+            on_command: Callable (command, args) invoked for every valid command
+        """
+        self.socket_path = socket_path
+        self.on_command = on_command
+        self.sock = None
+        self.thread = None
+
+    def start(self):
+        """Bind the socket and serve commands on a background thread"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # Stale socket from a previous run
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.socket_path)
+        self.sock.listen(4)
+        self.thread = threading.Thread(target=self._serve, name="control", daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return  # Socket closed
+
+            with conn:
+                try:
+                    conn.settimeout(2.0)
+                    line = conn.makefile("r").readline()
+                    conn.sendall(self.handle_line(line).encode() + b"\n")
+                except OSError:
+                    continue
+
+    def handle_line(self, line):
+        """Parse and dispatch one command line, returning the reply text"""
+        parts = line.strip().split()
+        if not parts:
+            return "error: empty command"
+
+        command, args = parts[0].lower(), parts[1:]
+        if command == "help":
+            return "\n".join(f"{name}: {description}" for name, description in COMMANDS.items())
+        if command not in COMMANDS:
+            return f"error: unknown command '{command}'"
+
+        self.on_command(command, args)
+        return "ok"
+
+    def stop(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
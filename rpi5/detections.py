@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Columnar detection results for Traffic Congestion Detection
+Boxes, classes and scores are kept as NumPy arrays and filtered with vectorized
+masks; per-detection dicts are only built for consumers that ask for them
+"""
+
+from collections.abc import Sequence
+
+import numpy as np
+
+
+def class_lookup(class_names, class_ids):
+    """Boolean array indexed by class id, True for the given ids"""
+    size = max(list(class_names.keys()) + [-1]) + 1
+    lookup = np.zeros(size, dtype=bool)
+    if len(class_ids):
+        lookup[np.asarray(list(class_ids), dtype=np.intp)] = True
+    return lookup
+
+
+class DetectionBatch:
+    """All detections of one frame, stored column-wise"""
+
+    def __init__(self, boxes, class_ids, scores, class_names, in_roi, is_vehicle, zone_bits=None):
+        self.boxes = boxes            # (N, 4) int32 x1, y1, x2, y2
+        self.class_ids = class_ids    # (N,) int32
+        self.scores = scores          # (N,) float32
+        self.class_names = class_names
+        self.in_roi = in_roi          # (N,) bool, box lies entirely inside the ROI
+        self.is_vehicle = is_vehicle  # (N,) bool, class counts as traffic
+        self.zone_bits = zone_bits    # (N,) uint32 zone membership bits, None without zones
+
+    @classmethod
+    def from_results(cls, results, class_names, roi, vehicle_lookup, offset=None, min_confidence=None,
+                     zone_map=None):
+        """
+        Build a batch from ultralytics results
+
+        Uses result.boxes.data ([x1, y1, x2, y2, (track_id,) conf, cls] per row) so the
+        whole frame is converted with a handful of array operations. offset (x, y) maps
+        boxes from a cropped model input back to frame coordinates; min_confidence drops
+        boxes below a per-camera cutoff when the model ran with a lower shared one. With a
+        zone_map, "in the ROI" means anchored in any zone instead of inside the rectangle.
+        """
+        arrays = []
+        for result in results:
+            boxes = result.boxes
+            if boxes is not None and len(boxes):
+                data = boxes.data
+                if hasattr(data, "cpu"):
+                    data = data.cpu().numpy()
+                arrays.append(np.asarray(data))
+
+        if not arrays:
+            return cls.empty(class_names, zone_map is not None)
+
+        data = arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+        if min_confidence is not None:
+            data = data[data[:, -2] >= min_confidence]
+        return cls.from_array(data, class_names, roi, vehicle_lookup, offset, zone_map)
+
+    @classmethod
+    def from_array(cls, data, class_names, roi, vehicle_lookup, offset=None, zone_map=None):
+        """Build a batch from an (N, 6+) array laid out like result.boxes.data"""
+        boxes = data[:, :4]
+        if offset is not None:
+            boxes = boxes + np.array([offset[0], offset[1], offset[0], offset[1]], dtype=boxes.dtype)
+        boxes = boxes.astype(np.int32)  # Truncates like int() did
+        scores = data[:, -2].astype(np.float32)
+        class_ids = data[:, -1].astype(np.int32)
+
+        zone_bits = None
+        if zone_map is not None:
+            zone_bits = zone_map.membership(boxes)
+            in_roi = zone_bits != 0
+        else:
+            in_roi = ((boxes[:, 0] >= roi[0]) & (boxes[:, 1] >= roi[1]) &
+                      (boxes[:, 2] <= roi[2]) & (boxes[:, 3] <= roi[3]))
+        is_vehicle = vehicle_lookup[np.clip(class_ids, 0, len(vehicle_lookup) - 1)]
+        is_vehicle &= class_ids < len(vehicle_lookup)
+
+        return cls(boxes, class_ids, scores, class_names, in_roi, is_vehicle, zone_bits)
+
+    @classmethod
+    def empty(cls, class_names, zones=False):
+        return cls(
+            np.zeros((0, 4), dtype=np.int32),
+            np.zeros(0, dtype=np.int32),
+            np.zeros(0, dtype=np.float32),
+            class_names,
+            np.zeros(0, dtype=bool),
+            np.zeros(0, dtype=bool),
+            np.zeros(0, dtype=np.uint32) if zones else None
+        )
+
+    def __len__(self):
+        return len(self.class_ids)
+
+    @property
+    def roi_mask(self):
+        """Detections that are vehicles inside the ROI"""
+        return self.in_roi & self.is_vehicle
+
+    def all(self):
+        """View over every detection"""
+        return DetectionView(self, np.arange(len(self)))
+
+    def in_roi_view(self):
+        """View over the vehicles inside the ROI"""
+        return DetectionView(self, np.flatnonzero(self.roi_mask))
+
+
+class DetectionView(Sequence):
+    """
+    A list-like selection of detections from a DetectionBatch
+
+    Indexing or iterating yields the usual detection dicts ('bbox', 'class_id',
+    'class_name', 'confidence'), built on first access only. len() and the array
+    properties never build dicts.
+    """
+
+    def __init__(self, batch, indices):
+        self.batch = batch
+        self.indices = indices
+        self._dicts = None
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        return self.as_dicts()[index]
+
+    def __iter__(self):
+        return iter(self.as_dicts())
+
+    def as_dicts(self):
+        """Materialize (once) the detection dicts for this view"""
+        if self._dicts is None:
+            names = self.batch.class_names
+            boxes = self.batch.boxes[self.indices].tolist()
+            class_ids = self.batch.class_ids[self.indices].tolist()
+            scores = self.batch.scores[self.indices].tolist()
+            self._dicts = [
+                {
+                    'bbox': tuple(box),
+                    'class_id': class_id,
+                    'class_name': names[class_id],
+                    'confidence': score
+                }
+                for box, class_id, score in zip(boxes, class_ids, scores)
+            ]
+        return self._dicts
+
+    @property
+    def boxes(self):
+        return self.batch.boxes[self.indices]
+
+    @property
+    def class_ids(self):
+        return self.batch.class_ids[self.indices]
+
+    @property
+    def scores(self):
+        return self.batch.scores[self.indices]
+
+    @property
+    def in_roi(self):
+        """Per-detection flag: a vehicle inside the ROI (what in_roi_view() selects)"""
+        return self.batch.roi_mask[self.indices]
+
+    @property
+    def zone_bits(self):
+        if self.batch.zone_bits is None:
+            return None
+        return self.batch.zone_bits[self.indices]
+
+    def type_counts(self):
+        """Number of detections per class name"""
+        counts = np.bincount(self.class_ids)
+        names = self.batch.class_names
+        return {names[class_id]: int(counts[class_id]) for class_id in np.flatnonzero(counts)}
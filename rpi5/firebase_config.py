@@ -1,5 +1,7 @@
 # Firebase Configuration for Traffic Congestion Detection
 # Replace these values with your actual Firebase project details
+# Filled-in values override the defaults in traffic_detector.py (see runtime_config.py);
+# a traffic_config.json file, TRAFFIC_* environment variables and --set override these
 
 # Your Firebase Realtime Database URL
 # Get this from Firebase Console > Project Settings > General
@@ -5,50 +5,132 @@ Sends real-time traffic data to Firebase for IoT web and app integration
 """
 
 import json
+import logging
 import time
 import threading
 from datetime import datetime
 import requests
+import metrics
+from profiling import PROFILER
+from firebase_session import FirebaseSession
+from firebase_uploader import FirebaseUploader
+from offline_spool import OfflineSpool
+from publish_policy import PublishPolicy, PUBLISH_HEARTBEAT
+
+logger = logging.getLogger(__name__)
+
+WRITE_MODE_PUT = "put"      # Full PUT of the current state, then a second PUT for history
+WRITE_MODE_PATCH = "patch"  # One root-level multi-path PATCH carrying only changed fields plus history
+
+# Congestion status -> numeric level
+CONGESTION_LEVELS = {
+    "No Traffic": 0,
+    "Light Traffic": 1, 
+    "Moderate Congestion": 2,
+    "High Congestion": 3
+}
+
+def count_vehicle_types(all_detections):
+    """Number of detections per class name"""
+    if hasattr(all_detections, 'type_counts'):
+        return all_detections.type_counts()
+    vehicle_types = {}
+    for detection in all_detections:
+        vehicle_type = detection['class_name']
+        vehicle_types[vehicle_type] = vehicle_types.get(vehicle_type, 0) + 1
+    return vehicle_types
+
+def flatten_paths(data, prefix):
+    """Flatten a nested dict into {"prefix/a/b": leaf} Firebase update paths"""
+    paths = {}
+    for key, value in data.items():
+        path = f"{prefix}/{key}"
+        if isinstance(value, dict):
+            # Firebase doesn't store empty objects, so an empty dict contributes no paths
+            paths.update(flatten_paths(value, path))
+        else:
+            paths[path] = value
+    return paths
+
+def merge_state_updates(queued, new):
+    """Coalesce two queued PATCH-mode updates: keep the newest state and every history sample"""
+    history = dict(queued["history"])
+    history.update(new["history"])
+    return {"current": new["current"], "history": history}
 
 class FirebaseIntegration:
-    def __init__(self, firebase_url, api_key=None):
+    def __init__(self, firebase_url, api_key=None, async_uploads=True, upload_workers=2, upload_queue_size=100,
+                 pool_size=None, connect_timeout=3.05, read_timeout=10, write_mode=WRITE_MODE_PUT,
+                 spool_path=None, spool_max_records=100000, spool_max_age=7 * 24 * 3600, replay_batch_size=200,
+                 location_id="camera_001", publish_policy=None, raw_history=True):
         """
         Initialize Firebase connection
         
         Args:
             firebase_url: Your Firebase Realtime Database URL
             api_key: Optional Firebase API key for authentication
+            async_uploads: Send writes from background workers instead of the caller's thread
+            upload_workers: Number of background upload workers
+            upload_queue_size: Maximum number of writes waiting to be sent
+            pool_size: Kept-alive connections in the HTTP pool (defaults to one per worker plus one)
+            connect_timeout: Seconds to wait for a TCP/TLS connection
+            read_timeout: Seconds to wait for Firebase to respond
+            write_mode: "put" for separate full PUTs, "patch" for one diffed multi-path PATCH
+            spool_path: SQLite file for the offline store-and-forward spool (None disables it)
+            spool_max_records: Oldest spooled records are evicted beyond this many
+            spool_max_age: Spooled records older than this many seconds are evicted
+            replay_batch_size: Spooled records sent per batched write when connectivity returns
+            location_id: Unique identifier for this camera
+            publish_policy: PublishPolicy deciding when to write (defaults to PublishPolicy())
+            raw_history: Also write every published snapshot under traffic_history
         """
         self.firebase_url = firebase_url.rstrip('/')
         self.api_key = api_key
-        self.last_update = 0
-        self.update_interval = 5  # Update every 5 seconds
-        self.location_id = "camera_001"  # Unique identifier for this camera
+        self.publish_policy = publish_policy or PublishPolicy()  # Write on change, heartbeat otherwise
+        self.location_id = location_id  # Unique identifier for this camera
+        self.raw_history = raw_history
+        self.write_mode = write_mode
         
-    def format_traffic_data(self, congestion_status, vehicle_count, detections_in_roi, all_detections):
-        """Format traffic data for Firebase"""
-        timestamp = datetime.now().isoformat()
+        # Flattened current state last acknowledged by Firebase, used to diff PATCH writes
+        self._acked_base = None
+        self._acked_state = {}
+        self._acked_lock = threading.Lock()
         
-        # Convert congestion status to numeric level
-        congestion_levels = {
-            "No Traffic": 0,
-            "Light Traffic": 1, 
-            "Moderate Congestion": 2,
-            "High Congestion": 3
-        }
+        # Offline spool: records are persisted when queued and replayed after an outage
+        self.spool = None
+        self.replay_batch_size = replay_batch_size
+        self.replayed = 0
+        self._inflight_ids = set()  # Spooled records queued or being sent, held back from replay
+        self._inflight_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._state_write_lock = threading.Lock()  # Keeps replayed and live current-state writes in order
+        if spool_path:
+            self.spool = OfflineSpool(spool_path, spool_max_records, spool_max_age)
+        
+        # One pooled keep-alive session shared by every REST call
+        if pool_size is None:
+            pool_size = upload_workers + 1
+        self.http = FirebaseSession(pool_size, connect_timeout, read_timeout)
+        
+        self.uploader = None
+        if async_uploads:
+            self.uploader = FirebaseUploader(self._handle_job, upload_queue_size, upload_workers,
+                                             on_drop=self._job_dropped)
+        
+    def format_traffic_data(self, congestion_status, vehicle_count, detections_in_roi, all_detections, tracking=None,
+                            lanes=None):
+        """Format traffic data for Firebase (tracking: optional VehicleTracker stats, lanes: per-zone status)"""
+        timestamp = datetime.now().isoformat()
         
         # Count vehicles by type
-        vehicle_types = {}
-        for detection in all_detections:
-            vehicle_type = detection['class_name']
-            vehicle_types[vehicle_type] = vehicle_types.get(vehicle_type, 0) + 1
+        vehicle_types = count_vehicle_types(all_detections)
         
         data = {
             "timestamp": timestamp,
             "location_id": self.location_id,
             "congestion": {
                 "status": congestion_status,
-                "level": congestion_levels.get(congestion_status, 0),
+                "level": CONGESTION_LEVELS.get(congestion_status, 0),
                 "vehicle_count_roi": vehicle_count,
                 "total_detections": len(all_detections)
             },
@@ -62,104 +144,487 @@ class FirebaseIntegration:
                 "last_detection": timestamp
             }
         }
+        if tracking:
+            data["flow"] = tracking
+        if lanes:
+            data["lanes"] = lanes
         
         return data
     
-    def send_to_firebase(self, data):
-        """Send data to Firebase Realtime Database"""
+    def send_to_firebase(self, data, location_id=None):
+        """Send data to Firebase Realtime Database (location_id defaults to this camera's)"""
+        location_id = location_id or self.location_id
         try:
             # Construct Firebase URL
-            endpoint = f"{self.firebase_url}/traffic_data/{self.location_id}.json"
+            endpoint = f"{self.firebase_url}/traffic_data/{location_id}.json"
             
             if self.api_key:
                 endpoint += f"?auth={self.api_key}"
             
-            print(f"🔄 Sending to Firebase: {endpoint}")
-            print(f"📊 Data: {data['congestion']['status']} - {data['vehicles']['in_roi']} vehicles")
+            logger.debug("PUT traffic_data/%s: %s - %s vehicles", location_id,
+                         data['congestion']['status'], data['vehicles']['in_roi'])
             
             # Send PUT request to update the data
-            response = requests.put(endpoint, json=data, timeout=10)
+            response = self.http.put(endpoint, json=data)
             
             if response.status_code == 200:
-                print(f"✅ Data sent to Firebase successfully!")
+                base = f"traffic_data/{location_id}"
+                self._set_acked_state(base, flatten_paths(data, base))
                 return True
             else:
-                print(f"❌ Firebase error: {response.status_code}")
-                print(f"Response: {response.text}")
+                logger.warning("❌ Firebase error %s: %s", response.status_code, response.text[:200])
                 return False
                 
         except requests.RequestException as e:
-            print(f"❌ Network error sending to Firebase: {e}")
+            logger.warning("❌ Network error sending to Firebase: %s", e)
             return False
         except Exception as e:
-            print(f"❌ Unexpected error: {e}")
+            logger.error("❌ Unexpected error sending to Firebase: %s", e)
             return False
     
-    def send_historical_data(self, data):
+    def send_historical_data(self, data, timestamp_key=None, location_id=None):
         """Send data to historical collection with timestamp as key"""
         try:
-            timestamp_key = str(int(time.time()))
-            endpoint = f"{self.firebase_url}/traffic_history/{self.location_id}/{timestamp_key}.json"
+            if timestamp_key is None:
+                timestamp_key = str(int(time.time()))
+            endpoint = f"{self.firebase_url}/traffic_history/{location_id or self.location_id}/{timestamp_key}.json"
             
             if self.api_key:
                 endpoint += f"?auth={self.api_key}"
             
-            response = requests.put(endpoint, json=data, timeout=10)
+            response = self.http.put(endpoint, json=data)
             return response.status_code == 200
             
         except Exception as e:
-            print(f"Historical data error: {e}")
+            logger.warning("Historical data error: %s", e)
             return False
     
-    def update_traffic_data(self, congestion_status, vehicle_count, detections_in_roi, all_detections):
-        """Main method to update Firebase with traffic data"""
-        current_time = time.time()
+    def _endpoint(self, path):
+        """REST URL for a database path, with auth if configured"""
+        endpoint = f"{self.firebase_url}/{path}.json"
+        if self.api_key:
+            endpoint += f"?auth={self.api_key}"
+        return endpoint
+    
+    def _set_acked_state(self, base=None, state=None):
+        """
+        Record what Firebase now holds at the current-state node
         
-        # Only update if enough time has passed
-        if current_time - self.last_update >= self.update_interval:
-            print(f"🔄 Updating Firebase - Status: {congestion_status}, Vehicles: {vehicle_count}")
-            
-            data = self.format_traffic_data(congestion_status, vehicle_count, detections_in_roi, all_detections)
-            
-            # Send current data
-            success = self.send_to_firebase(data)
+        Called with no arguments after the node was overwritten with something else
+        (e.g. a connection test), so the next PATCH replaces the whole node.
+        """
+        with self._acked_lock:
+            self._acked_base = base
+            self._acked_state = state or {}
+    
+    def build_state_patch(self, update, location_id=None):
+        """
+        Build the root-level multi-path update for one PATCH-mode write
+        
+        Returns (patch, current_paths): only the current-state fields that changed since
+        the last acknowledged write (removed fields become null), plus every history sample.
+        """
+        location_id = location_id or self.location_id
+        base = f"traffic_data/{location_id}"
+        current_paths = flatten_paths(update["current"], base)
+        
+        with self._acked_lock:
+            acked = self._acked_state if self._acked_base == base else None
+        
+        if not acked:
+            # Nothing acknowledged yet for this location: replace the whole node once
+            patch = {base: update["current"]}
+        else:
+            patch = {path: value for path, value in current_paths.items() if acked.get(path) != value}
+            for path in acked:
+                if path not in current_paths:
+                    patch[path] = None
+        
+        for timestamp_key, data in update["history"].items():
+            patch[f"traffic_history/{location_id}/{timestamp_key}"] = data
+        
+        return patch, current_paths
+    
+    def _patch_root(self, patch):
+        """Send a compact root-level multi-path PATCH"""
+        body = json.dumps(patch, separators=(',', ':'))
+        return self.http.patch(
+            self._endpoint(""), 
+            data=body, 
+            headers={"Content-Type": "application/json"}
+        )
+    
+    def send_state_update(self, update, location_id=None):
+        """Send current-state diff and history samples as a single multi-path PATCH"""
+        location_id = location_id or self.location_id
+        try:
+            base = f"traffic_data/{location_id}"
+            patch, current_paths = self.build_state_patch(update, location_id)
+            if not patch:
+                return True
             
-            # Also send to historical data
-            if success:
-                threading.Thread(target=self.send_historical_data, args=(data,), daemon=True).start()
+            response = self._patch_root(patch)
             
-            self.last_update = current_time
-            return success
-        else:
-            # Show that we're waiting
-            time_until_next = self.update_interval - (current_time - self.last_update)
-            if int(time_until_next) != int(time_until_next + 1):  # Only print once per second
-                print(f"⏱️ Next Firebase update in {time_until_next:.1f}s")
+            if response.status_code == 200:
+                self._set_acked_state(base, current_paths)
+                return True
+            else:
+                logger.warning("❌ Firebase PATCH error %s: %s", response.status_code, response.text[:200])
+                return False
+        
+        except requests.RequestException as e:
+            logger.warning("❌ Network error sending to Firebase: %s", e)
+            return False
+        except Exception as e:
+            logger.error("❌ Unexpected error sending to Firebase: %s", e)
+            return False
+    
+    def update_traffic_data(self, congestion_status, vehicle_count, detections_in_roi, all_detections, tracking=None,
+                            force=False, lanes=None):
+        """
+        Main method to update Firebase with traffic data
+        
+        Writes the full state as soon as it changes (see PublishPolicy) and only a small
+        heartbeat while it stays the same; force writes the full state regardless.
+        lanes ({zone name: {"vehicles", "status", "level"}}) is published per zone, and a
+        change in any lane's level counts as a change of state.
+        """
+        current_time = time.time()
+        level = CONGESTION_LEVELS.get(congestion_status, 0)
+        # The mix is judged on ROI vehicles: far-off and partly visible detections flicker frame to frame
+        vehicle_types = count_vehicle_types(detections_in_roi)
+        lane_levels = tuple(lane["level"] for lane in lanes.values()) if lanes else ()
+        
+        decision = "full" if force else self.publish_policy.check(level, vehicle_count, vehicle_types, current_time,
+                                                                  lane_levels)
+        if decision is None:
+            return True  # Nothing new to send, but no error
+        
+        if decision == PUBLISH_HEARTBEAT:
+            now = datetime.now().isoformat()
+            heartbeat = {"timestamp": now, "metadata/camera_active": True, "metadata/last_heartbeat": now}
+            self.publish_policy.record(decision, level, vehicle_count, vehicle_types,
+                                       len(json.dumps(heartbeat)), current_time, lane_levels=lane_levels)
+            if self.uploader:
+                return self._submit("heartbeat", heartbeat, coalesce_key="heartbeat")
+            return self._handle_upload("heartbeat", heartbeat)
+        
+        logger.info("🔄 Updating Firebase - Status: %s, Vehicles: %s", congestion_status, vehicle_count)
+        
+        data = self.format_traffic_data(congestion_status, vehicle_count, detections_in_roi, all_detections, tracking,
+                                        lanes)
+        self.publish_policy.record(decision, level, vehicle_count, vehicle_types,
+                                   len(json.dumps(data, separators=(',', ':'))), current_time, forced=force,
+                                   lane_levels=lane_levels)
+        
+        timestamp_key = str(int(current_time))
+        
+        if self.write_mode == WRITE_MODE_PATCH:
+            update = {"current": data, "history": {timestamp_key: data} if self.raw_history else {}}
+            if self.uploader:
+                self._submit("state", update, coalesce_key="state", merge=merge_state_updates)
+                return True
+            return self._handle_upload("state", update)
+        
+        if self.uploader:
+            # Hand off to the background workers; a newer current state replaces a queued one
+            self._submit("current", data, coalesce_key="current")
+            if self.raw_history:
+                self._submit("history", (timestamp_key, data))
+            return True
+        
+        # Send current data
+        success = self._handle_upload("current", data)
+        
+        # Also send to historical data (always, when the spool can hold it for later)
+        if self.raw_history and (success or self.spool):
+            self._handle_upload("history", (timestamp_key, data))
         
-        return True  # Don't update yet, but no error
+        return success
+    
+    def publish_rollups(self, buckets):
+        """Write finished history rollup buckets ([(period, key, data)] from HistoryRollup)"""
+        if not buckets:
+            return True
+        writes = [(f"traffic_rollups/{self.location_id}/{period}/{key}", data) for period, key, data in buckets]
+        if self.uploader:
+            return self._submit("rollup", writes)
+        return self._handle_upload("rollup", writes)
+    
+    def send_rollups(self, writes):
+        """Send rollup buckets as one multi-path PATCH"""
+        try:
+            response = self._patch_root({path: data for path, data in writes})
+            return response.status_code == 200
+        except Exception as e:
+            logger.warning("Rollup error: %s", e)
+            return False
+    
+    def send_heartbeat(self, heartbeat, location_id=None):
+        """Mark the camera alive and refresh its timestamp without rewriting unchanged traffic state"""
+        try:
+            response = self.http.patch(self._endpoint(f"traffic_data/{location_id or self.location_id}"),
+                                       json=heartbeat)
+            return response.status_code == 200
+        except Exception as e:
+            logger.warning("Heartbeat error: %s", e)
+            return False
     
     def send_alert(self, alert_type, message):
         """Send special alerts for high congestion or incidents"""
+        alert_data = {
+            "timestamp": datetime.now().isoformat(),
+            "location_id": self.location_id,
+            "alert_type": alert_type,
+            "message": message,
+            "severity": "high" if "High Congestion" in message else "medium"
+        }
+        
+        if self.uploader:
+            return self._submit("alert", alert_data)
+        return self._handle_upload("alert", alert_data)
+    
+    def post_alert(self, alert_data, location_id=None):
+        """Push an alert record to the alerts list"""
         try:
-            alert_data = {
-                "timestamp": datetime.now().isoformat(),
-                "location_id": self.location_id,
-                "alert_type": alert_type,
-                "message": message,
-                "severity": "high" if "High Congestion" in message else "medium"
-            }
-            
-            endpoint = f"{self.firebase_url}/alerts/{self.location_id}.json"
+            endpoint = f"{self.firebase_url}/alerts/{location_id or self.location_id}.json"
             if self.api_key:
                 endpoint += f"?auth={self.api_key}"
             
-            response = requests.post(endpoint, json=alert_data, timeout=10)
+            response = self.http.post(endpoint, json=alert_data)
             return response.status_code == 200
             
         except Exception as e:
-            print(f"Alert error: {e}")
+            logger.warning("Alert error: %s", e)
             return False
     
+    def _spool_records(self, kind, payload, location_id):
+        """Records to persist for one write, as (method, path, payload)"""
+        if kind == "current":
+            return [("put", f"traffic_data/{location_id}", payload)]
+        elif kind == "state":
+            records = [("put", f"traffic_data/{location_id}", payload["current"])]
+            for timestamp_key, data in payload["history"].items():
+                records.append(("put", f"traffic_history/{location_id}/{timestamp_key}", data))
+            return records
+        elif kind == "history":
+            timestamp_key, data = payload
+            return [("put", f"traffic_history/{location_id}/{timestamp_key}", data)]
+        elif kind == "alert":
+            return [("post", f"alerts/{location_id}", payload)]
+        elif kind == "rollup":
+            return [("put", path, data) for path, data in payload]
+        return []  # Heartbeats are only meaningful live, so they aren't spooled
+    
+    def _spool(self, kind, payload, location_id):
+        """Persist a write's records and hold them back from replay until it is sent; returns their spool ids"""
+        records = self._spool_records(kind, payload, location_id) if self.spool else []
+        if not records:
+            return []
+        try:
+            ids = self.spool.put_many(records)
+        except Exception as e:
+            logger.error("Spool error: %s", e)
+            return []
+        with self._inflight_lock:
+            self._inflight_ids.update(ids)
+        return ids
+    
+    def _release(self, ids):
+        """Let replay pick up spooled records again"""
+        if ids:
+            with self._inflight_lock:
+                self._inflight_ids.difference_update(ids)
+    
+    def _submit(self, kind, payload, coalesce_key=None, merge=None):
+        """
+        Queue a write for the background workers, spooling it first
+        
+        The job carries its spool ids, so a write that is dropped from a full queue, or
+        still queued at shutdown or a crash, is replayed from the spool later. It also
+        carries the location id as it is now: a later location change (apply_settings on
+        the output thread) must not redirect writes that were already queued, so jobs
+        only coalesce with queued jobs for the same location.
+        """
+        location_id = self.location_id
+        ids = self._spool(kind, payload, location_id)
+        if coalesce_key is not None:
+            coalesce_key = (coalesce_key, location_id)
+        
+        def merge_jobs(queued, new):
+            # A coalesced job sends the newest payload, which supersedes the queued records too
+            return queued[0] + new[0], location_id, merge(queued[2], new[2]) if merge else new[2]
+        
+        if not self.uploader.submit(kind, (ids, location_id, payload), coalesce_key, merge_jobs):
+            self._release(ids)
+            return False
+        return True
+    
+    def _job_dropped(self, kind, job):
+        """A queued write was dropped to make room: leave its records to spool replay"""
+        ids, _, _ = job
+        self._release(ids)
+        if ids:
+            logger.warning("📦 %s write dropped from the upload queue, spooled for retry", kind)
+        else:
+            logger.warning("%s write dropped from the upload queue", kind)
+    
+    def _handle_job(self, kind, job):
+        """Uploader handler: a queued job is (spool ids, location id, payload)"""
+        ids, location_id, payload = job
+        return self._handle_upload(kind, payload, ids, location_id)
+    
+    def _handle_upload(self, kind, payload, ids=None, location_id=None):
+        """Perform one write, spooling it to disk first (unless it was spooled when queued) so it survives an outage"""
+        with PROFILER.span("upload", kind=kind):
+            return self._upload(kind, payload, ids, location_id or self.location_id)
+    
+    def _upload(self, kind, payload, ids, location_id):
+        if kind == "replay":
+            return self.replay_backlog()
+        if ids is None:
+            ids = self._spool(kind, payload, location_id)
+        if not ids:
+            return self._send(kind, payload, location_id)
+        
+        try:
+            success = self._send(kind, payload, location_id)
+        finally:
+            self._release(ids)
+        
+        if success:
+            self.spool.ack(ids)
+            # Connectivity is back: catch up on anything spooled during the outage. With
+            # background workers the whole backlog is replayed on a free worker; without,
+            # one batch per update so the caller stays responsive
+            if self.uploader:
+                self._submit("replay", None, coalesce_key="replay")
+            else:
+                self.replay_backlog(max_batches=1)
+        else:
+            logger.warning("📦 %s write spooled for retry", kind)
+        return success
+    
+    def replay_backlog(self, max_batches=None):
+        """Send spooled records in batched writes until the spool is empty or a write fails"""
+        if not self.spool or not self._replay_lock.acquire(blocking=False):
+            return True
+        
+        try:
+            batches = 0
+            while max_batches is None or batches < max_batches:
+                # Read the batch under the state lock: a live state write spools over the
+                # same row (replacing it) when it is queued, so once it holds the lock the
+                # older spooled state is gone and can't be replayed over the newer one
+                with self._state_write_lock:
+                    with self._inflight_lock:
+                        exclude = set(self._inflight_ids)
+                    records = self.spool.pending(self.replay_batch_size, exclude)
+                    if not records:
+                        return True
+                    
+                    # PUT records become one multi-path PATCH; alert POSTs keep their push ids
+                    puts = [(row_id, path, payload) for row_id, method, path, payload in records if method == "put"]
+                    posts = [(row_id, path, payload) for row_id, method, path, payload in records if method == "post"]
+                    
+                    if puts:
+                        current_base = f"traffic_data/{self.location_id}"
+                        response = self._patch_root({path: payload for _, path, payload in puts})
+                        if response.status_code != 200:
+                            logger.warning("❌ Spool replay failed: %s", response.status_code)
+                            return False
+                        for _, path, payload in puts:
+                            if path == current_base:
+                                self._set_acked_state(current_base, flatten_paths(payload, current_base))
+                        self.spool.ack([row_id for row_id, _, _ in puts])
+                
+                for row_id, path, payload in posts:
+                    response = self.http.post(self._endpoint(path), json=payload)
+                    if response.status_code != 200:
+                        logger.warning("❌ Spool replay failed: %s", response.status_code)
+                        return False
+                    self.spool.ack([row_id])
+                
+                self.replayed += len(records)
+                batches += 1
+                logger.info("📤 Replayed %d spooled records", len(records))
+            return True
+        
+        except requests.RequestException as e:
+            logger.warning("❌ Network error replaying spool: %s", e)
+            return False
+        finally:
+            self._replay_lock.release()
+    
+    def get_spool_stats(self):
+        """Offline spool backlog and replay counters (empty when the spool is disabled)"""
+        if not self.spool:
+            return {}
+        stats = self.spool.get_stats()
+        stats["replayed"] = self.replayed
+        return stats
+    
+    def _send(self, kind, payload, location_id):
+        """Perform one write over the network"""
+        if kind == "current":
+            with self._state_write_lock:
+                return self.send_to_firebase(payload, location_id)
+        elif kind == "state":
+            with self._state_write_lock:
+                return self.send_state_update(payload, location_id)
+        elif kind == "history":
+            timestamp_key, data = payload
+            return self.send_historical_data(data, timestamp_key, location_id)
+        elif kind == "alert":
+            return self.post_alert(payload, location_id)
+        elif kind == "heartbeat":
+            return self.send_heartbeat(payload, location_id)
+        elif kind == "rollup":
+            return self.send_rollups(payload)
+        
+        logger.error("Unknown write kind: %s", kind)
+        return False
+    
+    def get_upload_stats(self):
+        """Background uploader queue depth and counters (empty when uploads are synchronous)"""
+        if not self.uploader:
+            return {}
+        return self.uploader.get_stats()
+    
+    def get_publish_stats(self):
+        """Write volume and change-to-publish latency from the publish policy"""
+        return self.publish_policy.get_stats()
+    
+    def collect_metrics(self):
+        """Copy uploader, spool and publish counters into the metrics registry (run on scrape)"""
+        location = self.location_id
+        if self.uploader:
+            stats = self.uploader.get_stats()
+            metrics.UPLOAD_QUEUE_DEPTH.set(location, value=stats["queue_depth"])
+            for outcome in ("succeeded", "failed", "dropped", "coalesced"):
+                metrics.UPLOAD_JOBS.set_total(location, outcome, value=stats[outcome])
+        if self.spool:
+            stats = self.get_spool_stats()
+            metrics.SPOOL_PENDING.set(location, value=stats["pending"])
+            metrics.SPOOL_REPLAYED.set_total(location, value=stats["replayed"])
+        stats = self.publish_policy.get_stats()
+        metrics.PUBLISH_WRITES.set_total(location, "full", value=stats["full_writes"])
+        metrics.PUBLISH_WRITES.set_total(location, "heartbeat", value=stats["heartbeats"])
+    
+    def get_connection_stats(self):
+        """HTTP connection pool reuse counters"""
+        return self.http.get_stats()
+    
+    def close(self):
+        """Flush pending uploads, stop the background workers and close pooled connections"""
+        if self.uploader:
+            self.uploader.stop()
+            self.uploader = None
+        if self.spool:
+            self.spool.close()
+            self.spool = None
+        self.http.close()
+    
     def test_connection(self):
         """Test Firebase connection"""
         try:
@@ -174,11 +639,11 @@ class FirebaseIntegration:
             if self.api_key:
                 endpoint += f"?auth={self.api_key}"
             
-            print(f"🔗 Testing Firebase connection to: {endpoint}")
-            response = requests.put(endpoint, json=test_data, timeout=10)
+            logger.info("🔗 Testing Firebase connection to: %s", self.firebase_url)
+            response = self.http.put(endpoint, json=test_data)
             
             if response.status_code == 200:
-                print("✅ Firebase connection successful!")
+                logger.info("✅ Firebase connection successful!")
                 
                 # Also test the actual data endpoint
                 data_endpoint = f"{self.firebase_url}/traffic_data/{self.location_id}.json"
@@ -192,18 +657,22 @@ class FirebaseIntegration:
                     "congestion": {"status": "Test Mode", "level": 0}
                 }
                 
-                test_response = requests.put(data_endpoint, json=test_traffic_data, timeout=10)
+                with self._state_write_lock:
+                    try:
+                        test_response = self.http.put(data_endpoint, json=test_traffic_data)
+                    finally:
+                        # The test document replaced the live state: don't diff against it
+                        self._set_acked_state()
                 if test_response.status_code == 200:
-                    print("✅ Traffic data endpoint working!")
+                    logger.info("✅ Traffic data endpoint working!")
                     return True
                 else:
-                    print(f"⚠️ Traffic data endpoint failed: {test_response.status_code}")
+                    logger.warning("⚠️ Traffic data endpoint failed: %s", test_response.status_code)
                     return False
             else:
-                print(f"❌ Firebase connection failed: {response.status_code}")
-                print(f"Response: {response.text}")
+                logger.error("❌ Firebase connection failed %s: %s", response.status_code, response.text[:200])
                 return False
                 
         except Exception as e:
-            print(f"❌ Firebase connection test failed: {e}")
+            logger.error("❌ Firebase connection test failed: %s", e)
             return False
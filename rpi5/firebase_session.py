@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Pooled keep-alive HTTP session for Firebase REST calls
+Reuses TCP/TLS connections to the database host instead of paying a fresh
+handshake on every write
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+
+class FirebaseSession:
+    def __init__(self, pool_size=4, connect_timeout=3.05, read_timeout=10, max_retries=0):
+        """
+        Initialize the pooled session
+
+        Args:
+            pool_size: Maximum number of kept-alive connections per host
+            connect_timeout: Seconds to wait for a TCP/TLS connection
+            read_timeout: Seconds to wait for the server's response
+            max_retries: Connection-level retries done by urllib3
+        """
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.adapter = HTTPAdapter(
+            pool_connections=1,  # All calls go to the one database host
+            pool_maxsize=pool_size,
+            max_retries=max_retries,
+            pool_block=False
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self.error_count = 0
+
+    def request(self, method, url, **kwargs):
+        """Send a request over a pooled connection; raises requests.RequestException like requests does"""
+        kwargs.setdefault("timeout", self.timeout)
+        with self._lock:
+            self.request_count += 1
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self.error_count += 1
+            metrics.UPLOAD_RESPONSES.inc(method, "error")
+            raise
+        finally:
+            metrics.UPLOAD_SECONDS.observe(method, value=time.perf_counter() - start)
+        metrics.UPLOAD_RESPONSES.inc(method, response.status_code)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def get_stats(self):
+        """Connection reuse counters from the underlying urllib3 pools"""
+        connections_opened = 0
+        pooled_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections_opened += pool.num_connections
+            pooled_requests += pool.num_requests
+
+        with self._lock:
+            request_count = self.request_count
+            error_count = self.error_count
+
+        reused = max(pooled_requests - connections_opened, 0)
+        return {
+            "requests": request_count,
+            "errors": error_count,
+            "connections_opened": connections_opened,
+            "connections_reused": reused,
+            "reuse_ratio": reused / pooled_requests if pooled_requests else 0.0,
+            "pool_size": self.pool_size,
+        }
+
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Background uploader for Firebase writes
+A bounded job queue drained by a fixed pool of worker threads, so the detection
+loop never waits on the network
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class UploadJob:
+    """A single pending write"""
+
+    __slots__ = ('kind', 'payload', 'coalesce_key', 'enqueued_at')
+
+    def __init__(self, kind, payload, coalesce_key=None):
+        self.kind = kind
+        self.payload = payload
+        self.coalesce_key = coalesce_key
+        self.enqueued_at = time.time()
+
+
+class FirebaseUploader:
+    def __init__(self, handler, max_queue_size=100, num_workers=2, on_drop=None):
+        """
+        Initialize the uploader and start its workers
+
+        Args:
+            handler: Callable (kind, payload) -> bool that performs the actual write
+            max_queue_size: Maximum number of pending jobs; the oldest is dropped when full
+            num_workers: Number of worker threads
+            on_drop: Optional callable (kind, payload) run for each job dropped from a full queue
+        """
+        self.handler = handler
+        self.on_drop = on_drop
+        self.max_queue_size = max_queue_size
+        self.num_workers = num_workers
+
+        self._jobs = deque()
+        self._pending = {}  # coalesce_key -> queued job
+        self._inflight_keys = set()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._active = 0
+
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.succeeded = 0
+        self.failed = 0
+
+        self.workers = []
+        for i in range(num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"firebase-upload-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, kind, payload, coalesce_key=None, merge=None):
+        """
+        Queue a write without blocking
+
+        Jobs sharing a coalesce_key replace each other while still queued, so only the
+        newest current-state document is ever sent. If merge is given, the queued payload
+        becomes merge(queued_payload, payload) instead. Returns False if the uploader is stopped.
+        """
+        dropped = None
+        with self._cond:
+            if self._stopping:
+                return False
+
+            if coalesce_key is not None:
+                queued = self._pending.get(coalesce_key)
+                if queued is not None:
+                    queued.payload = merge(queued.payload, payload) if merge else payload
+                    queued.enqueued_at = time.time()
+                    self.coalesced += 1
+                    return True
+
+            if len(self._jobs) >= self.max_queue_size:
+                dropped = self._drop_oldest()
+
+            job = UploadJob(kind, payload, coalesce_key)
+            self._jobs.append(job)
+            if coalesce_key is not None:
+                self._pending[coalesce_key] = job
+            self.enqueued += 1
+            self._cond.notify()
+
+        if dropped is not None and self.on_drop:
+            self.on_drop(dropped.kind, dropped.payload)
+        return True
+
+    def _drop_oldest(self):
+        """Drop and return the oldest job, sparing coalesced current-state jobs if possible (caller holds the lock)"""
+        victim = 0
+        for index, job in enumerate(self._jobs):
+            if job.coalesce_key is None:
+                victim = index
+                break
+        job = self._jobs[victim]
+        del self._jobs[victim]
+        if job.coalesce_key is not None:
+            self._pending.pop(job.coalesce_key, None)
+        self.dropped += 1
+        return job
+
+    def _next_job(self):
+        """Pop the oldest job whose coalesce key is not already being sent (caller holds the lock)"""
+        for index, job in enumerate(self._jobs):
+            if job.coalesce_key is None or job.coalesce_key not in self._inflight_keys:
+                del self._jobs[index]
+                if job.coalesce_key is not None:
+                    self._pending.pop(job.coalesce_key, None)
+                    self._inflight_keys.add(job.coalesce_key)
+                return job
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._stopping:
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                self._active += 1
+
+            try:
+                success = self.handler(job.kind, job.payload)
+            except Exception as e:
+                logger.error("Upload error (%s): %s", job.kind, e)
+                success = False
+
+            with self._cond:
+                self._active -= 1
+                if job.coalesce_key is not None:
+                    self._inflight_keys.discard(job.coalesce_key)
+                if success:
+                    self.succeeded += 1
+                else:
+                    self.failed += 1
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until all queued jobs have been sent. Returns False on timeout"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._jobs or self._active:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout=5.0):
+        """Send what is still queued (up to timeout) and stop the workers"""
+        self.flush(timeout)
+        with self._cond:
+            if self._jobs:
+                logger.warning("Stopping with %d writes still queued", len(self._jobs))
+            self._stopping = True
+            self._cond.notify_all()
+        for worker in self.workers:
+            worker.join(timeout=1.0)
+
+    def get_stats(self):
+        """Queue depth and job counters"""
+        with self._cond:
+            return {
+                "queue_depth": len(self._jobs),
+                "in_flight": self._active,
+                "enqueued": self.enqueued,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+            }
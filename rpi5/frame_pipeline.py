@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Pipelined capture / inference / output stages for Traffic Congestion Detection
+Stages run on their own threads and are joined by single-slot "latest frame wins"
+queues, so inference always works on the newest camera frame
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class FramePacket:
+    """A captured frame and everything computed from it as it moves through the pipeline"""
+
+    __slots__ = ('frame_id', 'captured_at', 'frame', 'result', 'inferred_at')
+
+    def __init__(self, frame_id, captured_at, frame):
+        self.frame_id = frame_id
+        self.captured_at = captured_at
+        self.frame = frame
+        self.result = None
+        self.inferred_at = None
+
+
+class LatestFrameQueue:
+    """Bounded single-slot queue: a new item replaces any item not yet consumed"""
+
+    def __init__(self, name):
+        self.name = name
+        self._item = None
+        self._has_item = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, item):
+        """Store item, dropping the previous one if the consumer has not taken it yet"""
+        with self._cond:
+            if self._has_item:
+                self.dropped += 1
+            self._item = item
+            self._has_item = True
+            self.put_count += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Return the newest item, or None on timeout or once the queue is closed"""
+        with self._cond:
+            if not self._has_item and not self._closed:
+                self._cond.wait(timeout)
+            if not self._has_item:
+                return None
+            item = self._item
+            self._item = None
+            self._has_item = False
+            return item
+
+    def close(self):
+        """Wake up any waiting consumer"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class FramePipeline:
+    def __init__(self, read_frame, infer, queue_timeout=0.5):
+        """
+        Initialize the capture and inference stages
+
+        Args:
+            read_frame: Callable returning (ret, frame), e.g. cv2.VideoCapture.read
+            infer: Callable taking a frame and returning the inference result
+            queue_timeout: Seconds a stage waits for input before re-checking for shutdown
+        """
+        self.read_frame = read_frame
+        self.infer = infer
+        self.queue_timeout = queue_timeout
+
+        self.frame_queue = LatestFrameQueue("capture")
+        self.result_queue = LatestFrameQueue("inference")
+        self.stop_event = threading.Event()
+        self.threads = []
+
+        self.frames_captured = 0
+        self.frames_inferred = 0
+        self.read_failures = 0
+        self.inference_errors = 0
+        self.error = None
+
+    def start(self):
+        """Start the capture and inference threads"""
+        self.threads = [
+            threading.Thread(target=self._capture_loop, name="capture", daemon=True),
+            threading.Thread(target=self._inference_loop, name="inference", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """Stop all stages and wait for their threads to exit"""
+        self.stop_event.set()
+        self.frame_queue.close()
+        self.result_queue.close()
+        for thread in self.threads:
+            thread.join(timeout=2.0)
+
+    @property
+    def running(self):
+        return not self.stop_event.is_set()
+
+    def get_result(self, timeout=None):
+        """Return the newest inferred FramePacket, or None if none arrived in time"""
+        return self.result_queue.get(self.queue_timeout if timeout is None else timeout)
+
+    def _capture_loop(self):
+        """Read frames as fast as the camera delivers them"""
+        frame_id = 0
+        while not self.stop_event.is_set():
+            ret, frame = self.read_frame()
+            if not ret:
+                self.read_failures += 1
+                self.error = "Could not read frame from camera"
+                self.stop_event.set()
+                self.result_queue.close()
+                break
+
+            frame_id += 1
+            self.frames_captured += 1
+            self.frame_queue.put(FramePacket(frame_id, time.time(), frame))
+
+    def _inference_loop(self):
+        """Run inference on the newest captured frame"""
+        while not self.stop_event.is_set():
+            packet = self.frame_queue.get(self.queue_timeout)
+            if packet is None:
+                continue
+
+            try:
+                packet.result = self.infer(packet.frame)
+            except Exception as e:
+                self.inference_errors += 1
+                logger.error("Inference error: %s", e)
+                continue
+
+            packet.inferred_at = time.time()
+            self.frames_inferred += 1
+            self.result_queue.put(packet)
+
+    def get_stats(self):
+        """Per-stage throughput and drop counters"""
+        return {
+            "frames_captured": self.frames_captured,
+            "frames_inferred": self.frames_inferred,
+            "capture_dropped": self.frame_queue.dropped,
+            "inference_dropped": self.result_queue.dropped,
+            "read_failures": self.read_failures,
+            "inference_errors": self.inference_errors,
+        }
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+History rollups for Traffic Congestion Detection
+Aggregates every frame's traffic state on the device into per-minute and
+per-hour buckets (min/max/mean ROI count, vehicles counted per class, peak
+per-class detections and time spent in each congestion level), so history is
+published as a few compact buckets instead of a raw snapshot every few seconds
+"""
+
+import time
+from datetime import datetime
+
+MINUTE = 60
+HOUR = 3600
+
+
+class RollupBucket:
+    """Running aggregate for one period"""
+
+    def __init__(self, start):
+        self.start = start
+        self.samples = 0
+        self.seconds = 0.0
+        self.count_min = None
+        self.count_max = None
+        self.count_weighted = 0.0      # Sum of count * seconds, for the time-weighted mean
+        self.vehicles = {}             # Class name -> vehicles counted (tracker)
+        self.types_max = {}            # Class name -> most detections in one frame
+        self.level_seconds = {}        # Status -> seconds spent in it
+
+    def add(self, dt, status, vehicle_count, type_counts, new_vehicles):
+        self.samples += 1
+        self.seconds += dt
+        self.count_min = vehicle_count if self.count_min is None else min(self.count_min, vehicle_count)
+        self.count_max = vehicle_count if self.count_max is None else max(self.count_max, vehicle_count)
+        self.count_weighted += vehicle_count * dt
+        self.level_seconds[status] = self.level_seconds.get(status, 0.0) + dt
+        for name, count in type_counts.items():
+            if count > self.types_max.get(name, 0):
+                self.types_max[name] = count
+        for name, count in new_vehicles.items():
+            self.vehicles[name] = self.vehicles.get(name, 0) + count
+
+    def merge(self, other):
+        """Fold a finished shorter bucket (a minute) into this one (an hour)"""
+        if not other.samples:
+            return
+        self.samples += other.samples
+        self.seconds += other.seconds
+        self.count_min = other.count_min if self.count_min is None else min(self.count_min, other.count_min)
+        self.count_max = other.count_max if self.count_max is None else max(self.count_max, other.count_max)
+        self.count_weighted += other.count_weighted
+        for status, seconds in other.level_seconds.items():
+            self.level_seconds[status] = self.level_seconds.get(status, 0.0) + seconds
+        for name, count in other.types_max.items():
+            if count > self.types_max.get(name, 0):
+                self.types_max[name] = count
+        for name, count in other.vehicles.items():
+            self.vehicles[name] = self.vehicles.get(name, 0) + count
+
+    def to_dict(self):
+        if self.seconds:
+            mean = self.count_weighted / self.seconds
+        else:
+            mean = float(self.count_max or 0)
+        return {
+            "start": datetime.fromtimestamp(self.start).isoformat(),
+            "samples": self.samples,
+            "count_min": self.count_min or 0,
+            "count_max": self.count_max or 0,
+            "count_mean": round(mean, 2),
+            "vehicles": self.vehicles,
+            "types_max": self.types_max,
+            "level_seconds": {status: round(seconds, 1) for status, seconds in self.level_seconds.items()},
+        }
+
+
+class HistoryRollup:
+    def __init__(self, max_gap=10.0):
+        """
+        Initialize the aggregator
+
+        Args:
+            max_gap: Longest interval (seconds) credited to one sample, so a stall
+                doesn't attribute minutes of time to a stale state
+        """
+        self.max_gap = max_gap
+        self.minute = None
+        self.hour = None
+        self.last_sample = None
+        self.buckets_closed = 0
+
+    @staticmethod
+    def bucket_key(start, period):
+        """Sortable path key for a bucket, e.g. 202405011342 for a minute"""
+        return time.strftime("%Y%m%d%H%M" if period == MINUTE else "%Y%m%d%H", time.localtime(start))
+
+    @staticmethod
+    def hour_start(minute_start):
+        """Start of the local-time hour a minute belongs to (local, like bucket_key, for e.g. UTC+5:30)"""
+        return minute_start - time.localtime(minute_start).tm_min * MINUTE
+
+    def add(self, status, vehicle_count, type_counts, new_vehicles=None, now=None):
+        """
+        Add one frame's state; returns [(period_name, key, data)] for buckets to publish
+
+        A finished minute is returned along with the running total of its hour, and
+        the hour again (final) once it finishes.
+        """
+        now = time.time() if now is None else now
+        finished = []
+        minute_start = now - now % MINUTE
+        if self.minute is not None and minute_start != self.minute.start:
+            finished = self._close_minute(minute_start)
+        if self.minute is None:
+            self.minute = RollupBucket(minute_start)
+        if self.hour is None:
+            self.hour = RollupBucket(self.hour_start(minute_start))
+
+        dt = 0.0 if self.last_sample is None else min(max(now - self.last_sample, 0.0), self.max_gap)
+        self.last_sample = now
+        self.minute.add(dt, status, vehicle_count, type_counts, new_vehicles or {})
+        return finished
+
+    def _close_minute(self, next_minute_start):
+        finished = [("minutes", self.bucket_key(self.minute.start, MINUTE), self.minute.to_dict())]
+        self.hour.merge(self.minute)
+        finished.append(("hours", self.bucket_key(self.hour.start, HOUR), self.hour.to_dict()))
+        self.buckets_closed += 1
+        self.minute = None
+        if next_minute_start is None or self.hour_start(next_minute_start) != self.hour.start:
+            self.hour = None
+        return finished
+
+    def flush(self):
+        """Close the current partial buckets (e.g. on shutdown) and return them for publishing"""
+        if self.minute is None or not self.minute.samples:
+            return []
+        return self._close_minute(None)
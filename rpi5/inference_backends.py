@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Inference backends for Traffic Congestion Detection
+Exports the Roboflow weights once to an optimized CPU format (ONNX, OpenVINO or
+NCNN), caches the artifact next to the weights keyed by weight hash and input
+size, and loads it through ultralytics so detections come back in the same form
+as the PyTorch model
+
+Optional packages per backend:
+    onnx:     pip install onnx onnxruntime
+    openvino: pip install openvino
+    ncnn:     pip install ncnn
+
+The "onnx-int8" backend is produced by quantize_model.py, not exported on demand
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+
+logger = logging.getLogger(__name__)
+
+# backend name -> (ultralytics export format, suffix of the exported artifact)
+BACKENDS = {
+    "pytorch": (None, ".pt"),
+    "onnx": ("onnx", ".onnx"),
+    "openvino": ("openvino", "_openvino_model"),
+    "ncnn": ("ncnn", "_ncnn_model"),
+    "onnx-int8": ("onnx", "-int8.onnx"),
+}
+
+# Backends whose artifact is built by quantize_model.py (calibration needs sample frames)
+QUANTIZED_BACKENDS = ("onnx-int8",)
+
+CACHE_DIR_NAME = "export_cache"
+
+
+def weights_hash(weights_path, length=12):
+    """Short SHA-256 of the weights file, so a re-downloaded model invalidates the cache"""
+    digest = hashlib.sha256()
+    with open(weights_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:length]
+
+
+def cached_export_path(weights_path, backend, imgsz, variant=""):
+    """Where the exported artifact for these weights, backend and input size is cached"""
+    _, suffix = BACKENDS[backend]
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(weights_path)), CACHE_DIR_NAME)
+    name = f"{stem}-{weights_hash(weights_path)}-{imgsz}{variant}{suffix}"
+    return os.path.join(cache_dir, name)
+
+
+def export_model(weights_path, backend, imgsz):
+    """Export the weights to the backend's format and move the result into the cache"""
+    from ultralytics import YOLO
+
+    export_format, _ = BACKENDS[backend]
+    target = cached_export_path(weights_path, backend, imgsz)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    logger.info("Exporting %s to %s at %spx (one-time)...", weights_path, backend, imgsz)
+    exported = YOLO(weights_path).export(format=export_format, imgsz=imgsz, half=False)
+    if os.path.exists(target):
+        shutil.rmtree(target) if os.path.isdir(target) else os.remove(target)
+    shutil.move(str(exported), target)
+    logger.info("Exported model cached at %s", target)
+    return target
+
+
+def load_model(weights_path, backend="pytorch", imgsz=640):
+    """
+    Load the detection model for a backend, exporting and caching it on first use
+
+    Exported models have a fixed input size of imgsz; callers must run inference at
+    that size (see fixed_image_size).
+    """
+    from ultralytics import YOLO
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}' (choose from {', '.join(BACKENDS)})")
+    if backend == "pytorch":
+        return YOLO(weights_path)
+
+    model_path = cached_export_path(weights_path, backend, imgsz)
+    if not os.path.exists(model_path) and backend in QUANTIZED_BACKENDS:
+        raise FileNotFoundError(f"No {backend} model at {model_path}; "
+                                f"create it with: python quantize_model.py --frames <sample frames dir>")
+    if not os.path.exists(model_path):
+        model_path = export_model(weights_path, backend, imgsz)
+    else:
+        logger.info("Using cached %s model: %s", backend, model_path)
+    return YOLO(model_path, task="detect")
+
+
+def fixed_image_size(backend, imgsz):
+    """Input size the backend must run at, or None if it accepts any size"""
+    return None if backend == "pytorch" else imgsz
+
+
+def supports_batching(backend):
+    """Exported models are static batch-1; only PyTorch takes a list of frames in one call"""
+    return backend == "pytorch"
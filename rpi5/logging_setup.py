@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Logging for Traffic Congestion Detection
+Every module logs through the standard logging module; setup_logging() routes it
+through a queue so callers only pay for enqueueing a record, while a listener
+thread formats and writes it. A rate limit per message template (with optional
+1-in-N sampling) keeps per-frame and per-write messages, and error floods
+during a network outage, from wearing out the SD card
+
+    logger.debug("Firebase write %s", path)                          # off at INFO
+    logger.info("FPS %.1f", fps, extra={"sample_every": 10})         # 1 in 10
+    logger.warning("Upload failed", extra={"kind": kind})            # structured field
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+LOG_FORMATS = ("text", "json")
+
+# LogRecord attributes that are not user-supplied fields
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sample_every", "taskName"}
+
+_listener = None
+
+
+def _fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RESERVED}
+
+
+class TextFormatter(logging.Formatter):
+    """'time level logger: message key=value ...'"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        fields = _fields(record)
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for shipping logs off the device"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, rate=1.0, burst=5, max_keys=1024):
+        """
+        Token bucket per (logger, message template)
+
+        Args:
+            rate: Records per second allowed per template once the burst is used up
+            burst: Records per template allowed back to back
+            max_keys: Templates tracked before the table is reset
+        """
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = {}   # key -> [tokens, last refill, suppressed, seen]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        sample_every = getattr(record, "sample_every", 1)
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= self.max_keys:
+                    self.buckets.clear()
+                bucket = self.buckets[key] = [float(self.burst), now, 0, 0]
+            bucket[3] += 1
+            if sample_every > 1 and (bucket[3] - 1) % sample_every:
+                reason = "sampled"
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                if bucket[0] >= 1.0:
+                    bucket[0] -= 1.0
+                    suppressed, bucket[2] = bucket[2], 0
+                    if suppressed:
+                        record.suppressed = suppressed
+                    return True
+                bucket[2] += 1
+                reason = "rate_limited"
+        metrics.LOG_RECORDS_DROPPED.inc(reason)
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking or erroring"""
+
+    def prepare(self, record):
+        # Freeze the message and traceback here; full formatting happens on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_RECORDS_DROPPED.inc("queue_full")
+
+
+def setup_logging(level="INFO", log_format="text", log_file=None, rate=1.0, burst=5, queue_size=10000):
+    """
+    Route all logging through a bounded queue to a background writer
+
+    Args:
+        level: Root log level name or number
+        log_format: "text" or "json"
+        log_file: Also write to this file (rotated at 5 MB, 3 backups); None for stderr only
+        rate: Records per second allowed per message template after the burst
+        burst: Records per message template allowed back to back
+        queue_size: Records buffered for the writer thread before new ones are dropped
+    """
+    global _listener
+    shutdown_logging()
+
+    formatter = JsonFormatter() if log_format == "json" else TextFormatter()
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(log_file, maxBytes=5 * 1024 * 1024, backupCount=3))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(queue_size))
+    queue_handler.addFilter(RateLimitFilter(rate, burst))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Metrics for Traffic Congestion Detection
+Low-overhead counters, gauges and histograms kept in process, served on a local
+HTTP endpoint in the Prometheus text format so a fleet of Pis can be scraped
+for performance regressions and stalled uplinks
+
+    curl http://<pi>:9108/metrics
+"""
+
+import bisect
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric with optional labels; values are kept per label combination"""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(value) for value in labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, *labels, value):
+        """Mirror a monotonically increasing count kept elsewhere (e.g. a get_stats counter)"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, *labels, value):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labels, value):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, (list(counts), total, count)) for labels, (counts, total, count)
+                           in self._values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(self.labelnames, labels, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """Callable run on every scrape to copy values from existing get_stats() counters"""
+        with self._lock:
+            self.collectors.append(collector)
+
+    def remove_collector(self, collector):
+        with self._lock:
+            if collector in self.collectors:
+                self.collectors.remove(collector)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            collectors = list(self.collectors)
+            metrics = list(self.metrics)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning("Metrics collector error: %s", e)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    def __init__(self, registry, host="0.0.0.0", port=9108):
+        """
+        Serve a registry on http://host:port/metrics
+
+        Args:
+            registry: MetricsRegistry to expose
+            host: Interface to listen on
+            port: TCP port (9108 by default)
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        import http.server  # Only paid for when the endpoint is enabled
+
+        registry = self.registry
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self.server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            logger.warning("Metrics endpoint disabled: could not listen on %s:%s (%s)", self.host, self.port, e)
+            self.server = None
+            return False
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+        logger.info("Metrics endpoint: http://%s:%s/metrics", self.host, self.port)
+        return True
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+# Process-wide registry and the metrics the detector and Firebase integration feed
+REGISTRY = MetricsRegistry()
+
+FRAME_READ_SECONDS = REGISTRY.histogram(
+    "traffic_frame_read_seconds", "Time to read one frame from the camera", ("location",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+INFERENCE_SECONDS = REGISTRY.histogram(
+    "traffic_inference_seconds", "Model call latency", ("location",))
+POSTPROCESS_SECONDS = REGISTRY.histogram(
+    "traffic_postprocess_seconds", "Detection conversion, ROI filtering and tracking time", ("location",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+FRAMES_PROCESSED = REGISTRY.counter(
+    "traffic_frames_processed_total", "Frames that went through the output stage", ("location",))
+FRAMES_INFERRED = REGISTRY.counter(
+    "traffic_frames_inferred_total", "Frames the model ran on", ("location",))
+FRAMES_DROPPED = REGISTRY.counter(
+    "traffic_frames_dropped_total", "Frames replaced before a stage picked them up", ("location", "stage"))
+FPS = REGISTRY.gauge("traffic_fps", "Output frames per second", ("location",))
+VEHICLES_IN_ROI = REGISTRY.gauge("traffic_vehicles_in_roi", "Vehicles counted in the ROI", ("location",))
+CONGESTION_LEVEL = REGISTRY.gauge("traffic_congestion_level", "Congestion level (0-3)", ("location",))
+ZONE_VEHICLES = REGISTRY.gauge("traffic_zone_vehicles", "Vehicles counted in each zone (lane)", ("location", "zone"))
+ZONE_CONGESTION_LEVEL = REGISTRY.gauge(
+    "traffic_zone_congestion_level", "Congestion level (0-3) of each zone (lane)", ("location", "zone"))
+MODEL_INFO = REGISTRY.gauge(
+    "traffic_model_info", "Loaded model and inference backend", ("location", "model", "backend", "image_size"))
+
+UPLOAD_SECONDS = REGISTRY.histogram(
+    "firebase_request_seconds", "Firebase REST request latency", ("method",))
+UPLOAD_RESPONSES = REGISTRY.counter(
+    "firebase_responses_total", "Firebase REST responses by status code ('error' = no response)", ("method", "code"))
+UPLOAD_QUEUE_DEPTH = REGISTRY.gauge("firebase_upload_queue_depth", "Writes waiting for an upload worker", ("location",))
+UPLOAD_JOBS = REGISTRY.counter(
+    "firebase_upload_jobs_total", "Background upload jobs by outcome", ("location", "outcome"))
+SPOOL_PENDING = REGISTRY.gauge("firebase_spool_pending", "Writes spooled on disk awaiting replay", ("location",))
+SPOOL_REPLAYED = REGISTRY.counter(
+    "firebase_spool_replayed_total", "Spooled writes retried after an outage", ("location",))
+STARTUP_SECONDS = REGISTRY.gauge(
+    "traffic_startup_seconds", "Duration of each startup phase (phases may overlap)", ("location", "phase"))
+FIRST_STATUS_SECONDS = REGISTRY.gauge(
+    "traffic_time_to_first_status_seconds", "Process start to first published congestion status", ("location",))
+PUBLISH_WRITES = REGISTRY.counter(
+    "firebase_publish_writes_total", "Writes chosen by the publish policy", ("location", "kind"))
+
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "traffic_log_records_dropped_total", "Log records not written (rate_limited, sampled, queue_full)", ("reason",))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Motion gate for Traffic Congestion Detection
+A cheap change detector on a downscaled copy of the ROI decides whether the scene
+changed enough to be worth running the model again
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    def __init__(self, downscale_width=160, pixel_threshold=25, changed_fraction=0.01,
+                 max_interval=30.0, background_rate=0.05):
+        """
+        Initialize the gate
+
+        Args:
+            downscale_width: Width the ROI is shrunk to before comparing
+            pixel_threshold: Grey-level difference that marks a pixel as changed
+            changed_fraction: Fraction of changed pixels that counts as motion
+            max_interval: Seconds after which inference is forced even without motion
+            background_rate: How quickly the background model absorbs the current frame
+        """
+        self.downscale_width = downscale_width
+        self.pixel_threshold = pixel_threshold
+        self.changed_fraction = changed_fraction
+        self.max_interval = max_interval
+        self.background_rate = background_rate
+
+        self.background = None
+        self.last_inference = 0.0
+        self.last_change = 0.0
+        self.frames_checked = 0
+        self.frames_skipped = 0
+
+    def _prepare(self, frame, roi):
+        x1, y1, x2, y2 = (int(v) for v in roi)
+        crop = frame[max(y1, 0):y2, max(x1, 0):x2]
+        if crop.size == 0:
+            crop = frame
+        height, width = crop.shape[:2]
+        scaled_height = max(int(height * self.downscale_width / max(width, 1)), 1)
+        small = cv2.resize(crop, (self.downscale_width, scaled_height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def should_infer(self, frame, roi, now=None):
+        """True if the ROI changed since the background model, or a refresh is due"""
+        now = time.time() if now is None else now
+        self.frames_checked += 1
+        gray = self._prepare(frame, roi)
+
+        if self.background is None or self.background.shape != gray.shape:
+            # First frame or ROI changed: start a new background model
+            self.background = gray.astype(np.float32)
+            self.last_change = 1.0
+            return True
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        self.last_change = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+        cv2.accumulateWeighted(gray, self.background, self.background_rate)
+
+        if self.last_change >= self.changed_fraction or now - self.last_inference >= self.max_interval:
+            return True
+
+        self.frames_skipped += 1
+        return False
+
+    def mark_inferred(self, now=None):
+        """Record that the model ran, restarting the forced-refresh timer"""
+        self.last_inference = time.time() if now is None else now
+
+    def get_stats(self):
+        return {
+            "frames_checked": self.frames_checked,
+            "frames_skipped": self.frames_skipped,
+            "skip_ratio": self.frames_skipped / self.frames_checked if self.frames_checked else 0.0,
+            "last_change": self.last_change,
+        }
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Multi-camera Traffic Congestion Detection in a single process
+The model is loaded once and run as one batch over the newest frame from every
+camera; each camera keeps its own ROI, thresholds, congestion state and
+Firebase location id
+
+Streams file (JSON):
+    [
+      {"camera": 0, "location_id": "junction_north", "roi": [100, 200, 540, 400]},
+      {"camera": "rtsp://10.0.0.12/stream1", "location_id": "junction_east",
+       "roi": [80, 180, 600, 420], "thresholds": [3, 6, 9], "confidence": 0.45}
+    ]
+"""
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import traffic_detector
+from control_server import install_signal_handlers
+from frame_pipeline import FramePacket, LatestFrameQueue
+from inference_backends import supports_batching
+from profiling import PROFILER
+from startup import StartupTimer, mark_stopping
+
+logger = logging.getLogger(__name__)
+
+
+class StreamSource:
+    """One camera: its detector state plus a capture thread feeding a latest-frame slot"""
+
+    def __init__(self, config, backend, model_path=None, firebase_url=None, firebase_api_key=None):
+        self.name = config.get("name") or config["location_id"]
+        self.detector = traffic_detector.TrafficDetector(
+            headless=True,
+            control_socket_path=None,
+            camera_source=config.get("camera", traffic_detector.CAMERA_INDEX),
+            roi=config.get("roi"),
+            thresholds=config.get("thresholds"),
+            location_id=config["location_id"],
+            confidence=config.get("confidence", traffic_detector.CONFIDENCE_THRESHOLD),
+            adaptive=False,  # The multi-stream detector controls the shared batch
+            road_mask_path=config.get("road_mask"),
+            backend=backend,
+            model_path=model_path,
+            firebase_url=firebase_url,
+            firebase_api_key=firebase_api_key,
+            zones=config.get("zones", []),
+            # Own spool per camera: each FirebaseIntegration orders and replays only its own writes
+            spool_path=traffic_detector.location_spool_path(traffic_detector.FIREBASE_SPOOL_PATH,
+                                                            config["location_id"]),
+        )
+        self.frames = LatestFrameQueue(self.name)
+        self.thread = None
+        self.frames_captured = 0
+        self.frames_inferred = 0
+        self.fps_sample = (0, time.time())
+        self.error = None
+
+    def start(self, stop_event):
+        self.thread = threading.Thread(target=self._capture_loop, args=(stop_event,),
+                                       name=f"capture-{self.name}", daemon=True)
+        self.thread.start()
+
+    def _capture_loop(self, stop_event):
+        frame_id = 0
+        while not stop_event.is_set():
+            ret, frame = self.detector.read_frame()
+            if not ret:
+                self.error = "Could not read frame from camera"
+                logger.error("[%s] %s", self.name, self.error)
+                break
+            frame_id += 1
+            self.frames_captured += 1
+            self.frames.put(FramePacket(frame_id, time.time(), frame))
+
+
+class MultiStreamDetector:
+    def __init__(self, stream_configs, backend=traffic_detector.INFERENCE_BACKEND, model_path=None, firebase_url=None,
+                 firebase_api_key=None):
+        """
+        Initialize all streams
+
+        Args:
+            stream_configs: List of per-camera dicts (camera, location_id, roi, thresholds,
+                confidence, road_mask, zones, name)
+            backend: Inference backend shared by all streams
+            model_path: Weights shared by all streams (defaults to MODEL_PATH)
+            firebase_url: Realtime Database URL (defaults to FIREBASE_URL)
+            firebase_api_key: Database auth key (defaults to FIREBASE_API_KEY)
+        """
+        if not stream_configs:
+            raise ValueError("At least one stream is required")
+        self.backend = backend
+        self.sources = [StreamSource(config, backend, model_path, firebase_url, firebase_api_key)
+                        for config in stream_configs]
+        self.controller = None
+        if traffic_detector.ADAPTIVE_INFERENCE:
+            self.controller = traffic_detector.AdaptiveInferenceController(
+                target_fps=traffic_detector.TARGET_FPS,
+                image_sizes=((traffic_detector.BACKEND_IMAGE_SIZE,) if self.sources[0].detector.fixed_imgsz
+                             else traffic_detector.INFERENCE_IMAGE_SIZES),
+                max_stride=traffic_detector.MAX_FRAME_STRIDE,
+                base_confidence=min(source.detector.confidence for source in self.sources),
+                thermal_path=traffic_detector.THERMAL_PATH
+            )
+        self.stop_event = threading.Event()
+        self.batches = 0
+        self.batch_sizes = 0
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path) as f:
+            return cls(json.load(f), **kwargs)
+
+    def setup(self):
+        """Load the model once (in the background) while every camera opens, then warm up and signal readiness"""
+        primary = self.sources[0].detector
+        startup = StartupTimer()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader") as executor:
+            model_loaded = executor.submit(startup.timed, "model", primary.setup_model)
+            with startup.phase("camera"):
+                cameras_ready = True
+                for source in self.sources:
+                    logger.info("[%s] Opening camera", source.name)
+                    if not source.detector.setup_camera():
+                        cameras_ready = False
+                        break
+            if cameras_ready:
+                with startup.phase("firebase"):
+                    for source in self.sources:
+                        source.detector.check_firebase()
+            if not model_loaded.result() or not cameras_ready:
+                return False
+
+        for source in self.sources[1:]:
+            source.detector.use_shared_model(primary)
+        if traffic_detector.WARMUP_INFERENCES:
+            with startup.phase("warmup"):
+                primary.warm_up()
+
+        report = startup.mark_ready(traffic_detector.READY_FILE, cameras=[source.name for source in self.sources],
+                                    backend=self.backend)
+        for source in self.sources:
+            for phase, seconds in report["phases"].items():
+                metrics.STARTUP_SECONDS.set(source.detector.location_id, phase, value=seconds)
+        logger.info("Ready: %s", startup.summary())
+        return True
+
+    def queue_command(self, command, args=()):
+        if command == "quit":
+            self.stop_event.set()
+        elif command == "profile":
+            PROFILER.start()
+
+    def collect_frames(self, timeout=0.5):
+        """Newest unprocessed frame from each source (waits briefly for the first one)"""
+        packets = []
+        deadline = time.time() + timeout
+        for source in self.sources:
+            packet = source.frames.get(timeout=0 if packets else max(deadline - time.time(), 0))
+            if packet is not None:
+                packets.append((source, packet))
+        return packets
+
+    def infer_batch(self, packets):
+        """Run one batched model call over every source that needs it, then post-process per source"""
+        pending = []
+        for source, packet in packets:
+            prepared = source.detector.prepare_inference(packet.frame)
+            if prepared is not None:
+                pending.append((source, prepared))
+            elif source.detector.tracker:
+                source.detector.tracker.coast(source.detector.zone_map or source.detector.roi)
+
+        if pending:
+            inputs = [model_input for _, (model_input, _, _) in pending]
+            # Shared call: the largest requested size and the lowest cutoff; each source
+            # re-applies its own cutoff when post-processing
+            image_size = max(options.get("imgsz", 640) for _, (_, _, options) in pending)
+            confidence = min(options["conf"] for _, (_, _, options) in pending)
+            if self.controller:
+                image_size = min(image_size, self.controller.image_size)
+                confidence = max(confidence, self.controller.confidence)
+
+            primary = self.sources[0].detector
+            if primary.fixed_imgsz:
+                image_size = primary.fixed_imgsz
+            options = {"conf": confidence, "imgsz": image_size, "classes": primary.vehicle_classes}
+            start = time.perf_counter()
+            with PROFILER.span("model", batch=len(inputs), imgsz=image_size):
+                if supports_batching(self.backend):
+                    results = primary.model(inputs, **options)
+                else:
+                    # Exported models take one frame per call
+                    results = [primary.model(model_input, **options)[0] for model_input in inputs]
+            latency = time.perf_counter() - start
+            if self.controller:
+                self.controller.record_inference(latency)
+
+            self.batches += 1
+            self.batch_sizes += len(pending)
+            for (source, (_, offset, options)), result in zip(pending, results):
+                metrics.INFERENCE_SECONDS.observe(source.detector.location_id, value=latency)
+                source.detector.finish_inference([result], offset, min_confidence=options["conf"])
+                source.frames_inferred += 1
+
+        outputs = []
+        for source, packet in packets:
+            all_detections, detections_in_roi = source.detector.last_detections
+            congestion_status, _ = source.detector.analyze_congestion(detections_in_roi)
+            outputs.append((source, all_detections, detections_in_roi, congestion_status))
+        return outputs
+
+    def run(self):
+        """Main multi-camera detection loop"""
+        if not self.setup():
+            self.cleanup()
+            return False
+
+        install_signal_handlers(self.queue_command)
+        self.sources[0].detector.start_metrics_server()
+        for source in self.sources:
+            source.start(self.stop_event)
+
+        logger.info("Multi-stream detection started with %d cameras", len(self.sources))
+
+        report_time = time.time()
+        try:
+            while not self.stop_event.is_set():
+                if all(source.error for source in self.sources):
+                    break
+
+                packets = self.collect_frames()
+                if not packets:
+                    continue
+
+                if self.controller and not self.controller.should_infer():
+                    continue
+
+                for source, all_detections, detections_in_roi, status in self.infer_batch(packets):
+                    source.detector.publish_status(status, all_detections, detections_in_roi)
+                    metrics.FRAMES_PROCESSED.inc(source.detector.location_id)
+                PROFILER.frame_done()
+
+                if time.time() - report_time >= 10:
+                    report_time = time.time()
+                    self.report()
+
+        except KeyboardInterrupt:
+            logger.info("Detection stopped by user")
+        finally:
+            self.cleanup()
+        return True
+
+    def report(self):
+        """Log per-source throughput and status"""
+        now = time.time()
+        for source in self.sources:
+            previous_count, previous_time = source.fps_sample
+            if now > previous_time:
+                metrics.FPS.set(source.detector.location_id,
+                                value=(source.frames_inferred - previous_count) / (now - previous_time))
+            source.fps_sample = (source.frames_inferred, now)
+        average_batch = self.batch_sizes / self.batches if self.batches else 0
+        logger.info("Batches: %d | avg size %.1f", self.batches, average_batch)
+        for source in self.sources:
+            detector = source.detector
+            logger.info("[%s] captured %d | inferred %d | dropped %d | status %s", source.name, source.frames_captured,
+                        source.frames_inferred, source.frames.dropped, detector.last_congestion_status)
+
+    def get_stats(self):
+        return {
+            source.name: {
+                "location_id": source.detector.location_id,
+                "frames_captured": source.frames_captured,
+                "frames_inferred": source.frames_inferred,
+                "capture_dropped": source.frames.dropped,
+                "status": source.detector.last_congestion_status,
+            }
+            for source in self.sources
+        }
+
+    def cleanup(self):
+        self.stop_event.set()
+        PROFILER.stop()
+        mark_stopping(traffic_detector.READY_FILE)
+        for source in self.sources:
+            source.detector.cleanup_metrics()
+            source.frames.close()
+            if source.thread:
+                source.thread.join(timeout=2.0)
+            if source.detector.cap:
+                source.detector.cap.release()
+            if source.detector.firebase:
+                if source.detector.rollup:
+                    source.detector.firebase.publish_rollups(source.detector.rollup.flush())
+                source.detector.firebase.close()
+        logger.info("Resources cleaned up. Goodbye!")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Durable store-and-forward spool for Firebase writes
+Every outgoing record is written to a local SQLite database before it is sent and
+removed once Firebase acknowledges it, so nothing is lost while the uplink is down
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class OfflineSpool:
+    def __init__(self, db_path, max_records=100000, max_age=7 * 24 * 3600):
+        """
+        Open (or create) the spool database
+
+        Args:
+            db_path: SQLite file to store pending records in
+            max_records: Oldest records are evicted beyond this many
+            max_age: Records older than this many seconds are evicted
+        """
+        self.db_path = db_path
+        self.max_records = max_records
+        self.max_age = max_age
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # Survives process crashes; fewer SD card flushes
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " key TEXT NOT NULL UNIQUE,"
+            " method TEXT NOT NULL,"
+            " path TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " created REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS spool_created ON spool (created)")
+
+        self._puts_since_evict = 0
+        self.evicted = 0
+        self.evict()
+
+    def put_many(self, records):
+        """
+        Persist records before sending them. Returns their row ids
+
+        Each record is (method, path, payload). A PUT to a path that is already spooled
+        replaces it, so only the newest current-state document is kept; POSTs are
+        always kept individually.
+        """
+        now = time.time()
+        ids = []
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for method, path, payload in records:
+                    key = path if method == "put" else f"{path}#{uuid.uuid4().hex}"
+                    cursor = self._conn.execute(
+                        "INSERT OR REPLACE INTO spool (key, method, path, payload, created) VALUES (?, ?, ?, ?, ?)",
+                        (key, method, path, json.dumps(payload, separators=(',', ':')), now)
+                    )
+                    ids.append(cursor.lastrowid)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._puts_since_evict += len(records)
+
+        if self._puts_since_evict >= 500:
+            self.evict()
+        return ids
+
+    def ack(self, ids):
+        """Remove records Firebase has acknowledged"""
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM spool WHERE id = ?", [(row_id,) for row_id in ids])
+
+    def pending(self, limit, exclude_ids=()):
+        """Oldest spooled records as (id, method, path, payload) tuples"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, method, path, payload FROM spool ORDER BY id LIMIT ?",
+                (limit + len(exclude_ids),)
+            ).fetchall()
+        records = []
+        for row_id, method, path, payload in rows:
+            if row_id in exclude_ids:
+                continue
+            records.append((row_id, method, path, json.loads(payload)))
+            if len(records) >= limit:
+                break
+        return records
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def evict(self):
+        """Drop records past max_age and the oldest records beyond max_records"""
+        with self._lock:
+            self._puts_since_evict = 0
+            cursor = self._conn.execute("DELETE FROM spool WHERE created < ?", (time.time() - self.max_age,))
+            evicted = cursor.rowcount
+            cursor = self._conn.execute(
+                "DELETE FROM spool WHERE id IN ("
+                " SELECT id FROM spool ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                (self.max_records,)
+            )
+            evicted += cursor.rowcount
+        self.evicted += evicted
+        return evicted
+
+    def get_stats(self):
+        with self._lock:
+            pending, oldest = self._conn.execute("SELECT COUNT(*), MIN(created) FROM spool").fetchone()
+        return {
+            "pending": pending,
+            "oldest_age_s": time.time() - oldest if oldest else 0.0,
+            "evicted": self.evicted,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Overlay renderer for Traffic Congestion Detection
+Draws detections, the ROI (or zones) and status text onto a reusable copy of
+the frame, so the capture buffer is never written to and nothing is drawn
+unless someone asks for an annotated frame. Boxes come straight from the
+columnar detection arrays with their in-ROI flag, and label text sizes are
+cached per class and confidence bucket, so a crowded frame costs a few cv2
+calls per box and no getTextSize calls once the labels have been seen
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+LABEL_SCALE = 0.5
+LABEL_THICKNESS = 2
+CONFIDENCE_BUCKETS = 100  # Labels show two decimals, so 100 buckets cover every distinct label
+
+WHITE = (255, 255, 255)
+IN_ROI_COLOR = (0, 0, 255)    # Red: vehicles inside the ROI
+OUTSIDE_COLOR = (0, 255, 0)   # Green: everything else
+
+
+class OverlayRenderer:
+    def __init__(self, status_colors=None):
+        """
+        Initialize the renderer (the overlay buffer is allocated on first use)
+
+        Args:
+            status_colors: Congestion status -> BGR color, for zone labels
+        """
+        self.status_colors = status_colors or {}
+        self.labels = {}   # (class_id, confidence bucket) -> (text, width, height)
+        self.buffer = None
+        self.frames = 0
+
+    def label(self, class_names, class_id, confidence):
+        """Label text and its size for a detection, measured once per class and bucket"""
+        bucket = int(round(confidence * CONFIDENCE_BUCKETS))
+        key = (class_id, bucket)
+        label = self.labels.get(key)
+        if label is None:
+            text = f"{class_names[class_id]}: {bucket / CONFIDENCE_BUCKETS:.2f}"
+            (width, height), _ = cv2.getTextSize(text, FONT, LABEL_SCALE, LABEL_THICKNESS)
+            label = self.labels[key] = (text, width, height)
+        return label
+
+    def begin(self, frame):
+        """Copy the frame into the overlay buffer and return it for drawing"""
+        if self.buffer is None or self.buffer.shape != frame.shape or self.buffer.dtype != frame.dtype:
+            self.buffer = np.empty_like(frame)
+        np.copyto(self.buffer, frame)
+        return self.buffer
+
+    def draw_detections(self, canvas, detections):
+        """Boxes and labels for a DetectionView, colored by its per-detection in-ROI flag"""
+        if not len(detections):
+            return
+        class_names = detections.batch.class_names
+        for (x1, y1, x2, y2), class_id, confidence, in_roi in zip(
+                detections.boxes.tolist(), detections.class_ids.tolist(),
+                detections.scores.tolist(), detections.in_roi.tolist()):
+            color = IN_ROI_COLOR if in_roi else OUTSIDE_COLOR
+            cv2.rectangle(canvas, (x1, y1), (x2, y2), color, 2)
+            text, width, height = self.label(class_names, class_id, confidence)
+            cv2.rectangle(canvas, (x1, y1 - height - 10), (x1 + width, y1), color, -1)
+            cv2.putText(canvas, text, (x1, y1 - 5), FONT, LABEL_SCALE, WHITE, LABEL_THICKNESS)
+
+    def draw_region(self, canvas, roi, zone_map=None, zone_status=None):
+        """The ROI rectangle, or each zone in its status color with its vehicle count"""
+        if zone_map is None:
+            x1, y1, x2, y2 = (int(value) for value in roi)
+            cv2.rectangle(canvas, (x1, y1), (x2, y2), WHITE, 2)
+            cv2.putText(canvas, "ROI", (x1, y1 - 10), FONT, 0.6, WHITE, 2)
+            return
+        cv2.polylines(canvas, zone_map.polygons, True, WHITE, 2)
+        for name, polygon in zip(zone_map.names, zone_map.polygons):
+            lane = (zone_status or {}).get(name)
+            color = self.status_colors.get(lane["status"], WHITE) if lane else WHITE
+            text = f"{name}: {lane['vehicles']}" if lane else name
+            x, y = polygon.min(axis=0).tolist()
+            cv2.putText(canvas, text, (x, y - 10), FONT, 0.6, color, 2)
+
+    def render(self, frame, detections, status_lines=(), roi=None, zone_map=None, zone_status=None):
+        """
+        Annotated copy of the frame
+
+        The result is the overlay buffer, overwritten by the next call: show or save it
+        before rendering again.
+
+        Args:
+            frame: Source frame (left untouched)
+            detections: DetectionView over every detection
+            status_lines: (text, scale, color) lines for the top-left corner
+            roi: [x1, y1, x2, y2] region drawn when there are no zones
+            zone_map: Optional ZoneMap to draw instead of the ROI
+            zone_status: Per-zone status from the last analysis, for the zone labels
+        """
+        canvas = self.begin(frame)
+        if roi is not None or zone_map is not None:
+            self.draw_region(canvas, roi, zone_map, zone_status)
+        self.draw_detections(canvas, detections)
+
+        y = 30
+        for text, scale, color in status_lines:
+            cv2.putText(canvas, text, (10, y), FONT, scale, color, 2)
+            y += 28
+        cv2.putText(canvas, time.strftime("%Y-%m-%d %H:%M:%S"), (10, canvas.shape[0] - 10), FONT, 0.5, WHITE, 1)
+        self.frames += 1
+        return canvas
+
+    def get_stats(self):
+        return {"frames": self.frames, "cached_labels": len(self.labels)}
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Opt-in profiling for Traffic Congestion Detection
+While armed, records a span for every stage of every frame (camera read, model
+call, post-process, annotation, Firebase write, ...) with its thread, for a
+bounded number of frames or seconds, then switches itself off and writes a
+Chrome trace (open in chrome://tracing or https://ui.perfetto.dev) or JSONL.
+Optionally also runs cProfile over a sample of inference calls
+
+    python traffic_detector.py --profile 300
+    echo "profile 300" | nc -U /tmp/traffic_detector.sock
+    kill -s RTMIN <pid>
+"""
+
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+TRACE_FORMATS = ("chrome", "jsonl")
+
+_INACTIVE = nullcontext()
+
+
+class FrameProfiler:
+    def __init__(self, output_dir=".", trace_format="chrome", max_frames=300, max_seconds=60.0,
+                 cprofile=False, cprofile_span="model", cprofile_every=5):
+        """
+        Initialize the profiler (disarmed)
+
+        Args:
+            output_dir: Where trace and cProfile files are written
+            trace_format: "chrome" (trace event JSON) or "jsonl" (one span per line)
+            max_frames: Frames recorded per session before it stops itself
+            max_seconds: Seconds recorded per session before it stops itself
+            cprofile: Also collect a cProfile dump
+            cprofile_span: Span name cProfile runs inside
+            cprofile_every: Profile one in this many cprofile_span spans
+        """
+        self.output_dir = output_dir
+        self.trace_format = trace_format
+        self.max_frames = max_frames
+        self.max_seconds = max_seconds
+        self.cprofile = cprofile
+        self.cprofile_span = cprofile_span
+        self.cprofile_every = cprofile_every
+
+        self.active = False
+        self.spans = []
+        self.frames = 0
+        self.started_at = 0.0
+        self.session_frames = max_frames
+        self.session_seconds = max_seconds
+        self.profile = None
+        self.profile_calls = 0
+        self.lock = threading.Lock()
+        self.last_outputs = []
+        self.listener = None  # Optional callable (name, seconds) run as each span ends, armed or not
+
+    def start(self, frames=None, seconds=None, cprofile=None):
+        """Arm the profiler for a bounded window; returns False if a session is already running"""
+        with self.lock:
+            if self.active:
+                return False
+            self.spans = []
+            self.frames = 0
+            self.session_frames = frames or self.max_frames
+            self.session_seconds = seconds or self.max_seconds
+            self.profile = cProfile.Profile() if (self.cprofile if cprofile is None else cprofile) else None
+            self.profile_calls = 0
+            self.started_at = time.perf_counter()
+            self.active = True
+        logger.info("Profiling started: %s frames or %.0fs", self.session_frames, self.session_seconds)
+        return True
+
+    def span(self, name, **args):
+        """Context manager timing one stage; costs two attribute checks while disarmed and unobserved"""
+        if not self.active:
+            return _INACTIVE if self.listener is None else self._observe(name)
+        return self._record(name, args)
+
+    @contextmanager
+    def _observe(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.listener(name, time.perf_counter() - start)
+
+    @contextmanager
+    def _record(self, name, args):
+        profile = None
+        if self.profile is not None and name == self.cprofile_span:
+            with self.lock:
+                self.profile_calls += 1
+                sampled = (self.profile_calls - 1) % self.cprofile_every == 0
+            profile = self.profile if sampled else None
+        start = time.perf_counter_ns()
+        if profile is not None:
+            try:
+                profile.enable()
+            except ValueError:
+                profile = None  # Another thread is already being profiled
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            end = time.perf_counter_ns()
+            thread = threading.current_thread()
+            self.spans.append((name, thread.ident, thread.name, start, end - start, self.frames, args))
+            if self.listener is not None:
+                self.listener(name, (end - start) / 1e9)
+
+    def frame_done(self):
+        """Mark the end of one output frame; stops the session when its window is used up"""
+        if not self.active:
+            return
+        self.frames += 1
+        if (self.frames >= self.session_frames or
+                time.perf_counter() - self.started_at >= self.session_seconds):
+            self.stop()
+
+    def stop(self):
+        """Disarm and write the trace (and cProfile dump); returns the written paths"""
+        with self.lock:
+            if not self.active:
+                return []
+            self.active = False
+            spans, self.spans = self.spans, []
+            profile, self.profile = self.profile, None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        outputs = [self._write_trace(spans, stamp)]
+        if profile is not None:
+            path = os.path.join(self.output_dir, f"profile_{stamp}.prof")
+            profile.dump_stats(path)
+            outputs.append(path)
+        self.last_outputs = outputs
+        logger.info("Profiling finished: %s frames, %d spans -> %s", self.frames, len(spans), ", ".join(outputs))
+        return outputs
+
+    def _write_trace(self, spans, stamp):
+        origin = min((span[3] for span in spans), default=0)
+        if self.trace_format == "jsonl":
+            path = os.path.join(self.output_dir, f"trace_{stamp}.jsonl")
+            with open(path, "w") as f:
+                for name, tid, thread_name, start, duration, frame, args in spans:
+                    f.write(json.dumps({
+                        "name": name, "thread": thread_name, "frame": frame,
+                        "start_us": (start - origin) / 1000, "duration_us": duration / 1000, **args
+                    }) + "\n")
+            return path
+
+        pid = os.getpid()
+        events = []
+        threads = {}
+        for name, tid, thread_name, start, duration, frame, args in spans:
+            threads[tid] = thread_name
+            events.append({
+                "name": name, "ph": "X", "pid": pid, "tid": tid,
+                "ts": (start - origin) / 1000, "dur": duration / 1000,
+                "args": dict(args, frame=frame),
+            })
+        for tid, thread_name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+        path = os.path.join(self.output_dir, f"trace_{stamp}.json")
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return path
+
+    def get_state(self):
+        return {
+            "active": self.active,
+            "frames": self.frames,
+            "spans": len(self.spans),
+            "last_outputs": self.last_outputs,
+        }
+
+
+# Process-wide profiler shared by the detector and the Firebase integration
+PROFILER = FrameProfiler()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Publish policy for Traffic Congestion Detection
+Decides when traffic state is worth writing to Firebase: immediately when the
+congestion level (overall or of any lane), the ROI vehicle count or the
+vehicle-type mix changes beyond configurable deltas, otherwise only a small
+periodic heartbeat. Tracks change-to-publish latency and write volume
+"""
+
+import time
+from collections import deque
+
+PUBLISH_FULL = "full"
+PUBLISH_HEARTBEAT = "heartbeat"
+
+
+class PublishPolicy:
+    def __init__(self, count_delta=1, mix_delta=2, heartbeat_interval=60.0, min_interval=1.0):
+        """
+        Initialize the policy
+
+        Args:
+            count_delta: Change in ROI vehicle count that triggers a write
+            mix_delta: Total change across per-type vehicle counts that triggers a write
+            heartbeat_interval: Seconds without a write before a heartbeat is sent
+            min_interval: Minimum seconds between full writes (bursts are held, not dropped)
+        """
+        self.count_delta = count_delta
+        self.mix_delta = mix_delta
+        self.heartbeat_interval = heartbeat_interval
+        self.min_interval = min_interval
+
+        self.published = None       # (level, vehicle_count, type_counts, lane_levels) last written
+        self.last_full = None
+        self.last_write = None
+        self.change_since = None    # When the unpublished change was first seen
+        self.latencies = deque(maxlen=500)
+        self.full_writes = 0
+        self.heartbeats = 0
+        self.forced_writes = 0
+        self.bytes_written = 0
+        self.started = time.time()
+
+    def has_changed(self, level, vehicle_count, type_counts, lane_levels=()):
+        if self.published is None:
+            return True
+        published_level, published_count, published_types, published_lanes = self.published
+        if level != published_level or abs(vehicle_count - published_count) >= self.count_delta:
+            return True
+        if tuple(lane_levels) != published_lanes:
+            return True
+        mix_change = sum(
+            abs(type_counts.get(name, 0) - published_types.get(name, 0))
+            for name in set(type_counts) | set(published_types)
+        )
+        return mix_change >= self.mix_delta
+
+    def check(self, level, vehicle_count, type_counts, now=None, lane_levels=()):
+        """PUBLISH_FULL, PUBLISH_HEARTBEAT or None for the current state (lane_levels: level per zone)"""
+        now = time.time() if now is None else now
+        if self.has_changed(level, vehicle_count, type_counts, lane_levels):
+            if self.change_since is None:
+                self.change_since = now
+            if self.last_full is None or now - self.last_full >= self.min_interval:
+                return PUBLISH_FULL
+            return None
+
+        # Back to what was last published: nothing left to send
+        self.change_since = None
+        if self.last_write is None or now - self.last_write >= self.heartbeat_interval:
+            return PUBLISH_HEARTBEAT
+        return None
+
+    def record(self, decision, level, vehicle_count, type_counts, payload_bytes, now=None, forced=False,
+               lane_levels=()):
+        """Note a write that was handed to the uploader"""
+        now = time.time() if now is None else now
+        self.last_write = now
+        self.bytes_written += payload_bytes
+        if decision == PUBLISH_HEARTBEAT:
+            self.heartbeats += 1
+            return
+        self.full_writes += 1
+        self.forced_writes += forced
+        if self.change_since is not None:
+            self.latencies.append(now - self.change_since)
+        self.change_since = None
+        self.last_full = now
+        self.published = (level, vehicle_count, dict(type_counts), tuple(lane_levels))
+
+    def get_stats(self):
+        elapsed_minutes = max(time.time() - self.started, 1.0) / 60
+        latencies = sorted(self.latencies)
+        return {
+            "full_writes": self.full_writes,
+            "heartbeats": self.heartbeats,
+            "forced_writes": self.forced_writes,
+            "writes_per_minute": round((self.full_writes + self.heartbeats) / elapsed_minutes, 2),
+            "bytes_written": self.bytes_written,
+            "change_latency_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else 0.0,
+            "change_latency_max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        }
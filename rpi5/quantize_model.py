@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Produce an INT8 version of the traffic congestion model and check it against FP32
+
+Exports best.pt to ONNX (via the backend cache), calibrates static INT8
+quantization with ONNX Runtime on a directory of sample frames (built into model
+inputs exactly as at inference, ROI crop included), then runs both
+models over the frames and writes a report of per-class detection agreement,
+congestion status agreement and latency
+
+Usage:
+    pip install onnx onnxruntime
+    python quantize_model.py --frames calibration_frames/ --report quantization_report.json
+
+The INT8 model is cached next to the FP32 export and can then be used with
+    python traffic_detector.py --backend onnx-int8
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import traffic_detector
+from benchmark import latency_summary
+from inference_backends import cached_export_path, export_model
+from logging_setup import setup_logging
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+IOU_MATCH_THRESHOLD = 0.5
+
+
+def list_frames(frames_dir):
+    paths = []
+    for extension in IMAGE_EXTENSIONS:
+        paths.extend(glob.glob(os.path.join(frames_dir, f"*{extension}")))
+        paths.extend(glob.glob(os.path.join(frames_dir, f"*{extension.upper()}")))
+    return sorted(set(paths))
+
+
+def letterbox(frame, imgsz):
+    """Resize with unchanged aspect ratio and pad to imgsz x imgsz, as ultralytics does"""
+    height, width = frame.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    new_width, new_height = int(round(width * scale)), int(round(height * scale))
+    resized = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - new_height) // 2, (imgsz - new_width) // 2
+    canvas[top:top + new_height, left:left + new_width] = resized
+    return canvas
+
+
+class FrameCalibrationReader:
+    """
+    Feeds preprocessed sample frames to ONNX Runtime's static quantization calibrator
+
+    Each frame goes through build_input (TrafficDetector.build_input), so calibration
+    sees the same ROI crops, road masking and input size as inference does.
+    """
+
+    def __init__(self, frame_paths, input_name, imgsz, build_input):
+        self.frame_paths = list(frame_paths)
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self.build_input = build_input
+        self.index = 0
+
+    def get_next(self):
+        while self.index < len(self.frame_paths):
+            frame = cv2.imread(self.frame_paths[self.index])
+            self.index += 1
+            if frame is None:
+                continue
+            model_input, _, options = self.build_input(frame)
+            image = letterbox(model_input, options.get("imgsz", self.imgsz))[:, :, ::-1]  # BGR -> RGB
+            tensor = np.ascontiguousarray(image.transpose(2, 0, 1), dtype=np.float32)[None] / 255.0
+            return {self.input_name: tensor}
+        return None
+
+    def rewind(self):
+        self.index = 0
+
+
+def quantize(weights_path, frames, imgsz, build_input, max_calibration_frames=200):
+    """Export FP32 ONNX if needed and write the calibrated INT8 model next to it (build_input: frame -> model input)"""
+    from onnxruntime import InferenceSession
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+
+    fp32_path = cached_export_path(weights_path, "onnx", imgsz)
+    if not os.path.exists(fp32_path):
+        fp32_path = export_model(weights_path, "onnx", imgsz)
+    int8_path = cached_export_path(weights_path, "onnx-int8", imgsz)
+
+    input_name = InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    calibration = frames[:max_calibration_frames]
+    print(f"Calibrating INT8 quantization on {len(calibration)} frames...")
+    quantize_static(
+        fp32_path,
+        int8_path,
+        FrameCalibrationReader(calibration, input_name, imgsz, build_input),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+    print(f"INT8 model written to {int8_path}")
+    return fp32_path, int8_path
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU of two (N, 4) / (M, 4) xyxy arrays"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)))
+    a = boxes_a[:, None, :].astype(np.float64)
+    b = boxes_b[None, :, :].astype(np.float64)
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    intersection = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return intersection / np.maximum(area_a + area_b - intersection, 1e-9)
+
+
+def match_detections(reference, candidate):
+    """Greedy same-class IoU matching; returns per-class (matched, reference only, candidate only)"""
+    stats = {}
+    for class_id in set(reference.class_ids.tolist()) | set(candidate.class_ids.tolist()):
+        ref_boxes = reference.boxes[reference.class_ids == class_id]
+        cand_boxes = candidate.boxes[candidate.class_ids == class_id]
+        iou = box_iou(ref_boxes, cand_boxes)
+        matched = 0
+        while iou.size and iou.max() >= IOU_MATCH_THRESHOLD:
+            i, j = np.unravel_index(np.argmax(iou), iou.shape)
+            iou[i, :] = 0
+            iou[:, j] = 0
+            matched += 1
+        stats[class_id] = (matched, len(ref_boxes) - matched, len(cand_boxes) - matched)
+    return stats
+
+
+def evaluate(detector_fp32, detector_int8, frames):
+    """Run both detectors over the frames and compare detections, status and latency"""
+    per_class = {}
+    status_matches = 0
+    latencies = {"fp32": [], "int8": []}
+    evaluated = 0
+
+    # Warm up both runtimes so the first frame's session setup isn't counted
+    warmup = cv2.imread(frames[0])
+    if warmup is not None:
+        detector_fp32.process_frame(warmup)
+        detector_int8.process_frame(warmup)
+
+    for path in frames:
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+
+        outputs = {}
+        for name, detector in (("fp32", detector_fp32), ("int8", detector_int8)):
+            start = time.perf_counter()
+            all_detections, detections_in_roi = detector.process_frame(frame)
+            latencies[name].append(time.perf_counter() - start)
+            status, _ = detector.analyze_congestion(detections_in_roi)
+            outputs[name] = (all_detections, status)
+
+        evaluated += 1
+        if outputs["fp32"][1] == outputs["int8"][1]:
+            status_matches += 1
+
+        for class_id, (matched, fp32_only, int8_only) in match_detections(outputs["fp32"][0], outputs["int8"][0]).items():
+            totals = per_class.setdefault(class_id, [0, 0, 0])
+            totals[0] += matched
+            totals[1] += fp32_only
+            totals[2] += int8_only
+
+    class_names = detector_fp32.class_names
+    report = {
+        "frames": evaluated,
+        "status_agreement": status_matches / evaluated if evaluated else None,
+        "classes": {},
+        "latency_ms": {},
+    }
+    for class_id, (matched, fp32_only, int8_only) in sorted(per_class.items()):
+        report["classes"][class_names[class_id]] = {
+            "matched": matched,
+            "fp32_only": fp32_only,
+            "int8_only": int8_only,
+            # Share of FP32 detections the INT8 model reproduced, and of INT8 detections FP32 agrees with
+            "recall_vs_fp32": matched / (matched + fp32_only) if matched + fp32_only else None,
+            "precision_vs_fp32": matched / (matched + int8_only) if matched + int8_only else None,
+        }
+    for name, values in latencies.items():
+        if values:
+            report["latency_ms"][name] = latency_summary(values)
+    if report["latency_ms"].get("fp32") and report["latency_ms"].get("int8"):
+        report["speedup"] = report["latency_ms"]["fp32"]["mean"] / report["latency_ms"]["int8"]["mean"]
+    return report
+
+
+def make_detector(backend):
+    """A detector with only the model path enabled (no gating, controller or Firebase)"""
+    detector = traffic_detector.TrafficDetector(
+        headless=True, control_socket_path=None, adaptive=False, enable_firebase=False, backend=backend
+    )
+    detector.motion_gate = None
+    detector.tracker = None  # Compare per-frame detections, not tracked or smoothed counts
+    detector.estimator = None
+    if not detector.setup_model():
+        raise RuntimeError(f"Could not load the {backend} model")
+    return detector
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the traffic model to INT8 and compare it with FP32")
+    parser.add_argument("--frames", required=True, help="Directory of sample camera frames (calibration and evaluation)")
+    parser.add_argument("--weights", default=traffic_detector.MODEL_PATH)
+    parser.add_argument("--imgsz", type=int, default=traffic_detector.BACKEND_IMAGE_SIZE)
+    parser.add_argument("--calibration-frames", type=int, default=200)
+    parser.add_argument("--report", default="quantization_report.json")
+    args = parser.parse_args()
+    setup_logging(traffic_detector.LOG_LEVEL)
+
+    frames = list_frames(args.frames)
+    if not frames:
+        print(f"No images found in {args.frames}")
+        return False
+
+    traffic_detector.BACKEND_IMAGE_SIZE = args.imgsz
+    traffic_detector.MODEL_PATH = args.weights
+    # The FP32 detector (which exports the FP32 model on first use) also builds the calibration inputs
+    detector_fp32 = make_detector("onnx")
+    fp32_path, int8_path = quantize(args.weights, frames, args.imgsz, detector_fp32.build_input,
+                                    args.calibration_frames)
+
+    print(f"Comparing FP32 and INT8 on {len(frames)} frames...")
+    report = evaluate(detector_fp32, make_detector("onnx-int8"), frames)
+    report["fp32_model"] = fp32_path
+    report["int8_model"] = int8_path
+    report["fp32_size_mb"] = os.path.getsize(fp32_path) / 1e6
+    report["int8_size_mb"] = os.path.getsize(int8_path) / 1e6
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print("=" * 60)
+    print(f"Status agreement: {report['status_agreement']:.1%} over {report['frames']} frames")
+    for class_name, stats in report["classes"].items():
+        recall = stats["recall_vs_fp32"]
+        print(f"  {class_name}: {stats['matched']} matched | recall vs FP32 "
+              f"{'n/a' if recall is None else f'{recall:.1%}'}")
+    for name, latency in report["latency_ms"].items():
+        print(f"  {name}: mean {latency['mean']:.1f}ms | p95 {latency['p95']:.1f}ms")
+    print(f"Report written to {args.report}")
+    print("=" * 60)
+    return True
+
+
+if __name__ == "__main__":
+    if not main():
+        sys.exit(1)
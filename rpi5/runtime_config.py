@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Runtime configuration for Traffic Congestion Detection
+One set of settings layered from the built-in defaults, firebase_config.py, a
+JSON file, TRAFFIC_* environment variables and --set command line overrides
+(later layers win). The file is watched so settings like the ROI, thresholds
+and publish intervals can change without a restart; reload() reports exactly
+which keys changed so only those are applied
+
+    {"roi": [80, 220, 560, 420], "thresholds": [3, 5, 8], "publish_heartbeat_interval": 30}
+    TRAFFIC_ROI="[80, 220, 560, 420]" python traffic_detector.py
+    python traffic_detector.py --set location_id=camera_007
+"""
+
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+ENV_PREFIX = "TRAFFIC_"
+
+# firebase_config.py names -> setting keys
+FIREBASE_CONFIG_KEYS = {
+    "FIREBASE_URL": "firebase_url",
+    "FIREBASE_API_KEY": "firebase_api_key",
+    "LOCATION_ID": "location_id",
+}
+FIREBASE_CONFIG_PLACEHOLDER = "your-project-id"
+
+
+def parse_value(text):
+    """A JSON value if the text parses as one, else the text itself"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def parse_overrides(items):
+    """['key=value', ...] from the command line -> {key: value}"""
+    overrides = {}
+    for item in items or ():
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"Expected key=value, got '{item}'")
+        overrides[key.strip()] = parse_value(value.strip())
+    return overrides
+
+
+def firebase_config_settings():
+    """Settings filled in in firebase_config.py (values still holding the template placeholder are skipped)"""
+    try:
+        import firebase_config
+    except ImportError:
+        return {}
+    settings = {}
+    for name, key in FIREBASE_CONFIG_KEYS.items():
+        value = getattr(firebase_config, name, None)
+        if value is None or (isinstance(value, str) and FIREBASE_CONFIG_PLACEHOLDER in value):
+            continue
+        settings[key] = value
+    return settings
+
+
+def check_type(key, value, default):
+    """Validate a value against the type of its default; returns the normalized value"""
+    if default is None:
+        return value
+    if isinstance(default, bool):
+        if not isinstance(value, bool):
+            raise ValueError(f"{key} must be true or false")
+        return value
+    if isinstance(default, (int, float)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{key} must be a number")
+        return type(default)(value) if isinstance(default, float) else value
+    if isinstance(default, (list, tuple)):
+        if not isinstance(value, (list, tuple)) or len(value) != len(default):
+            raise ValueError(f"{key} must be a list of {len(default)} values")
+        if not all(isinstance(item, (int, float)) and not isinstance(item, bool) for item in value):
+            raise ValueError(f"{key} must contain numbers")
+        return list(value)
+    if isinstance(default, str) and not isinstance(value, str):
+        raise ValueError(f"{key} must be a string")
+    return value
+
+
+class RuntimeConfig:
+    def __init__(self, defaults, path=None, overrides=None, restart_keys=(), untyped_keys=(), validate=None,
+                 env=None):
+        """
+        Initialize the configuration (call load() before reading values)
+
+        Args:
+            defaults: Every known key with its built-in default
+            path: Optional JSON file with overrides, watched for changes
+            overrides: Command line values, applied on top of everything else
+            restart_keys: Keys that only take effect after a restart
+            untyped_keys: Keys whose values may have any type (e.g. a camera index or URL)
+            validate: Optional callable(values) raising ValueError for invalid combinations
+            env: Environment mapping (defaults to os.environ)
+        """
+        self.defaults = dict(defaults)
+        self.path = path
+        self.overrides = dict(overrides or {})
+        self.restart_keys = set(restart_keys)
+        self.untyped_keys = set(untyped_keys)
+        self.validate = validate
+        self.env = os.environ if env is None else env
+
+        self.values = {}
+        self.mtime = None
+        self.reloads = 0
+        self.lock = threading.Lock()
+        self.watcher = None
+        self.stop_event = threading.Event()
+
+    def _file_settings(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}, None
+        mtime = os.path.getmtime(self.path)
+        with open(self.path) as f:
+            settings = json.load(f)
+        if not isinstance(settings, dict):
+            raise ValueError(f"{self.path} must contain a JSON object")
+        return settings, mtime
+
+    def _env_settings(self):
+        return {key: parse_value(self.env[ENV_PREFIX + key.upper()])
+                for key in self.defaults if ENV_PREFIX + key.upper() in self.env}
+
+    def _build(self):
+        """Merge and validate every layer; returns (values, file mtime)"""
+        file_settings, mtime = self._file_settings()
+        values = dict(self.defaults)
+        for layer in (firebase_config_settings(), file_settings, self._env_settings(), self.overrides):
+            unknown = set(layer) - set(self.defaults)
+            if unknown:
+                raise ValueError(f"Unknown setting(s): {', '.join(sorted(unknown))}")
+            values.update(layer)
+        for key, value in values.items():
+            if key not in self.untyped_keys:
+                values[key] = check_type(key, value, self.defaults[key])
+        if self.validate:
+            self.validate(values)
+        return values, mtime
+
+    def load(self):
+        """Build the initial values; raises ValueError (or OSError) if they are invalid"""
+        values, mtime = self._build()
+        with self.lock:
+            self.values = values
+            self.mtime = mtime
+        return dict(values)
+
+    def reload(self):
+        """
+        Rebuild the values; returns {key: (old, new)} for the keys that changed
+
+        An invalid file leaves the current values untouched and returns None.
+        """
+        try:
+            values, mtime = self._build()
+        except (OSError, ValueError) as e:
+            logger.error("Config not reloaded, keeping current settings: %s", e)
+            with self.lock:
+                self.mtime = self._current_mtime()  # Don't retry the same broken file
+            return None
+        with self.lock:
+            changes = {key: (self.values.get(key), value) for key, value in values.items()
+                       if self.values.get(key) != value}
+            restart = sorted(self.restart_keys & set(changes))
+            for key in restart:
+                values[key] = self.values[key]  # Keep reporting what is actually running
+                del changes[key]
+            self.values = values
+            self.mtime = mtime
+            self.reloads += 1
+        if restart:
+            logger.warning("Changed setting(s) %s take effect after a restart", ", ".join(restart))
+        return changes
+
+    def get(self, key):
+        with self.lock:
+            return self.values[key]
+
+    def _current_mtime(self):
+        try:
+            return os.path.getmtime(self.path) if self.path else None
+        except OSError:
+            return None
+
+    def changed_on_disk(self):
+        """True when the watched file was created, modified or removed since the last (re)load"""
+        with self.lock:
+            return self._current_mtime() != self.mtime
+
+    def watch(self, on_change, interval=2.0):
+        """Poll the file's mtime on a daemon thread and call on_change() when it changes"""
+        if not self.path or self.watcher:
+            return
+
+        def poll():
+            while not self.stop_event.wait(interval):
+                if self.changed_on_disk():
+                    on_change()
+
+        self.stop_event.clear()
+        self.watcher = threading.Thread(target=poll, name="config-watcher", daemon=True)
+        self.watcher.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.watcher:
+            self.watcher.join(timeout=1.0)
+            self.watcher = None
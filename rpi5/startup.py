@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Startup timing and readiness for Traffic Congestion Detection
+Times each startup phase (imports, model load, camera, Firebase check, warm-up),
+even when phases overlap on different threads, and tells the supervisor when
+the detector is actually producing results: sd_notify(READY=1) under a systemd
+Type=notify unit and/or a JSON readiness file with the breakdown
+
+    [Service]
+    Type=notify
+    NotifyAccess=main
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+# As early as the detector can see: traffic_detector imports this module first
+PROCESS_START = time.time()
+
+
+def sd_notify(message):
+    """Send a state line to systemd's notify socket; False when not running under Type=notify"""
+    path = os.environ.get("NOTIFY_SOCKET")
+    if not path:
+        return False
+    if path.startswith("@"):
+        path = "\0" + path[1:]  # Abstract namespace socket
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(path)
+            sock.sendall(message.encode())
+        return True
+    except OSError:
+        return False
+
+
+class StartupTimer:
+    def __init__(self, started=PROCESS_START):
+        """
+        Initialize the timer; the "imports" phase covers process start until now
+
+        Args:
+            started: Wall-clock time the process started
+        """
+        self.started = started
+        self.phases = {"imports": time.time() - started}
+        self.lock = threading.Lock()
+        self.ready_at = None
+
+    @contextmanager
+    def phase(self, name):
+        """Time one phase (safe to use from several threads at once)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name] = time.perf_counter() - start
+
+    def timed(self, name, function, *args):
+        """Run function(*args) as a phase and return its result (for thread pools)"""
+        with self.phase(name):
+            return function(*args)
+
+    def elapsed(self):
+        return time.time() - self.started
+
+    def summary(self):
+        """'model 5.1s | camera 0.3s | ... | total 6.9s' (total is wall time, so overlaps show)"""
+        with self.lock:
+            phases = dict(self.phases)
+        total = (self.ready_at or time.time()) - self.started
+        return " | ".join([f"{name} {seconds:.2f}s" for name, seconds in phases.items()] + [f"total {total:.2f}s"])
+
+    def mark_ready(self, ready_file=None, **info):
+        """Signal readiness to systemd and/or a file; returns the startup report"""
+        self.ready_at = time.time()
+        with self.lock:
+            report = {
+                "pid": os.getpid(),
+                "ready_at": self.ready_at,
+                "startup_seconds": round(self.ready_at - self.started, 3),
+                "phases": {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            }
+        report.update(info)
+        sd_notify(f"READY=1\nSTATUS=Detecting (startup {report['startup_seconds']:.1f}s)")
+        if ready_file:
+            write_ready_file(ready_file, report)
+        return report
+
+
+def write_ready_file(path, report):
+    """Write the readiness file atomically so a watcher never reads half of it"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def mark_stopping(path=None):
+    """Tell systemd the detector is shutting down and remove the readiness file"""
+    sd_notify("STOPPING=1")
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Multi-object tracker for Traffic Congestion Detection
+Associates each frame's vehicle boxes with existing tracks by IoU (computed for
+all pairs at once with NumPy), so a vehicle keeps one id while it is in view.
+Tracks coast on a constant-velocity prediction between inference frames and
+through short detection dropouts; only time on inference frames counts toward
+expiry, so a queue standing still while the model is gated is kept. From the tracks it derives unique-vehicle
+counts, flow per minute, dwell time in the ROI and counting-line crossings.
+Updates (inference thread) and reads (output thread) share a lock, since an
+update replaces the track columns one at a time
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU of (N, 4) and (M, 4) x1, y1, x2, y2 boxes as an (N, M) array"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    a = boxes_a[:, None, :].astype(np.float32)
+    b = boxes_b[None, :, :].astype(np.float32)
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    intersection = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return intersection / np.maximum(area_a + area_b - intersection, 1e-6)
+
+
+def greedy_match(iou, threshold):
+    """Highest-IoU-first one-to-one matching; returns (track_indices, detection_indices)"""
+    rows, cols = np.nonzero(iou >= threshold)
+    if len(rows) == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    order = np.argsort(-iou[rows, cols], kind="stable")
+    used_rows, used_cols = set(), set()
+    matched_rows, matched_cols = [], []
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        matched_rows.append(row)
+        matched_cols.append(col)
+    return np.array(matched_rows, dtype=np.intp), np.array(matched_cols, dtype=np.intp)
+
+
+class VehicleTracker:
+    def __init__(self, iou_threshold=0.3, max_coast=2.0, min_hits=2, counting_line=None,
+                 flow_window=60.0, velocity_smoothing=0.5):
+        """
+        Initialize the tracker
+
+        Args:
+            iou_threshold: Minimum IoU between a predicted track box and a detection to match
+            max_coast: Seconds of inference frames a track survives without a matching detection
+            min_hits: Matches before a track is confirmed and counted
+            counting_line: ((x1, y1), (x2, y2)) line whose crossings are counted, or None
+            flow_window: Seconds of history used for the flow rate
+            velocity_smoothing: Weight of the newest velocity measurement
+        """
+        self.iou_threshold = iou_threshold
+        self.max_coast = max_coast
+        self.min_hits = min_hits
+        self.counting_line = counting_line
+        self.flow_window = flow_window
+        self.velocity_smoothing = velocity_smoothing
+
+        # Tracks, stored column-wise like DetectionBatch
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.boxes = np.zeros((0, 4), dtype=np.float32)       # Predicted position at self.last_time
+        self.velocities = np.zeros((0, 4), dtype=np.float32)  # Pixels per second
+        self.class_ids = np.zeros(0, dtype=np.int32)
+        self.hits = np.zeros(0, dtype=np.int32)
+        self.last_seen = np.zeros(0, dtype=np.float64)
+        self.unmatched = np.zeros(0, dtype=np.float64)       # Inference-frame seconds since the last match
+        self.roi_since = np.zeros(0, dtype=np.float64)        # NaN while outside the ROI
+        self.sides = np.zeros(0, dtype=np.int8)               # Side of the counting line (0 = unknown)
+        self.in_roi = np.zeros(0, dtype=bool)
+        self.zone_bits = None                                   # Zone membership bits when zones are used
+
+        self.next_id = 1
+        self.last_time = None
+        self.unique_vehicles = 0
+        self.new_vehicles = {}                                # Class id -> vehicles counted since last pop
+        self.crossings = {"forward": 0, "backward": 0}
+        self.flow_events = deque()                            # Times vehicles were counted
+        self.completed_dwells = deque(maxlen=200)             # Seconds spent in the ROI by departed tracks
+        self.lock = threading.Lock()
+
+    @property
+    def confirmed(self):
+        return self.hits >= self.min_hits
+
+    def _advance(self, now, inferred=True):
+        """
+        Move every track along its velocity to time now and drop the ones coasted too long
+
+        Only frames the model ran on age the tracks: on a skipped frame (motion gate,
+        frame stride) a missing detection says nothing about whether the vehicle left.
+        """
+        elapsed = max(now - self.last_time, 0.0) if self.last_time is not None else 0.0
+        if len(self.ids):
+            self.boxes += self.velocities * np.float32(elapsed)
+        self.last_time = now
+        if not inferred:
+            return
+
+        self.unmatched += elapsed
+        expired = self.unmatched > self.max_coast
+        if expired.any():
+            self._finish_dwell(expired, now)
+            self._keep(~expired)
+
+    def _keep(self, mask):
+        self.ids = self.ids[mask]
+        self.boxes = self.boxes[mask]
+        self.velocities = self.velocities[mask]
+        self.class_ids = self.class_ids[mask]
+        self.hits = self.hits[mask]
+        self.last_seen = self.last_seen[mask]
+        self.unmatched = self.unmatched[mask]
+        self.roi_since = self.roi_since[mask]
+        self.sides = self.sides[mask]
+        self.in_roi = self.in_roi[mask]
+
+    def _finish_dwell(self, mask, now):
+        """Record the ROI dwell of confirmed tracks that leave the ROI or disappear"""
+        ending = mask & ~np.isnan(self.roi_since) & self.confirmed
+        self.completed_dwells.extend((now - self.roi_since[ending]).tolist())
+
+    def _line_sides(self):
+        """Sign of each track's centre relative to the counting line"""
+        (x1, y1), (x2, y2) = self.counting_line
+        cx = (self.boxes[:, 0] + self.boxes[:, 2]) / 2
+        cy = (self.boxes[:, 1] + self.boxes[:, 3]) / 2
+        return np.sign((x2 - x1) * (cy - y1) - (y2 - y1) * (cx - x1)).astype(np.int8)
+
+    def _update_regions(self, roi, now):
+        """Refresh ROI membership (dwell timers) and count counting-line crossings"""
+        if hasattr(roi, "membership"):
+            # A ZoneMap: inside the ROI means anchored in any zone
+            self.zone_bits = roi.membership(self.boxes)
+            in_roi = self.zone_bits != 0
+        else:
+            self.zone_bits = None
+            in_roi = ((self.boxes[:, 0] >= roi[0]) & (self.boxes[:, 1] >= roi[1]) &
+                      (self.boxes[:, 2] <= roi[2]) & (self.boxes[:, 3] <= roi[3]))
+        left = ~in_roi & ~np.isnan(self.roi_since)
+        self._finish_dwell(left, now)
+        self.roi_since[left] = np.nan
+        self.roi_since[in_roi & np.isnan(self.roi_since)] = now
+        self.in_roi = in_roi
+
+        if self.counting_line is not None and len(self.ids):
+            sides = self._line_sides()
+            crossed = (self.sides != 0) & (sides != 0) & (sides != self.sides) & self.confirmed
+            forward = int(np.count_nonzero(crossed & (sides > 0)))
+            backward = int(np.count_nonzero(crossed)) - forward
+            self.crossings["forward"] += forward
+            self.crossings["backward"] += backward
+            self.flow_events.extend([now] * (forward + backward))
+            self.sides = np.where(sides != 0, sides, self.sides).astype(np.int8)
+
+    def update(self, boxes, class_ids, roi, now=None):
+        """
+        Feed one inference frame's vehicle detections
+
+        Args:
+            boxes: (N, 4) detection boxes in frame coordinates
+            class_ids: (N,) detection classes
+            roi: [x1, y1, x2, y2] region (or a ZoneMap) used for dwell time and counts
+            now: Frame time in seconds (defaults to time.time())
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            self._update(boxes, class_ids, roi, now)
+
+    def _update(self, boxes, class_ids, roi, now):
+        self._advance(now)
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        class_ids = np.asarray(class_ids, dtype=np.int32)
+
+        track_idx, det_idx = greedy_match(iou_matrix(self.boxes, boxes), self.iou_threshold)
+
+        if len(track_idx):
+            # Correct matched tracks to the measurement and update their velocity
+            dt = np.maximum(now - self.last_seen[track_idx], 1e-3).astype(np.float32)[:, None]
+            last_measured = self.boxes[track_idx] - self.velocities[track_idx] * dt
+            measured = (boxes[det_idx] - last_measured) / dt
+            self.velocities[track_idx] += self.velocity_smoothing * (measured - self.velocities[track_idx])
+            self.boxes[track_idx] = boxes[det_idx]
+            self.class_ids[track_idx] = class_ids[det_idx]
+            was_confirmed = self.confirmed[track_idx]
+            self.hits[track_idx] += 1
+            self.last_seen[track_idx] = now
+            self.unmatched[track_idx] = 0.0
+            newly_confirmed = ~was_confirmed & (self.hits[track_idx] >= self.min_hits)
+            self._count_new(self.class_ids[track_idx[newly_confirmed]], now)
+
+        # Unmatched detections start new tracks
+        new = np.ones(len(boxes), dtype=bool)
+        new[det_idx] = False
+        count = int(np.count_nonzero(new))
+        if count:
+            self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + count)])
+            self.next_id += count
+            self.boxes = np.concatenate([self.boxes, boxes[new]])
+            self.velocities = np.concatenate([self.velocities, np.zeros((count, 4), dtype=np.float32)])
+            self.class_ids = np.concatenate([self.class_ids, class_ids[new]])
+            self.hits = np.concatenate([self.hits, np.ones(count, dtype=np.int32)])
+            self.last_seen = np.concatenate([self.last_seen, np.full(count, now)])
+            self.unmatched = np.concatenate([self.unmatched, np.zeros(count)])
+            self.roi_since = np.concatenate([self.roi_since, np.full(count, np.nan)])
+            self.sides = np.concatenate([self.sides, np.zeros(count, dtype=np.int8)])
+            self.in_roi = np.concatenate([self.in_roi, np.zeros(count, dtype=bool)])
+            if self.min_hits <= 1:
+                self._count_new(class_ids[new], now)
+
+        self._update_regions(roi, now)
+
+    def coast(self, roi, now=None):
+        """Advance tracks on a frame without inference, using their predicted motion (nothing expires)"""
+        now = time.time() if now is None else now
+        with self.lock:
+            self._advance(now, inferred=False)
+            self._update_regions(roi, now)
+
+    def _count_new(self, class_ids, now):
+        """Count newly confirmed vehicles (by class) toward the totals and flow"""
+        count = len(class_ids)
+        if not count:
+            return
+        self.unique_vehicles += count
+        for class_id in class_ids.tolist():
+            self.new_vehicles[class_id] = self.new_vehicles.get(class_id, 0) + 1
+        if self.counting_line is None:
+            # Without a counting line, flow is the rate at which new vehicles appear
+            self.flow_events.extend([now] * count)
+
+    def pop_new_vehicles(self):
+        """Newly counted vehicles per class id since the last call"""
+        with self.lock:
+            new_vehicles, self.new_vehicles = self.new_vehicles, {}
+        return new_vehicles
+
+    def zone_counts(self, zone_map):
+        """Confirmed vehicles per zone (zone_map must be the one passed to update/coast)"""
+        with self.lock:
+            if self.zone_bits is None:
+                return [0] * len(zone_map)
+            return zone_map.counts(self.zone_bits[self.confirmed])
+
+    def count_in_roi(self):
+        """Confirmed tracks currently inside the ROI, including ones coasting through a dropout"""
+        with self.lock:
+            return int(np.count_nonzero(self.in_roi & self.confirmed))
+
+    def tracks(self):
+        """(ids, boxes, class_ids) of confirmed tracks"""
+        with self.lock:
+            confirmed = self.confirmed
+            return self.ids[confirmed], self.boxes[confirmed].astype(np.int32), self.class_ids[confirmed]
+
+    def flow_per_minute(self, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            return self._flow_per_minute(now)
+
+    def _flow_per_minute(self, now):
+        while self.flow_events and now - self.flow_events[0] > self.flow_window:
+            self.flow_events.popleft()
+        return len(self.flow_events) * 60.0 / self.flow_window
+
+    def get_stats(self, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            confirmed = self.confirmed
+            dwelling = self.in_roi & confirmed & ~np.isnan(self.roi_since)
+            stats = {
+                "active_tracks": int(np.count_nonzero(confirmed)),
+                "in_roi": int(np.count_nonzero(self.in_roi & confirmed)),
+                "unique_vehicles": self.unique_vehicles,
+                "flow_per_minute": round(self._flow_per_minute(now), 1),
+                "dwell_current_s": (round(float(np.mean(now - self.roi_since[dwelling])), 1)
+                                    if dwelling.any() else 0.0),
+                "dwell_avg_s": (round(sum(self.completed_dwells) / len(self.completed_dwells), 1)
+                                if self.completed_dwells else 0.0),
+            }
+            if self.counting_line is not None:
+                stats["line_crossings"] = dict(self.crossings)
+        return stats
@@ -7,13 +7,39 @@ This script uses a pre-trained model from Roboflow Universe:
 "Traffic Congestion Detection Object Detection Dataset (v9) by SXC"
 """
 
+# First, so the startup "imports" phase is measured from here
+from startup import PROCESS_START, StartupTimer, mark_stopping
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import time
 import os
 import sys
-from firebase_integration import FirebaseIntegration
+import queue
+import threading
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from congestion_estimator import CongestionEstimator, CONGESTION_STATUSES
+from control_server import ControlServer, install_signal_handlers
+from adaptive_controller import AdaptiveInferenceController, DEFAULT_THERMAL_PATH
+from detections import DetectionBatch, class_lookup
+from firebase_integration import FirebaseIntegration, count_vehicle_types, CONGESTION_LEVELS
+from frame_pipeline import FramePipeline
+from history_rollup import HistoryRollup
+from metrics import MetricsServer
+from profiling import PROFILER, TRACE_FORMATS
+from inference_backends import BACKENDS, load_model, fixed_image_size
+from logging_setup import LOG_FORMATS, setup_logging
+from motion_gate import MotionGate
+from overlay_renderer import OverlayRenderer
+from publish_policy import PublishPolicy
+from runtime_config import RuntimeConfig, parse_overrides
+from tracker import VehicleTracker
+from zones import ZoneMap, parse_zones
+
+# Named explicitly: this module usually runs as __main__
+logger = logging.getLogger("traffic_detector")
 
 # --- Configuration ---
 # Path to your downloaded model from Roboflow
@@ -23,46 +49,334 @@ FRAME_WIDTH = 640
 FRAME_HEIGHT = 480
 CONFIDENCE_THRESHOLD = 0.5
 
+# Inference backend: "pytorch" runs best.pt directly; "onnx", "openvino" or "ncnn"
+# export it once (cached next to the weights) and run the faster CPU runtime;
+# "onnx-int8" runs the quantized model built by quantize_model.py.
+# Exported models run at a fixed BACKEND_IMAGE_SIZE
+INFERENCE_BACKEND = "pytorch"
+BACKEND_IMAGE_SIZE = 640
+
+# Adaptive inference: adjust image size, confidence cutoff and frame stride
+# on the fly to hold the target rate as latency and SoC temperature change
+ADAPTIVE_INFERENCE = True
+TARGET_FPS = 10
+INFERENCE_IMAGE_SIZES = (640, 512, 416, 320)  # Largest first
+MAX_FRAME_STRIDE = 4
+THERMAL_PATH = DEFAULT_THERMAL_PATH
+
+# ROI inference: feed only the ROI crop (optionally masked to the road) to the
+# model, restricted to vehicle classes, and map boxes back to frame coordinates
+ROI_INFERENCE = True
+ROAD_MASK_PATH = None  # Optional greyscale image, frame-sized; white = road
+
+# Motion gating: skip the model while the ROI is static or empty, reusing the
+# last result, but refresh at least every MOTION_MAX_INTERVAL seconds
+MOTION_GATING = True
+MOTION_CHANGED_FRACTION = 0.01  # Fraction of ROI pixels that must change
+MOTION_MAX_INTERVAL = 30.0
+
+# Vehicle tracking: keep one id per vehicle across frames so counts don't flicker
+# when detections drop out, and derive flow, dwell time and line crossings
+TRACKING = True
+TRACK_IOU_THRESHOLD = 0.3
+TRACK_MAX_COAST = 2.0  # Seconds a vehicle is kept without a matching detection
+COUNTING_LINE = None  # ((x1, y1), (x2, y2)) line to count crossings on, e.g. ((100, 300), (540, 300))
+
+# Run capture, inference and output on separate threads joined by
+# "latest frame wins" queues, so inference always sees the newest frame
+PIPELINED_MODE = True
+
+# Headless service mode: no drawing or HighGUI window; commands come from the
+# control socket and signals instead of the keyboard
+HEADLESS = False
+CONTROL_SOCKET_PATH = "/tmp/traffic_detector.sock"  # None to disable the control socket
+
+# Prometheus text metrics on http://<host>:METRICS_PORT/metrics (None to disable)
+METRICS_HOST = "0.0.0.0"
+METRICS_PORT = 9108
+
+# Logging: records are queued and written by a background thread; each message
+# template is limited to LOG_BURST back to back, then LOG_RATE_LIMIT per second
+LOG_LEVEL = "INFO"  # "DEBUG" also logs every Firebase write
+LOG_FORMAT = "text"  # "text" or "json" (one object per line)
+LOG_FILE = None  # Rotating log file in addition to stderr (journald under systemd)
+LOG_RATE_LIMIT = 1.0
+LOG_BURST = 5
+
+# Profiling (--profile, "profile" command or SIGRTMIN): per-frame span trace for a
+# bounded window, written to PROFILE_DIR, optionally with a sampled cProfile dump
+PROFILE_DIR = "profiles"
+PROFILE_FORMAT = "chrome"  # "chrome" (chrome://tracing / Perfetto) or "jsonl"
+PROFILE_FRAMES = 300
+PROFILE_MAX_SECONDS = 60
+PROFILE_CPROFILE = False
+
+# Startup: the model loads in the background while the camera opens and Firebase
+# is checked; WARMUP_INFERENCES run on a blank frame, then readiness is signalled
+# (sd_notify under a systemd Type=notify unit, plus READY_FILE with the breakdown)
+WARMUP_INFERENCES = 1
+READY_FILE = "/tmp/traffic_detector.ready"  # None to disable
+
+# Display window keys and the control commands they trigger
+KEY_COMMANDS = {
+    ord('q'): 'quit',
+    ord('s'): 'snapshot',
+    ord('r'): 'select_roi',
+    ord('f'): 'test',
+    ord('u'): 'update',
+}
+FRAME_COMMANDS = ("snapshot", "update", "select_roi")  # Commands that need a processed frame
+
 # Region of Interest (ROI) - adjust based on your camera view
 # Format: [x1, y1, x2, y2] where (x1,y1) is top-left, (x2,y2) is bottom-right
 ROI = [100, 200, 540, 400]  # Adjust these values for your specific view
 
+# Lanes / zones: named polygons counted and published separately (see zones.py).
+# Vehicles count where their box's bottom centre touches the road; when zones are
+# set, "in the ROI" means inside any zone and the ROI becomes the zones' bounding box
+# Example: [{"name": "northbound", "polygon": [[60, 470], [300, 470], [330, 220], [250, 220]]},
+#           {"name": "southbound", "polygon": [[320, 470], [620, 470], [420, 220], [340, 220]],
+#            "thresholds": [2, 3, 5]}]  # Optional per-zone thresholds
+ZONES = []
+
 # Congestion thresholds (adjusted for better detection)
 LOW_CONGESTION_THRESHOLD = 2  # 2+ vehicles = light traffic
 MODERATE_CONGESTION_THRESHOLD = 4  # 4+ vehicles = moderate congestion  
 HIGH_CONGESTION_THRESHOLD = 6  # 6+ vehicles = high congestion
 
+# Congestion smoothing: status follows a time-smoothed count with separate
+# enter/exit thresholds and a minimum dwell, and alerts respect a cooldown
+CONGESTION_SMOOTHING = True
+CONGESTION_TIME_CONSTANT = 3.0  # Seconds
+CONGESTION_HYSTERESIS = 1.0  # Vehicles below a level's threshold before leaving it
+CONGESTION_MIN_DWELL = 5.0  # Seconds a status is held before it may change
+ALERT_COOLDOWN = 300  # Seconds between high-congestion alerts
+
+# Status colors (BGR) for the display
+STATUS_COLORS = {
+    "No Traffic": (0, 255, 0),  # Green
+    "Light Traffic": (0, 255, 255),  # Yellow
+    "Moderate Congestion": (0, 165, 255),  # Orange
+    "High Congestion": (0, 0, 255),  # Red
+}
+
 # Firebase Configuration
 FIREBASE_URL = "https://kottravel-2d580-default-rtdb.firebaseio.com/"  # Fixed: Proper database URL
 FIREBASE_API_KEY = None  # Optional: Replace with your Firebase API key
 ENABLE_FIREBASE = True  # Set to False to disable Firebase integration
+FIREBASE_ASYNC_UPLOADS = True  # Send writes from background workers so the detection loop never blocks
+FIREBASE_UPLOAD_WORKERS = 2
+FIREBASE_UPLOAD_QUEUE_SIZE = 100
+FIREBASE_POOL_SIZE = 3  # Kept-alive HTTPS connections to the database
+FIREBASE_CONNECT_TIMEOUT = 3.05
+FIREBASE_READ_TIMEOUT = 10
+FIREBASE_SPOOL_PATH = "firebase_spool.db"  # On-disk store-and-forward spool for outages (None to disable)
+FIREBASE_SPOOL_MAX_RECORDS = 100000
+FIREBASE_SPOOL_MAX_AGE = 7 * 24 * 3600  # Seconds
+FIREBASE_WRITE_MODE = "patch"  # "patch": one diffed multi-path PATCH per update, "put": separate full PUTs
+LOCATION_ID = "camera_001"  # Firebase location id for this camera
+
+# Change-driven publishing: write as soon as the state changes by these amounts,
+# otherwise only send a heartbeat every PUBLISH_HEARTBEAT_INTERVAL seconds
+PUBLISH_COUNT_DELTA = 1  # Change in ROI vehicle count
+PUBLISH_MIX_DELTA = 2  # Total change across per-type counts of ROI vehicles
+PUBLISH_HEARTBEAT_INTERVAL = 60
+PUBLISH_MIN_INTERVAL = 1.0  # Seconds between full writes during bursts of changes
+
+# History: per-minute and per-hour rollups under traffic_rollups/{location_id};
+# raw snapshots under traffic_history/{location_id} while RAW_HISTORY is set (the
+# app's history screen still reads traffic_history; turn off once it reads rollups)
+HISTORY_ROLLUPS = True
+RAW_HISTORY = True
+
+# Runtime configuration: the settings in default_settings() can be overridden by
+# firebase_config.py, CONFIG_PATH (JSON), TRAFFIC_<KEY> environment variables and
+# --set key=value. The file is watched (and re-read on SIGHUP or "reload"); live
+# settings apply between frames without reloading the model
+CONFIG_PATH = "traffic_config.json"
+CONFIG_POLL_INTERVAL = 2.0  # Seconds between checks of the file's mtime
+RESTART_SETTINGS = ("camera", "model_path", "backend", "firebase_url", "firebase_api_key")
+INFERENCE_SETTINGS = ("roi", "zones", "thresholds", "confidence")  # Applied by the inference stage
+
+def location_spool_path(path, location_id):
+    """Per-camera spool file for multi-stream runs (firebase_spool.db -> firebase_spool_camera_002.db)"""
+    if not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}_{location_id}{ext}"
+
+def default_settings():
+    """Configurable settings and their defaults (the constants above, read at call time)"""
+    return {
+        "roi": list(ROI),
+        "zones": list(ZONES),
+        "thresholds": [LOW_CONGESTION_THRESHOLD, MODERATE_CONGESTION_THRESHOLD, HIGH_CONGESTION_THRESHOLD],
+        "confidence": CONFIDENCE_THRESHOLD,
+        "location_id": LOCATION_ID,
+        "publish_count_delta": PUBLISH_COUNT_DELTA,
+        "publish_mix_delta": PUBLISH_MIX_DELTA,
+        "publish_heartbeat_interval": float(PUBLISH_HEARTBEAT_INTERVAL),
+        "publish_min_interval": float(PUBLISH_MIN_INTERVAL),
+        "alert_cooldown": float(ALERT_COOLDOWN),
+        "camera": CAMERA_INDEX,
+        "model_path": MODEL_PATH,
+        "backend": INFERENCE_BACKEND,
+        "firebase_url": FIREBASE_URL,
+        "firebase_api_key": FIREBASE_API_KEY,
+    }
+
+def validate_settings(settings):
+    """Reject settings that are well-typed but unusable"""
+    x1, y1, x2, y2 = settings["roi"]
+    if x1 >= x2 or y1 >= y2:
+        raise ValueError(f"roi must be [x1, y1, x2, y2] with x1 < x2 and y1 < y2, got {settings['roi']}")
+    low, moderate, high = settings["thresholds"]
+    if not 0 < low < moderate < high:
+        raise ValueError(f"thresholds must be increasing and positive, got {settings['thresholds']}")
+    if not 0 < settings["confidence"] < 1:
+        raise ValueError(f"confidence must be between 0 and 1, got {settings['confidence']}")
+    if settings["backend"] not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{settings['backend']}'")
+    if not settings["location_id"]:
+        raise ValueError("location_id must not be empty")
+    parse_zones(settings["zones"])
 
 class TrafficDetector:
-    def __init__(self):
+    def __init__(self, headless=HEADLESS, control_socket_path=CONTROL_SOCKET_PATH, camera_source=CAMERA_INDEX,
+                 roi=None, thresholds=None, location_id=LOCATION_ID, confidence=CONFIDENCE_THRESHOLD,
+                 adaptive=ADAPTIVE_INFERENCE, road_mask_path=ROAD_MASK_PATH, enable_firebase=ENABLE_FIREBASE,
+                 backend=INFERENCE_BACKEND, model_path=None, firebase_url=None, firebase_api_key=None, config=None,
+                 zones=None, spool_path=FIREBASE_SPOOL_PATH):
+        """
+        Initialize the detector for one camera
+        
+        Args:
+            headless: Skip all drawing and the display window
+            control_socket_path: UNIX socket for control commands (None to disable)
+            camera_source: Camera index or video URL/path for cv2.VideoCapture
+            roi: [x1, y1, x2, y2] region of interest (defaults to ROI)
+            thresholds: (low, moderate, high) vehicle counts for the congestion levels
+            location_id: Firebase location id this camera publishes under
+            confidence: Detection confidence cutoff
+            adaptive: Use the adaptive inference controller
+            road_mask_path: Optional road mask image for ROI inference
+            enable_firebase: Publish to Firebase
+            backend: Inference backend ("pytorch", "onnx", "openvino", "ncnn" or "onnx-int8")
+            model_path: Weights to load (defaults to MODEL_PATH)
+            firebase_url: Realtime Database URL (defaults to FIREBASE_URL)
+            firebase_api_key: Database auth key (defaults to FIREBASE_API_KEY)
+            config: Loaded RuntimeConfig to watch for live setting changes
+            zones: Named polygon zones (lanes) counted separately (defaults to ZONES)
+            spool_path: Offline spool file for this camera's Firebase writes (None to disable)
+        """
+        self.camera_source = camera_source
+        self.roi = list(roi or ROI)
+        self.thresholds = tuple(thresholds or (
+            LOW_CONGESTION_THRESHOLD, MODERATE_CONGESTION_THRESHOLD, HIGH_CONGESTION_THRESHOLD
+        ))
+        self.location_id = location_id
+        self.confidence = confidence
+        self.road_mask_path = road_mask_path
+        self.backend = backend
+        self.model_path = model_path or MODEL_PATH
+        self.config = config
+        self.fixed_imgsz = fixed_image_size(backend, BACKEND_IMAGE_SIZE)  # Exported models have one input size
+        
         self.model = None
         self.cap = None
         self.class_names = {}
         self.vehicle_classes = []
+        self.vehicle_lookup = None     # Boolean array indexed by class id
+        self.congestion_lookup = None  # Classes that directly signal congestion
+        self.last_detections = None    # Reused on frames the controller skips
+        self.road_mask = None
+        self.masked_input = None       # Reusable buffer for the masked ROI crop
+        
+        self.motion_gate = None
+        if MOTION_GATING:
+            self.motion_gate = MotionGate(changed_fraction=MOTION_CHANGED_FRACTION, max_interval=MOTION_MAX_INTERVAL)
+        
+        self.tracker = None
+        if TRACKING:
+            self.tracker = VehicleTracker(TRACK_IOU_THRESHOLD, TRACK_MAX_COAST, counting_line=COUNTING_LINE)
+        
+        self.estimator = None
+        if CONGESTION_SMOOTHING:
+            self.estimator = CongestionEstimator(
+                CONGESTION_TIME_CONSTANT, CONGESTION_HYSTERESIS, CONGESTION_MIN_DWELL, ALERT_COOLDOWN
+            )
+        
+        self.zone_map = None
+        self.zone_estimators = []  # One per zone with smoothing
+        self.zone_status = None    # {name: {"vehicles", "status", "level"}} from the last analysis
+        self.set_zones(ZONES if zones is None else zones)
+        
+        self.controller = None
+        if adaptive:
+            self.controller = AdaptiveInferenceController(
+                target_fps=TARGET_FPS,
+                image_sizes=(self.fixed_imgsz,) if self.fixed_imgsz else INFERENCE_IMAGE_SIZES,
+                max_stride=MAX_FRAME_STRIDE,
+                base_confidence=confidence,
+                thermal_path=THERMAL_PATH
+            )
         self.firebase = None
+        self.rollup = HistoryRollup() if HISTORY_ROLLUPS else None
         self.last_congestion_status = None
+        self.first_status_seconds = None  # Process start to first published status
+        self.pipeline = None
+        self.frame_count = 0
+        self.fps_counter = time.time()
+        self.last_latency = 0.0
+        self.headless = headless
+        self.overlay = OverlayRenderer(STATUS_COLORS)  # Only draws when an annotated frame is needed
+        self.commands = queue.SimpleQueue()
+        self.pending_settings = queue.SimpleQueue()  # Inference settings waiting for the next frame
+        self.stop_event = threading.Event()  # Set by SIGTERM; ends the run loop even with no frames arriving
+        self.last_output = (None, None)      # (frame, result) of the last handled frame, for commands
+        self.control_server = None
+        if control_socket_path:
+            self.control_server = ControlServer(control_socket_path, self.queue_command)
+        self.metrics_server = None
+        metrics.REGISTRY.add_collector(self.collect_metrics)
         
         # Initialize Firebase if enabled
-        if ENABLE_FIREBASE:
+        if enable_firebase:
             try:
-                self.firebase = FirebaseIntegration(FIREBASE_URL, FIREBASE_API_KEY)
-                print("Firebase integration initialized")
+                self.firebase = FirebaseIntegration(
+                    firebase_url or FIREBASE_URL, 
+                    firebase_api_key or FIREBASE_API_KEY,
+                    async_uploads=FIREBASE_ASYNC_UPLOADS,
+                    upload_workers=FIREBASE_UPLOAD_WORKERS,
+                    upload_queue_size=FIREBASE_UPLOAD_QUEUE_SIZE,
+                    pool_size=FIREBASE_POOL_SIZE,
+                    connect_timeout=FIREBASE_CONNECT_TIMEOUT,
+                    read_timeout=FIREBASE_READ_TIMEOUT,
+                    write_mode=FIREBASE_WRITE_MODE,
+                    spool_path=spool_path,
+                    spool_max_records=FIREBASE_SPOOL_MAX_RECORDS,
+                    spool_max_age=FIREBASE_SPOOL_MAX_AGE,
+                    location_id=location_id,
+                    publish_policy=PublishPolicy(
+                        PUBLISH_COUNT_DELTA, PUBLISH_MIX_DELTA, PUBLISH_HEARTBEAT_INTERVAL, PUBLISH_MIN_INTERVAL
+                    ),
+                    raw_history=RAW_HISTORY
+                )
+                logger.info("Firebase integration initialized")
             except Exception as e:
-                print(f"Firebase initialization failed: {e}")
+                logger.error("Firebase initialization failed: %s", e)
                 self.firebase = None
         
+        if config:
+            self.apply_settings(config.values)
+        
     def setup_model(self):
         """Load the pre-trained model and identify classes"""
         try:
-            print("Loading pre-trained model from Roboflow...")
-            self.model = YOLO(MODEL_PATH)
+            logger.info("Loading pre-trained model from Roboflow (%s backend)...", self.backend)
+            self.model = load_model(self.model_path, self.backend, BACKEND_IMAGE_SIZE)
             self.class_names = self.model.names
-            print(f"Model loaded successfully!")
-            print(f"Available classes: {self.class_names}")
+            logger.info("Model loaded successfully! Available classes: %s", self.class_names)
             
             # Identify vehicle-related classes
             vehicle_keywords = ['car', 'truck', 'bus', 'motorcycle', 'vehicle', 'congested', 'not_congested']
@@ -70,287 +384,806 @@ class TrafficDetector:
                 if any(keyword in class_name.lower() for keyword in vehicle_keywords):
                     self.vehicle_classes.append(class_id)
                     
-            print(f"Vehicle/Traffic classes identified: {[self.class_names[i] for i in self.vehicle_classes]}")
+            logger.info("Vehicle/Traffic classes identified: %s", [self.class_names[i] for i in self.vehicle_classes])
             
+
             if not self.vehicle_classes:
-                print("Warning: No vehicle classes found. Using all classes.")
+                logger.warning("No vehicle classes found. Using all classes.")
                 self.vehicle_classes = list(self.class_names.keys())
-                
+            
+            self.vehicle_lookup = class_lookup(self.class_names, self.vehicle_classes)
+            self.congestion_lookup = class_lookup(self.class_names, [
+                class_id for class_id, class_name in self.class_names.items()
+                if 'congested' in class_name.lower() or 'congestion' in class_name.lower()
+            ])
+            
+            self.load_road_mask()
+            metrics.MODEL_INFO.set(self.location_id, self.model_path, self.backend, self.fixed_imgsz or "dynamic",
+                                   value=1)
             return True
             
         except Exception as e:
-            print(f"Error loading model: {e}")
-            print("Please ensure the model file exists at the specified path.")
+            logger.error("Error loading model: %s. Please ensure the model file exists at the specified path.", e)
             return False
     
+    def use_shared_model(self, other):
+        """Reuse a model (and its class tables) already loaded by another detector"""
+        self.model = other.model
+        self.model_path = other.model_path
+        self.backend = other.backend
+        self.fixed_imgsz = other.fixed_imgsz
+        self.class_names = other.class_names
+        self.vehicle_classes = other.vehicle_classes
+        self.vehicle_lookup = other.vehicle_lookup
+        self.congestion_lookup = other.congestion_lookup
+        self.load_road_mask()
+        metrics.MODEL_INFO.set(self.location_id, self.model_path, self.backend, self.fixed_imgsz or "dynamic", value=1)
+    
+    def load_road_mask(self):
+        """Load the optional road mask used to blank non-road pixels of the ROI crop"""
+        if not self.road_mask_path:
+            return
+        self.road_mask = cv2.imread(self.road_mask_path, cv2.IMREAD_GRAYSCALE)
+        if self.road_mask is None:
+            logger.warning("Could not read road mask %s, ignoring it", self.road_mask_path)
+        else:
+            self.road_mask = cv2.resize(self.road_mask, (FRAME_WIDTH, FRAME_HEIGHT), interpolation=cv2.INTER_NEAREST)
+            self.road_mask = np.where(self.road_mask > 127, 255, 0).astype(np.uint8)
+    
     def setup_camera(self):
         """Initialize camera"""
         try:
-            print("Initializing camera...")
-            self.cap = cv2.VideoCapture(CAMERA_INDEX)
+            logger.info("Initializing camera %s...", self.camera_source)
+            self.cap = cv2.VideoCapture(self.camera_source)
             
             if not self.cap.isOpened():
-                print(f"Error: Could not open camera at index {CAMERA_INDEX}")
+                logger.error("Could not open camera at index %s", self.camera_source)
                 return False
                 
             # Set camera properties
             self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
             self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
             self.cap.set(cv2.CAP_PROP_FPS, 30)
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Don't queue up stale frames in the driver
             
-            print("Camera initialized successfully!")
+            logger.info("Camera initialized successfully!")
             return True
             
         except Exception as e:
-            print(f"Error setting up camera: {e}")
+            logger.error("Error setting up camera: %s", e)
             return False
     
+    def set_zones(self, zones):
+        """Count named polygon zones separately (an empty list goes back to the plain ROI)"""
+        self.zone_map = ZoneMap(zones, (FRAME_WIDTH, FRAME_HEIGHT)) if zones else None
+        self.zone_status = None
+        self.zone_estimators = []
+        if self.zone_map:
+            self.roi = list(self.zone_map.bounds)
+            if CONGESTION_SMOOTHING:
+                self.zone_estimators = [
+                    CongestionEstimator(CONGESTION_TIME_CONSTANT, CONGESTION_HYSTERESIS, CONGESTION_MIN_DWELL)
+                    for _ in self.zone_map.names
+                ]
+    
+    def analyze_zones(self, detections_in_roi):
+        """Vehicle count and congestion status per zone, or None without zones"""
+        if not self.zone_map:
+            return None
+        if self.tracker:
+            counts = self.tracker.zone_counts(self.zone_map)
+        elif detections_in_roi.zone_bits is not None:
+            counts = self.zone_map.counts(detections_in_roi.zone_bits)
+        else:
+            counts = [0] * len(self.zone_map)  # Reused result from before the zones changed
+        
+        zone_status = {}
+        for index, (name, count) in enumerate(zip(self.zone_map.names, counts)):
+            thresholds = self.zone_map.thresholds[index] or self.thresholds
+            if self.zone_estimators:
+                status = self.zone_estimators[index].update(count, thresholds)
+            else:
+                status = CONGESTION_STATUSES[sum(count >= threshold for threshold in thresholds)]
+            zone_status[name] = {"vehicles": count, "status": status, "level": CONGESTION_LEVELS[status]}
+        return zone_status
+    
     def analyze_congestion(self, detections_in_roi):
         """Analyze congestion level based on detections"""
-        if not detections_in_roi:
-            return "No Traffic", (0, 255, 0)  # Green
+        self.zone_status = self.analyze_zones(detections_in_roi)
+        
+        # Tracked vehicles ride through single-frame dropouts, so the count is stable
+        vehicle_count = self.tracker.count_in_roi() if self.tracker else len(detections_in_roi)
         
         # Check if model directly detects congestion states
         congestion_detected = False
-        for detection in detections_in_roi:
-            class_name = self.class_names[detection['class_id']].lower()
-            if 'congested' in class_name or 'congestion' in class_name:
-                congestion_detected = True
-                break
+        if hasattr(detections_in_roi, 'class_ids'):
+            congestion_detected = bool(self.congestion_lookup[detections_in_roi.class_ids].any())
+        else:
+            for detection in detections_in_roi:
+                class_name = self.class_names[detection['class_id']].lower()
+                if 'congested' in class_name or 'congestion' in class_name:
+                    congestion_detected = True
+                    break
+        
+        if self.estimator:
+            # Smoothed count with hysteresis, so per-frame noise doesn't flip the status
+            status = self.estimator.update(vehicle_count, self.thresholds, congestion_detected)
+            return status, STATUS_COLORS[status]
         
         if congestion_detected:
             return "High Congestion", (0, 0, 255)  # Red
         
         # Vehicle counting with improved thresholds
-        vehicle_count = len(detections_in_roi)
+        low_threshold, moderate_threshold, high_threshold = self.thresholds
         
-        if vehicle_count >= HIGH_CONGESTION_THRESHOLD:
+        if vehicle_count >= high_threshold:
             return "High Congestion", (0, 0, 255)  # Red
-        elif vehicle_count >= MODERATE_CONGESTION_THRESHOLD:
+        elif vehicle_count >= moderate_threshold:
             return "Moderate Congestion", (0, 165, 255)  # Orange
-        elif vehicle_count >= LOW_CONGESTION_THRESHOLD:
+        elif vehicle_count >= low_threshold:
             return "Light Traffic", (0, 255, 255)  # Yellow
         else:
             return "No Traffic", (0, 255, 0)  # Green
     
+    def roi_input(self, frame):
+        """ROI crop of the frame (a view, masked to the road if configured) and its (x, y) offset"""
+        height, width = frame.shape[:2]
+        x1, y1 = max(int(self.roi[0]), 0), max(int(self.roi[1]), 0)
+        x2, y2 = min(int(self.roi[2]), width), min(int(self.roi[3]), height)
+        if x2 <= x1 or y2 <= y1:
+            return frame, None
+        
+        crop = frame[y1:y2, x1:x2]
+        if self.road_mask is None or self.road_mask.shape[:2] != (height, width):
+            return crop, (x1, y1)
+        
+        if self.masked_input is None or self.masked_input.shape != crop.shape:
+            self.masked_input = np.empty_like(crop)
+        cv2.bitwise_and(crop, crop, dst=self.masked_input, mask=self.road_mask[y1:y2, x1:x2])
+        return self.masked_input, (x1, y1)
+    
+    def prepare_inference(self, frame):
+        """
+        Decide whether this frame needs the model and build its input
+        
+        Returns (model_input, offset, options), or None if the previous result should be reused.
+        """
+        # Static or empty scene: reuse the previous result instead of running the model
+        if (self.motion_gate and self.last_detections is not None and
+                not self.motion_gate.should_infer(frame, self.roi)):
+            return None
+        
+        # Skip frames by stride, reusing the previous result
+        if (self.controller and not self.controller.should_infer() and
+                self.last_detections is not None):
+            return None
+        
+        return self.build_input(frame)
+    
+    def build_input(self, frame):
+        """Model input, (x, y) offset and predict options for a frame at the current operating point"""
+        model_input, offset = frame, None
+        options = {"conf": self.confidence}
+        if self.controller:
+            options = {"conf": self.controller.confidence, "imgsz": self.controller.image_size}
+        if ROI_INFERENCE:
+            model_input, offset = self.roi_input(frame)
+            # Don't upscale a small crop to the full inference size
+            crop_size = -(-max(model_input.shape[:2]) // 32) * 32
+            options["imgsz"] = min(options.get("imgsz", 640), crop_size)
+            options["classes"] = self.vehicle_classes
+        if self.fixed_imgsz:
+            options["imgsz"] = self.fixed_imgsz
+        return model_input, offset, options
+    
+    def warm_up(self, runs=WARMUP_INFERENCES):
+        """Run the model on a blank frame so the first real frame doesn't pay one-time setup costs"""
+        frame = np.zeros((FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+        model_input, _, options = self.build_input(frame)
+        for _ in range(runs):
+            self.model(model_input, **options)
+    
+    def finish_inference(self, results, offset, min_confidence=None):
+        """Turn model results for this camera into (all_detections, detections_in_roi) views"""
+        with PROFILER.span("postprocess"):
+            return self._finish_inference(results, offset, min_confidence)
+    
+    def _finish_inference(self, results, offset, min_confidence):
+        start = time.perf_counter()
+        # Convert all boxes at once and filter by ROI / vehicle class with array masks.
+        # The returned views behave like lists of detection dicts but only build them on demand
+        batch = DetectionBatch.from_results(
+            results, self.class_names, self.roi, self.vehicle_lookup, offset, min_confidence, self.zone_map
+        )
+        
+        self.last_detections = (batch.all(), batch.in_roi_view())
+        if self.tracker:
+            tracked = batch.is_vehicle & ~self.congestion_lookup[batch.class_ids]
+            self.tracker.update(batch.boxes[tracked], batch.class_ids[tracked], self.zone_map or self.roi)
+        if self.motion_gate:
+            self.motion_gate.mark_inferred()
+        metrics.POSTPROCESS_SECONDS.observe(self.location_id, value=time.perf_counter() - start)
+        metrics.FRAMES_INFERRED.inc(self.location_id)
+        return self.last_detections
+    
     def process_frame(self, frame):
         """Process a single frame for traffic detection"""
+        with PROFILER.span("prepare"):
+            prepared = self.prepare_inference(frame)
+        if prepared is None:
+            if self.tracker:
+                self.tracker.coast(self.zone_map or self.roi)
+            return self.last_detections
+        model_input, offset, options = prepared
+        
         # Run inference
-        results = self.model(frame, conf=CONFIDENCE_THRESHOLD)
-        
-        detections_in_roi = []
-        all_detections = []
-        
-        # Process detections
-        for result in results:
-            boxes = result.boxes
-            if boxes is not None:
-                for box in boxes:
-                    # Extract box coordinates and info
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    class_id = int(box.cls[0])
-                    confidence = float(box.conf[0])
-                    class_name = self.class_names[class_id]
-                    
-                    detection = {
-                        'bbox': (x1, y1, x2, y2),
-                        'class_id': class_id,
-                        'class_name': class_name,
-                        'confidence': confidence
-                    }
-                    all_detections.append(detection)
-                    
-                    # Check if detection is in ROI and is a relevant class
-                    if (class_id in self.vehicle_classes and 
-                        x1 >= ROI[0] and y1 >= ROI[1] and 
-                        x2 <= ROI[2] and y2 <= ROI[3]):
-                        detections_in_roi.append(detection)
-        
-        return all_detections, detections_in_roi
-    
-    def draw_annotations(self, frame, all_detections, detections_in_roi, congestion_status, status_color):
-        """Draw bounding boxes and annotations on the frame"""
-        # Draw ROI
-        cv2.rectangle(frame, (ROI[0], ROI[1]), (ROI[2], ROI[3]), (255, 255, 255), 2)
-        cv2.putText(frame, "ROI", (ROI[0], ROI[1] - 10), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-        
-        # Draw all detections
-        for detection in all_detections:
-            x1, y1, x2, y2 = detection['bbox']
-            class_name = detection['class_name']
-            confidence = detection['confidence']
-            
-            # Color coding: Green for detections outside ROI, Red for inside ROI
-            color = (0, 255, 0) if detection not in detections_in_roi else (0, 0, 255)
-            
-            # Draw bounding box
-            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-            
-            # Draw label
-            label = f"{class_name}: {confidence:.2f}"
-            label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
-            cv2.rectangle(frame, (x1, y1 - label_size[1] - 10), 
-                         (x1 + label_size[0], y1), color, -1)
-            cv2.putText(frame, label, (x1, y1 - 5), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-        
-        # Draw congestion status
-        cv2.putText(frame, f"Status: {congestion_status}", (10, 30), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.8, status_color, 2)
-        cv2.putText(frame, f"Vehicles in ROI: {len(detections_in_roi)}", (10, 60), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-        
-        # Draw timestamp
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        cv2.putText(frame, timestamp, (10, frame.shape[0] - 10), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        
-        return frame
+        start = time.perf_counter()
+        with PROFILER.span("model", imgsz=options.get("imgsz")):
+            results = self.model(model_input, **options)
+        latency = time.perf_counter() - start
+        metrics.INFERENCE_SECONDS.observe(self.location_id, value=latency)
+        if self.controller:
+            self.controller.record_inference(latency)
+        
+        return self.finish_inference(results, offset)
     
-    def run(self):
-        """Main detection loop"""
-        if not self.setup_model():
-            return False
-            
-        if not self.setup_camera():
-            return False
+    def read_frame(self):
+        """Read the next camera frame, timing the read"""
+        start = time.perf_counter()
+        with PROFILER.span("read"):
+            ret, frame = self.cap.read()
+        metrics.FRAME_READ_SECONDS.observe(self.location_id, value=time.perf_counter() - start)
+        return ret, frame
+    
+    def draw_annotations(self, frame, all_detections, detections_in_roi, congestion_status, status_color,
+                         traffic=None):
+        """
+        Annotated copy of the frame (the frame itself is left untouched)
         
-        print("\nTraffic Detection Started!")
-        print("Press 'q' to quit")
-        print("Press 's' to save current frame")
-        print("Press 'r' to reset ROI (follow prompts)")
-        print("Press 'f' to test Firebase connection")
-        print("Press 'u' to force Firebase update now")
+        Returns the renderer's overlay buffer, which the next call overwrites.
+        """
+        _, tracking, zone_status = traffic or self.traffic_snapshot(detections_in_roi)
+        status_lines = [
+            (f"Status: {congestion_status}", 0.8, status_color),
+            (f"Vehicles in ROI: {len(detections_in_roi)}", 0.6, (255, 255, 255)),
+        ]
+        if tracking:
+            status_lines.append(
+                (f"Flow: {tracking['flow_per_minute']:.0f}/min | Tracked: {tracking['in_roi']}", 0.6, (255, 255, 255))
+            )
+        return self.overlay.render(frame, all_detections, status_lines, self.roi, self.zone_map, zone_status)
+    
+    def traffic_counts(self, detections_in_roi):
+        """ROI vehicle count to publish and the tracker's flow stats (None without tracking)"""
+        if self.tracker:
+            stats = self.tracker.get_stats()  # One locked read, so the count matches the stats
+            return stats["in_roi"], stats
+        return len(detections_in_roi), None
+    
+    def traffic_snapshot(self, detections_in_roi):
+        """(vehicle count, tracking stats, zone status) as of the last analyzed frame"""
+        return self.traffic_counts(detections_in_roi) + (self.zone_status,)
+    
+    def publish_status(self, congestion_status, all_detections, detections_in_roi, traffic=None):
+        """
+        Send the current status to Firebase and raise an alert on entering high congestion
         
-        # Test Firebase connection if enabled
+        traffic is the frame's traffic_snapshot(), taken on the inference thread in
+        infer() so the published count belongs to the same frame as the status.
+        """
+        vehicle_count, tracking, zone_status = traffic or self.traffic_snapshot(detections_in_roi)
         if self.firebase:
-            if self.firebase.test_connection():
-                print("✓ Firebase connected and ready")
+            try:
+                self.firebase.update_traffic_data(
+                    congestion_status, 
+                    vehicle_count, 
+                    detections_in_roi, 
+                    all_detections,
+                    tracking=tracking,
+                    lanes=zone_status
+                )
+                
+                # Send alert for high congestion (only once per status change, and
+                # with smoothing no more than once per cooldown)
+                if self.estimator:
+                    alert = self.estimator.should_alert()
+                else:
+                    alert = (congestion_status == "High Congestion" and
+                             self.last_congestion_status != "High Congestion")
+                if alert:
+                    self.firebase.send_alert(
+                        "high_congestion", 
+                        f"High traffic congestion detected: {vehicle_count} vehicles in ROI"
+                    )
+                
+                if self.rollup:
+                    new_vehicles = {}
+                    if self.tracker:
+                        new_vehicles = {self.class_names[class_id]: count
+                                        for class_id, count in self.tracker.pop_new_vehicles().items()}
+                    self.firebase.publish_rollups(self.rollup.add(
+                        congestion_status, vehicle_count, count_vehicle_types(all_detections), new_vehicles
+                    ))
+            except Exception as e:
+                logger.error("Firebase update error: %s", e)
+        
+        if self.first_status_seconds is None:
+            self.first_status_seconds = time.time() - PROCESS_START
+            metrics.FIRST_STATUS_SECONDS.set(self.location_id, value=self.first_status_seconds)
+            logger.info("First status published %.2fs after start", self.first_status_seconds)
+        
+        metrics.CONGESTION_LEVEL.set(self.location_id, value=CONGESTION_LEVELS.get(congestion_status, 0))
+        metrics.VEHICLES_IN_ROI.set(self.location_id, value=vehicle_count)
+        for name, lane in (zone_status or {}).items():
+            metrics.ZONE_VEHICLES.set(self.location_id, name, value=lane["vehicles"])
+            metrics.ZONE_CONGESTION_LEVEL.set(self.location_id, name, value=lane["level"])
+        self.last_congestion_status = congestion_status
+    
+    def queue_command(self, command, args=()):
+        """Queue a control command; safe to call from signal handlers and other threads"""
+        self.commands.put((command, list(args)))
+    
+    def apply_settings(self, settings):
+        """
+        Apply live runtime settings (all of them, or just the changed ones)
+        
+        Runs on the output thread between frames, like the other control commands.
+        INFERENCE_SETTINGS are read by the inference stage mid-frame, so while it runs
+        on its own thread they are handed to it and applied before its next frame.
+        """
+        inference_settings = {key: settings[key] for key in INFERENCE_SETTINGS if key in settings}
+        if inference_settings:
+            if self.pipeline:
+                self.pending_settings.put(inference_settings)
             else:
-                print("⚠ Firebase connection failed - continuing without Firebase")
-                self.firebase = None
+                self.apply_inference_settings(inference_settings)
+        if "alert_cooldown" in settings and self.estimator:
+            self.estimator.alert_cooldown = settings["alert_cooldown"]
+        if self.firebase:
+            policy = self.firebase.publish_policy
+            for key in ("count_delta", "mix_delta", "heartbeat_interval", "min_interval"):
+                if "publish_" + key in settings:
+                    setattr(policy, key, settings["publish_" + key])
+        if "location_id" in settings and settings["location_id"] != self.location_id:
+            if self.firebase:
+                if self.rollup:
+                    self.firebase.publish_rollups(self.rollup.flush())  # Close the old location's buckets
+                self.firebase.location_id = settings["location_id"]
+                self.firebase.publish_policy.published = None  # Write the full state under the new id
+            self.location_id = settings["location_id"]
+    
+    def apply_inference_settings(self, settings):
+        """Apply the ROI, zones, thresholds and confidence together, on the thread that runs inference"""
+        if "roi" in settings:
+            self.roi = list(settings["roi"])
+        if "zones" in settings:
+            self.set_zones(settings["zones"])
+            if not self.zone_map:
+                self.roi = list(self.config.get("roi") if self.config else ROI)  # Back to the rectangle
+        if self.zone_map:
+            self.roi = list(self.zone_map.bounds)  # Zones decide where the model looks
+        if "thresholds" in settings:
+            self.thresholds = tuple(settings["thresholds"])
+        if "confidence" in settings:
+            self.confidence = settings["confidence"]
+            if self.controller:
+                self.controller.base_confidence = self.confidence
+                self.controller.confidence = self.confidence
+    
+    def apply_pending_settings(self):
+        """Apply settings handed over by apply_settings, before the next frame is inferred"""
+        while True:
+            try:
+                settings = self.pending_settings.get_nowait()
+            except queue.Empty:
+                return
+            self.apply_inference_settings(settings)
+    
+    def execute_command(self, command, args, frame, result, annotated_frame=None):
+        """Run one control command (from a key, the control socket or a signal). Returns False to quit"""
+        all_detections, detections_in_roi, congestion_status, status_color, traffic = result
+        
+        if command == 'quit':
+            return False
+        elif command == 'snapshot':
+            if annotated_frame is None:
+                # Headless: only annotate when a snapshot actually needs it
+                annotated_frame = self.draw_annotations(
+                    frame, all_detections, detections_in_roi, congestion_status, status_color, traffic
+                )
+            filename = f"traffic_snapshot_{int(time.time())}.jpg"
+            cv2.imwrite(filename, annotated_frame)
+            logger.info("Frame saved as %s", filename)
+        elif command == 'test':
+            if self.firebase:
+                if self.firebase.test_connection():
+                    logger.info("✓ Firebase connection test successful")
+                else:
+                    logger.warning("✗ Firebase connection test failed")
+            else:
+                logger.info("Firebase not enabled")
+        elif command == 'update':
+            if self.firebase:
+                # Force immediate Firebase update
+                logger.info("🔄 Forcing Firebase update...")
+                vehicle_count, tracking, zone_status = traffic
+                success = self.firebase.update_traffic_data(
+                    congestion_status, 
+                    vehicle_count, 
+                    detections_in_roi, 
+                    all_detections,
+                    tracking=tracking,
+                    force=True,
+                    lanes=zone_status
+                )
+                if success and self.firebase.uploader:
+                    logger.info("📤 Manual Firebase update queued")
+                elif success:
+                    logger.info("✅ Manual Firebase update completed")
+                else:
+                    logger.warning("❌ Manual Firebase update failed")
+            else:
+                logger.info("Firebase not enabled")
+        elif command in ('roi', 'select_roi') and self.zone_map:
+            logger.warning("Zones are configured: the ROI follows their bounding box (edit 'zones' instead)")
+        elif command == 'roi':
+            try:
+                x1, y1, x2, y2 = (int(value) for value in args)
+            except ValueError:
+                logger.warning("Usage: roi <x1> <y1> <x2> <y2>")
+                return True
+            if x2 > x1 and y2 > y1:
+                self.apply_settings({"roi": [x1, y1, x2, y2]})
+                logger.info("New ROI set: %s", [x1, y1, x2, y2])
+            else:
+                logger.warning("Invalid ROI: %s", args)
+        elif command == 'profile':
+            if args and args[0] == 'stop':
+                if not PROFILER.stop():
+                    logger.info("Profiling is not running")
+            elif args and not args[0].isdigit():
+                logger.warning("Usage: profile [frames] | profile stop")
+            elif not PROFILER.start(frames=int(args[0]) if args else None):
+                logger.info("Profiling already running")
+        elif command == 'reload':
+            if self.config:
+                changes = self.config.reload()
+                if changes:
+                    self.apply_settings({key: new for key, (old, new) in changes.items()})
+                    logger.info("Settings updated: %s",
+                                ", ".join(f"{key} {old} -> {new}" for key, (old, new) in changes.items()))
+                elif changes is not None:
+                    logger.info("Settings unchanged")
+            else:
+                logger.info("Runtime configuration not enabled")
+        elif command == 'select_roi':
+            logger.info("Click and drag to select new ROI, then press ENTER or SPACE")
+            roi = cv2.selectROI("Select ROI", frame, False)
+            if roi[2] > 0 and roi[3] > 0:  # Valid ROI selected
+                roi = [roi[0], roi[1], roi[0] + roi[2], roi[1] + roi[3]]
+                self.apply_settings({"roi": roi})
+                logger.info("New ROI set: %s", roi)
+            cv2.destroyWindow("Select ROI")
         
-        print("-" * 50)
+        return True
+    
+    def infer(self, frame):
+        """Inference stage: detect vehicles and classify congestion for one frame"""
+        self.apply_pending_settings()
+        all_detections, detections_in_roi = self.process_frame(frame)
+        with PROFILER.span("analyze"):
+            congestion_status, status_color = self.analyze_congestion(detections_in_roi)
+            # Read the tracker here, not on the output thread, so counts match this frame's status
+            traffic = self.traffic_snapshot(detections_in_roi)
+        return all_detections, detections_in_roi, congestion_status, status_color, traffic
+    
+    def handle_result(self, frame, result):
+        """Output stage: publish, annotate and display one inferred frame. Returns False to quit"""
+        all_detections, detections_in_roi, congestion_status, status_color, traffic = result
         
-        frame_count = 0
-        fps_counter = time.time()
+        # Send data to Firebase
+        with PROFILER.span("publish"):
+            self.publish_status(congestion_status, all_detections, detections_in_roi, traffic)
         
-        try:
-            while True:
-                ret, frame = self.cap.read()
-                if not ret:
-                    print("Error: Could not read frame from camera")
-                    break
-                
-                # Process frame
-                all_detections, detections_in_roi = self.process_frame(frame)
-                
-                # Analyze congestion
-                congestion_status, status_color = self.analyze_congestion(detections_in_roi)
-                
-                # Send data to Firebase
-                if self.firebase:
-                    try:
-                        self.firebase.update_traffic_data(
-                            congestion_status, 
-                            len(detections_in_roi), 
-                            detections_in_roi, 
-                            all_detections
-                        )
-                        
-                        # Send alert for high congestion (only once per status change)
-                        if (congestion_status == "High Congestion" and 
-                            self.last_congestion_status != "High Congestion"):
-                            self.firebase.send_alert(
-                                "high_congestion", 
-                                f"High traffic congestion detected: {len(detections_in_roi)} vehicles in ROI"
-                            )
-                    except Exception as e:
-                        print(f"Firebase update error: {e}")
-                
-                self.last_congestion_status = congestion_status
-                
-                # Draw annotations
+        metrics.FRAMES_PROCESSED.inc(self.location_id)
+        
+        # Calculate and display FPS
+        self.frame_count += 1
+        if self.frame_count % 30 == 0:
+            fps = 30 / (time.time() - self.fps_counter)
+            metrics.FPS.set(self.location_id, value=fps)
+            self.fps_counter = time.time()
+            logger.info("FPS: %.1f | Detections: %d | ROI: %d | Status: %s",
+                        fps, len(all_detections), len(detections_in_roi), congestion_status)
+            if self.pipeline:
+                stats = self.pipeline.get_stats()
+                logger.info("Pipeline: latency %.0fms | dropped capture %d / inference %d",
+                            self.last_latency * 1000, stats['capture_dropped'], stats['inference_dropped'])
+            if self.motion_gate:
+                logger.info("Motion gate: skipped %.0f%% of frames", self.motion_gate.get_stats()['skip_ratio'] * 100)
+            if self.controller:
+                state = self.controller.get_state()
+                logger.info("Inference: %spx | conf %.2f | stride %s | latency %sms",
+                            state['image_size'], state['confidence'], state['stride'], state['latency_ms'])
+            if self.firebase:
+                stats = self.firebase.get_publish_stats()
+                logger.info("Publishing: %d writes + %d heartbeats | %s/min | change latency %sms",
+                            stats['full_writes'], stats['heartbeats'], stats['writes_per_minute'],
+                            stats['change_latency_p50_ms'])
+        
+        annotated_frame = None
+        if not self.headless:
+            # Draw annotations and display frame
+            with PROFILER.span("annotate"):
                 annotated_frame = self.draw_annotations(
-                    frame, all_detections, detections_in_roi, congestion_status, status_color
+                    frame, all_detections, detections_in_roi, congestion_status, status_color, traffic
                 )
-                
-                # Calculate and display FPS
-                frame_count += 1
-                if frame_count % 30 == 0:
-                    fps = 30 / (time.time() - fps_counter)
-                    fps_counter = time.time()
-                    print(f"FPS: {fps:.1f} | Detections: {len(all_detections)} | ROI: {len(detections_in_roi)} | Status: {congestion_status}")
-                
-                # Display frame
+            with PROFILER.span("display"):
                 cv2.imshow('Traffic Congestion Detection', annotated_frame)
                 
                 # Handle key presses
                 key = cv2.waitKey(1) & 0xFF
-                if key == ord('q'):
+            if key in KEY_COMMANDS:
+                self.queue_command(KEY_COMMANDS[key])
+        PROFILER.frame_done()
+        
+        self.last_output = (frame, result)
+        return self.run_commands(frame, result, annotated_frame)
+    
+    def run_commands(self, frame, result, annotated_frame=None):
+        """Run commands from keys, the control socket and signals. Returns False to quit"""
+        while True:
+            try:
+                command, args = self.commands.get_nowait()
+            except queue.Empty:
+                return not self.stop_event.is_set()
+            if result is None and command in FRAME_COMMANDS:
+                logger.warning("'%s' needs a frame; none has been processed yet", command)
+                continue
+            if not self.execute_command(command, args, frame, result, annotated_frame):
+                return False
+    
+    def stop(self):
+        """Ask the run loop to exit (safe from signal handlers and other threads)"""
+        self.stop_event.set()
+    
+    def run_sequential(self):
+        """Capture, infer and publish one frame at a time on the calling thread"""
+        while not self.stop_event.is_set():
+            ret, frame = self.read_frame()
+            if not ret:
+                logger.error("Could not read frame from camera")
+                break
+            
+            if not self.handle_result(frame, self.infer(frame)):
+                break
+    
+    def run_pipelined(self):
+        """Run capture and inference on background threads, output on the calling thread"""
+        self.pipeline = FramePipeline(self.read_frame, self.infer)
+        self.pipeline.start()
+        
+        try:
+            while self.pipeline.running and not self.stop_event.is_set():
+                packet = self.pipeline.get_result()
+                if packet is None:
+                    # Camera stalled: still answer commands (quit, reload, ...) meanwhile
+                    if not self.run_commands(*self.last_output):
+                        break
+                    continue
+                
+                if not self.handle_result(packet.frame, packet.result):
                     break
-                elif key == ord('s'):
-                    filename = f"traffic_snapshot_{int(time.time())}.jpg"
-                    cv2.imwrite(filename, annotated_frame)
-                    print(f"Frame saved as {filename}")
-                elif key == ord('f'):
-                    if self.firebase:
-                        if self.firebase.test_connection():
-                            print("✓ Firebase connection test successful")
-                        else:
-                            print("✗ Firebase connection test failed")
-                    else:
-                        print("Firebase not enabled")
-                elif key == ord('u'):
-                    if self.firebase:
-                        # Force immediate Firebase update
-                        print("🔄 Forcing Firebase update...")
-                        self.firebase.last_update = 0  # Reset timer
-                        success = self.firebase.update_traffic_data(
-                            congestion_status, 
-                            len(detections_in_roi), 
-                            detections_in_roi, 
-                            all_detections
-                        )
-                        if success:
-                            print("✅ Manual Firebase update completed")
-                        else:
-                            print("❌ Manual Firebase update failed")
-                    else:
-                        print("Firebase not enabled")
-                elif key == ord('r'):
-                    print("Click and drag to select new ROI, then press ENTER or SPACE")
-                    roi = cv2.selectROI("Select ROI", frame, False)
-                    if roi[2] > 0 and roi[3] > 0:  # Valid ROI selected
-                        global ROI
-                        ROI = [roi[0], roi[1], roi[0] + roi[2], roi[1] + roi[3]]
-                        print(f"New ROI set: {ROI}")
-                    cv2.destroyWindow("Select ROI")
+                self.last_latency = time.time() - packet.captured_at
+            
+            if self.pipeline.error:
+                logger.error("%s", self.pipeline.error)
+        finally:
+            self.pipeline.stop()
+    
+    def get_pipeline_stats(self):
+        """Per-stage frame and drop counters (empty when not pipelined)"""
+        if not self.pipeline:
+            return {}
+        stats = self.pipeline.get_stats()
+        stats["output_frames"] = self.frame_count
+        stats["capture_to_output_latency_s"] = self.last_latency
+        return stats
+    
+    def collect_metrics(self):
+        """Copy pipeline and Firebase counters into the metrics registry (run on scrape)"""
+        if self.pipeline:
+            stats = self.pipeline.get_stats()
+            metrics.FRAMES_DROPPED.set_total(self.location_id, "capture", value=stats["capture_dropped"])
+            metrics.FRAMES_DROPPED.set_total(self.location_id, "inference", value=stats["inference_dropped"])
+        if self.firebase:
+            self.firebase.collect_metrics()
+    
+    def cleanup_metrics(self):
+        """Stop the metrics endpoint and stop collecting this detector's counters"""
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        metrics.REGISTRY.remove_collector(self.collect_metrics)
+    
+    def start_metrics_server(self):
+        """Serve the metrics endpoint if configured"""
+        if METRICS_PORT:
+            self.metrics_server = MetricsServer(metrics.REGISTRY, METRICS_HOST, METRICS_PORT)
+            if not self.metrics_server.start():
+                self.metrics_server = None
+    
+    def check_firebase(self):
+        """Test the Firebase connection, continuing without Firebase if it fails"""
+        if not self.firebase:
+            return
+        if self.firebase.test_connection():
+            logger.info("✓ Firebase connected and ready")
+        else:
+            logger.warning("⚠ Firebase connection failed - continuing without Firebase")
+            self.firebase.close()
+            self.firebase = None
+    
+    def start_up(self):
+        """
+        Load the model, open the camera, check Firebase and warm up; True when ready
+        
+        The model load (including the torch/ultralytics import) runs on a background
+        thread while the camera opens and Firebase is checked on this one.
+        """
+        startup = StartupTimer()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader") as executor:
+            model_loaded = executor.submit(startup.timed, "model", self.setup_model)
+            with startup.phase("camera"):
+                camera_ready = self.setup_camera()
+            if camera_ready:
+                with startup.phase("firebase"):
+                    self.check_firebase()
+            if not model_loaded.result() or not camera_ready:
+                return False
+        
+        if WARMUP_INFERENCES:
+            with startup.phase("warmup"):
+                self.warm_up()
+        
+        report = startup.mark_ready(READY_FILE, location_id=self.location_id, backend=self.backend)
+        for phase, seconds in report["phases"].items():
+            metrics.STARTUP_SECONDS.set(self.location_id, phase, value=seconds)
+        logger.info("Ready: %s", startup.summary())
+        return True
+    
+    def run(self):
+        """Main detection loop"""
+        if not self.start_up():
+            return False
+        
+        logger.info("Traffic Detection Started! Mode: %s%s",
+                    'pipelined' if PIPELINED_MODE else 'sequential', ', headless' if self.headless else '')
+        if not self.headless:
+            logger.info("Keys: 'q' quit | 's' save current frame | 'r' reset ROI (follow prompts) | "
+                        "'f' test Firebase connection | 'u' force Firebase update now")
+        
+        install_signal_handlers(self.queue_command, on_stop=self.stop)
+        self.start_metrics_server()
+        if self.config:
+            self.config.watch(lambda: self.queue_command("reload"), CONFIG_POLL_INTERVAL)
+        if self.control_server:
+            try:
+                self.control_server.start()
+                logger.info("Control socket: %s (send 'help' for commands)", self.control_server.socket_path)
+            except OSError as e:
+                logger.warning("Control socket unavailable: %s", e)
+                self.control_server = None
+        
+        self.frame_count = 0
+        self.fps_counter = time.time()
+        
+        try:
+            if PIPELINED_MODE:
+                self.run_pipelined()
+            else:
+                self.run_sequential()
                     
         except KeyboardInterrupt:
-            print("\nDetection stopped by user")
+            logger.info("Detection stopped by user")
         except Exception as e:
-            print(f"Error during detection: {e}")
+            logger.exception("Error during detection: %s", e)
         finally:
             self.cleanup()
     
     def cleanup(self):
         """Clean up resources"""
+        PROFILER.stop()  # Write whatever an unfinished profiling session recorded
+        mark_stopping(READY_FILE)
+        if self.config:
+            self.config.stop()
         if self.cap:
             self.cap.release()
-        cv2.destroyAllWindows()
-        print("Resources cleaned up. Goodbye!")
+        if self.firebase:
+            if self.rollup:
+                self.firebase.publish_rollups(self.rollup.flush())  # Keep the partial minute
+            self.firebase.close()
+        if self.control_server:
+            self.control_server.stop()
+        self.cleanup_metrics()
+        if not self.headless:
+            cv2.destroyAllWindows()
+        logger.info("Resources cleaned up. Goodbye!")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Traffic congestion detection")
+    parser.add_argument("--headless", action="store_true", default=HEADLESS,
+                        help="Run without drawing or a display window (e.g. under systemd)")
+    parser.add_argument("--control-socket", default=CONTROL_SOCKET_PATH,
+                        help="UNIX socket path for control commands ('' to disable)")
+    parser.add_argument("--backend", choices=list(BACKENDS),
+                        help="Inference backend (exported models are cached next to the weights)")
+    parser.add_argument("--config", default=CONFIG_PATH,
+                        help="JSON settings file, watched for changes ('' to disable)")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="Override a setting (JSON value), e.g. --set roi=[80,220,560,420]")
+    parser.add_argument("--streams", metavar="FILE",
+                        help="JSON list of cameras to run in one process with batched inference")
+    parser.add_argument("--profile", type=int, nargs="?", const=PROFILE_FRAMES, metavar="FRAMES",
+                        help="Record a per-frame span trace for the first FRAMES frames")
+    parser.add_argument("--profile-format", default=PROFILE_FORMAT, choices=TRACE_FORMATS)
+    parser.add_argument("--cprofile", action="store_true", default=PROFILE_CPROFILE,
+                        help="Add a sampled cProfile dump of the model calls to profiling sessions")
+    parser.add_argument("--log-level", default=LOG_LEVEL, choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    parser.add_argument("--log-format", default=LOG_FORMAT, choices=LOG_FORMATS)
+    parser.add_argument("--log-file", default=LOG_FILE, help="Also log to this rotating file")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    setup_logging(args.log_level, args.log_format, args.log_file, LOG_RATE_LIMIT, LOG_BURST)
+    
+    try:
+        overrides = parse_overrides(args.set)
+        if args.backend:
+            overrides["backend"] = args.backend
+        config = RuntimeConfig(default_settings(), args.config or None, overrides, restart_keys=RESTART_SETTINGS,
+                               untyped_keys=("camera", "firebase_api_key", "zones"), validate=validate_settings)
+        settings = config.load()
+    except (OSError, ValueError) as e:
+        logger.error("Invalid configuration: %s", e)
+        return False
+    
     # Check if model file exists
-    if not os.path.exists(MODEL_PATH):
-        print(f"Error: Model file not found at {MODEL_PATH}")
-        print("Please download the model using the Roboflow setup script first.")
-        print("Run: python download_roboflow_model.py")
+    if not os.path.exists(settings["model_path"]):
+        logger.error("Model file not found at %s. Please download the model using the Roboflow setup script "
+                     "first. Run: python download_roboflow_model.py", settings["model_path"])
         return False
     
-    detector = TrafficDetector()
+    PROFILER.output_dir = PROFILE_DIR
+    PROFILER.trace_format = args.profile_format
+    PROFILER.max_frames = PROFILE_FRAMES
+    PROFILER.max_seconds = PROFILE_MAX_SECONDS
+    PROFILER.cprofile = args.cprofile
+    if args.profile:
+        PROFILER.start(frames=args.profile)
+    
+    if args.streams:
+        from multi_stream import MultiStreamDetector
+        return MultiStreamDetector.from_file(
+            args.streams, backend=settings["backend"], model_path=settings["model_path"],
+            firebase_url=settings["firebase_url"], firebase_api_key=settings["firebase_api_key"]
+        ).run()
+    
+    detector = TrafficDetector(
+        headless=args.headless,
+        control_socket_path=args.control_socket or None,
+        camera_source=settings["camera"],
+        roi=settings["roi"],
+        thresholds=settings["thresholds"],
+        location_id=settings["location_id"],
+        confidence=settings["confidence"],
+        backend=settings["backend"],
+        model_path=settings["model_path"],
+        firebase_url=settings["firebase_url"],
+        firebase_api_key=settings["firebase_api_key"],
+        config=config
+    )
     detector.run()
     return True
 
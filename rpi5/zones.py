@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Polygon zones for Traffic Congestion Detection
+Named polygons (lanes, approaches) are rasterized once into a per-pixel bitmask,
+bit i set where zone i covers the pixel, so zone membership for any number of
+boxes is one array lookup at each box's anchor point (bottom centre: where the
+vehicle touches the road), however complex the polygons are
+
+    ZONES = [
+        {"name": "northbound", "polygon": [[60, 470], [300, 470], [330, 220], [250, 220]]},
+        {"name": "southbound", "polygon": [[320, 470], [620, 470], [420, 220], [340, 220]],
+         "thresholds": [2, 3, 5]},
+    ]
+"""
+
+import re
+
+import cv2
+import numpy as np
+
+MAX_ZONES = 32  # Bits in the mask
+ZONE_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")  # Usable as a Firebase key
+
+
+def parse_zones(zones):
+    """Validate zone definitions; returns [(name, polygon array, thresholds or None)] or raises ValueError"""
+    if not isinstance(zones, (list, tuple)):
+        raise ValueError("zones must be a list")
+    if len(zones) > MAX_ZONES:
+        raise ValueError(f"At most {MAX_ZONES} zones are supported")
+    parsed = []
+    names = set()
+    for zone in zones:
+        if not isinstance(zone, dict):
+            raise ValueError("Each zone must be an object with 'name' and 'polygon'")
+        name = zone.get("name")
+        if not isinstance(name, str) or not ZONE_NAME_PATTERN.match(name):
+            raise ValueError(f"Zone name {name!r} must use only letters, digits, '_' and '-'")
+        if name in names:
+            raise ValueError(f"Duplicate zone name '{name}'")
+        names.add(name)
+        try:
+            polygon = np.asarray(zone.get("polygon"), dtype=np.float64)
+        except (TypeError, ValueError):
+            raise ValueError(f"Zone '{name}': polygon must be a list of [x, y] points")
+        if polygon.ndim != 2 or polygon.shape[1] != 2 or len(polygon) < 3:
+            raise ValueError(f"Zone '{name}': polygon needs at least 3 [x, y] points")
+        thresholds = zone.get("thresholds")
+        if thresholds is not None:
+            if (not isinstance(thresholds, (list, tuple)) or len(thresholds) != 3 or
+                    not 0 < thresholds[0] < thresholds[1] < thresholds[2]):
+                raise ValueError(f"Zone '{name}': thresholds must be three increasing positive counts")
+            thresholds = tuple(thresholds)
+        parsed.append((name, np.round(polygon).astype(np.int32), thresholds))
+    return parsed
+
+
+class ZoneMap:
+    def __init__(self, zones, frame_size):
+        """
+        Rasterize zones into a bitmask
+
+        Args:
+            zones: Zone definitions (see the module docstring)
+            frame_size: (width, height) of the frames the boxes come from
+        """
+        parsed = parse_zones(zones)
+        width, height = frame_size
+        self.names = [name for name, _, _ in parsed]
+        self.thresholds = [thresholds for _, _, thresholds in parsed]
+        self.polygons = [polygon for _, polygon, _ in parsed]
+        self.shifts = np.arange(len(parsed), dtype=np.uint32)
+
+        self.mask = np.zeros((height, width), dtype=np.uint32)
+        layer = np.zeros((height, width), dtype=np.uint8)
+        for index, polygon in enumerate(self.polygons):
+            layer[:] = 0
+            cv2.fillPoly(layer, [polygon], 1)
+            self.mask |= layer.astype(np.uint32) << np.uint32(index)
+
+        # Bounding box of every zone, clipped to the frame: the ROI to run inference on
+        points = np.concatenate(self.polygons)
+        self.bounds = [
+            int(max(points[:, 0].min(), 0)), int(max(points[:, 1].min(), 0)),
+            int(min(points[:, 0].max() + 1, width)), int(min(points[:, 1].max() + 1, height)),
+        ]
+
+    def __len__(self):
+        return len(self.names)
+
+    def membership(self, boxes):
+        """(N,) uint32 zone bits for (N, 4) x1, y1, x2, y2 boxes, at each box's bottom-centre anchor"""
+        if not len(boxes):
+            return np.zeros(0, dtype=np.uint32)
+        height, width = self.mask.shape
+        x = np.clip((boxes[:, 0] + boxes[:, 2]) // 2, 0, width - 1).astype(np.intp)
+        y = np.clip(boxes[:, 3] - 1, 0, height - 1).astype(np.intp)
+        return self.mask[y, x]
+
+    def counts(self, zone_bits):
+        """Per-zone counts for an array of zone bits (one entry per vehicle)"""
+        if not len(zone_bits):
+            return [0] * len(self.names)
+        per_zone = (zone_bits[:, None] >> self.shifts) & np.uint32(1)
+        return per_zone.sum(axis=0).tolist()